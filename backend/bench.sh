@@ -0,0 +1,112 @@
+#!/bin/bash -e
+
+# Microbenchmarks of the request path compared with bench-baseline.txt.
+# Fails when any of them allocates more per op than the baseline does; the
+# large parses run few iterations, so counts within 1% are let through.
+#
+#   ./bench.sh          compare the tree with the baseline
+#   ./bench.sh report   compare, but only report regressions (CI)
+#   ./bench.sh update   record the tree as the new baseline
+#
+# Benchmarks run on one cpu (-cpu 1), so names carry no -N suffix and the
+# baseline does not depend on the machine it was recorded on; record it
+# with the default COUNT after a change that moves allocations on purpose.
+# Timings depend on the machine anyway and are only printed, with
+# benchstat when it is installed and as medians otherwise.
+#
+# The contended limiter measures nothing on one cpu, so it runs on its own
+# at -cpu 4 after the comparison, printed and never recorded.
+#
+# COUNT sets the runs per benchmark (default 6).
+
+DIR=$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )
+cd "$DIR"
+
+PACKAGES="./validation ./change ./mail/outbound ./dns ./relay ./rest"
+BENCH='^Benchmark(FieldValidator|RequestDetector|Limiter_Allow|SplitBy|ParseTraffic|Success|ErrorToResponse)'
+CONTENDED='^BenchmarkLimiter_Contended$'
+CONTENDED_CPU=4
+BASELINE=bench-baseline.txt
+CURRENT=$(mktemp)
+trap "rm -f $CURRENT" EXIT
+
+go test $PACKAGES -run '^$' -bench "$BENCH" -benchmem -cpu 1 -count ${COUNT:-6} | tee $CURRENT
+
+if [[ "$1" == "update" ]]; then
+  cp $CURRENT $BASELINE
+  exit 0
+fi
+
+if command -v benchstat > /dev/null; then
+  benchstat $BASELINE $CURRENT
+else
+  awk '
+    function median(values, count,    i, j, swap) {
+      for (i = 2; i <= count; i++) {
+        for (j = i; j > 1 && values[j - 1] > values[j]; j--) {
+          swap = values[j]; values[j] = values[j - 1]; values[j - 1] = swap
+        }
+      }
+      return count % 2 ? values[(count + 1) / 2] : (values[count / 2] + values[count / 2 + 1]) / 2
+    }
+    function sideMedian(side, name,    i, values) {
+      for (i = 1; i <= runs[side, name]; i++) values[i] = times[side, name, i]
+      return median(values, runs[side, name])
+    }
+    /^Benchmark/ {
+      name = $1
+      sub(/-[0-9]+$/, "", name)
+      side = FILENAME == baseline ? "before" : "after"
+      runs[side, name]++
+      times[side, name, runs[side, name]] = $3 + 0
+      names[name] = 1
+    }
+    END {
+      printf "%-50s %14s %14s %8s\n", "ns/op (median)", "baseline", "tree", "delta"
+      for (name in names) {
+        if (!(("before", name) in runs) || !(("after", name) in runs)) continue
+        before = sideMedian("before", name)
+        after = sideMedian("after", name)
+        printf "%-50s %14.0f %14.0f %+7.1f%%\n", name, before, after, (after - before) * 100 / before
+      }
+    }
+  ' baseline=$BASELINE $BASELINE $CURRENT
+fi
+
+go test ./mail/outbound -run '^$' -bench "$CONTENDED" -benchmem -cpu $CONTENDED_CPU -count ${COUNT:-6}
+
+awk '
+  /^Benchmark/ {
+    name = $1
+    sub(/-[0-9]+$/, "", name)
+    for (i = 2; i <= NF; i++) {
+      if ($i == "allocs/op") {
+        allocs = $(i - 1)
+        if (FILENAME == baseline) {
+          if (!(name in before) || allocs < before[name]) before[name] = allocs
+        } else {
+          if (!(name in after) || allocs < after[name]) after[name] = allocs
+        }
+      }
+    }
+  }
+  END {
+    for (name in after) {
+      if (!(name in before)) {
+        printf "%s: %d allocs/op, not in the baseline\n", name, after[name]
+      } else if (after[name] > before[name] * 1.01) {
+        printf "%s: %d allocs/op, baseline %d\n", name, after[name], before[name]
+        regressed = 1
+      }
+    }
+    exit regressed
+  }
+' baseline=$BASELINE $BASELINE $CURRENT || {
+  if [[ "$1" == "report" ]]; then
+    echo "allocation regressions reported, not failing"
+    exit 0
+  fi
+  exit 1
+}
+
+echo "no allocation regressions"
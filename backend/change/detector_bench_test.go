@@ -0,0 +1,25 @@
+package change
+
+import "testing"
+
+// go test ./change -run '^$' -bench . -benchmem
+
+var changedSink bool
+
+func BenchmarkRequestDetector_Changed(b *testing.B) {
+	ip, ipv6, dkim, localIp := "1.1.1.1", "2001:db8::68", "v=DKIM1; k=rsa; p=MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA", "192.168.1.2"
+	newIp := "2.2.2.2"
+	detector := New()
+	b.Run("same", func(b *testing.B) {
+		b.ReportAllocs()
+		for i := 0; i < b.N; i++ {
+			changedSink = detector.Changed(false, &ip, &ipv6, &dkim, &localIp, false, false, &ip, &ipv6, &dkim, &localIp, false)
+		}
+	})
+	b.Run("ip", func(b *testing.B) {
+		b.ReportAllocs()
+		for i := 0; i < b.N; i++ {
+			changedSink = detector.Changed(false, &ip, &ipv6, &dkim, &localIp, false, false, &newIp, &ipv6, &dkim, &localIp, false)
+		}
+	})
+}
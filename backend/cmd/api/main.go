@@ -2,6 +2,9 @@ package main
 
 import (
 	"fmt"
+	"os"
+	"os/signal"
+	"syscall"
 
 	"github.com/spf13/cobra"
 	"github.com/syncloud/redirect/db"
@@ -46,9 +49,12 @@ func main() {
 				mailInbound *inbound.Server,
 				reputation *outbound.Reputation,
 				usageMetrics *outbound.UsageMetrics,
+				tokenCache *db.TokenCache,
+				heartbeats *service.Heartbeats,
+				dnsQueue *dns.ChangeQueue,
 				config *utils.Config,
 			) error {
-				metricsServer := metrics.NewServer(config.GetApiMetricsAddr(), log.Default(), metricsCollector, relayAccountant, reputation, usageMetrics)
+				metricsServer := metrics.NewServer(config.GetApiMetricsAddr(), log.Default(), metricsCollector, relayAccountant, reputation, usageMetrics, tokenCache, dnsQueue)
 				services := []service.Startable{
 					migrator,
 					database,
@@ -61,7 +67,8 @@ func main() {
 					scanner,
 					mailOutbound,
 					mailInbound,
-					api,
+					heartbeats,
+					dnsQueue,
 				}
 				for _, s := range services {
 					err := s.Start()
@@ -69,6 +76,20 @@ func main() {
 						return err
 					}
 				}
+				signals := make(chan os.Signal, 1)
+				signal.Notify(signals, syscall.SIGINT, syscall.SIGTERM)
+				served := make(chan error, 1)
+				go func() { served <- api.Start() }()
+				select {
+				case err := <-served:
+					return err
+				case <-signals:
+				}
+				// no new heartbeats or record updates once the api is down,
+				// so the last flushes write everything that was accepted
+				api.Stop()
+				heartbeats.Stop()
+				dnsQueue.Stop()
 				return nil
 			})
 		},
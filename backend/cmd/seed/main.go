@@ -0,0 +1,45 @@
+package main
+
+import (
+	"fmt"
+	"os"
+
+	"github.com/spf13/cobra"
+	"github.com/syncloud/redirect/db"
+	"github.com/syncloud/redirect/log"
+)
+
+func main() {
+	config := db.DefaultSeedConfig()
+	var dsn string
+
+	root := &cobra.Command{
+		Use:          "seed",
+		Short:        "bulk load synthetic users, domains and relay usage for scaling tests",
+		SilenceUsage: true,
+		RunE: func(_ *cobra.Command, _ []string) error {
+			return db.NewSeeder(dsn, config, log.Default()).Seed()
+		},
+	}
+	flags := root.Flags()
+	flags.StringVar(&dsn, "dsn", "root:root@tcp(mysql:3306)/redirect", "mysql dsn of the database to fill")
+	flags.IntVar(&config.Users, "users", config.Users, "users to add")
+	flags.DurationVar(&config.MaxAge, "max-age", config.MaxAge, "oldest registration")
+	flags.Float64Var(&config.AgeSkew, "age-skew", config.AgeSkew, "1 spreads registrations evenly, higher crowds them into recent months")
+	flags.Float64Var(&config.DomainsPerUser, "domains-per-user", config.DomainsPerUser, "mean domains of users that have domains")
+	flags.Float64Var(&config.NoDomainShare, "no-domain-share", config.NoDomainShare, "users without domains")
+	flags.Float64Var(&config.OnlineShare, "online-share", config.OnlineShare, "domains seen in the last 10 hours")
+	flags.Float64Var(&config.SubscribedShare, "subscribed-share", config.SubscribedShare, "subscribed users")
+	flags.Float64Var(&config.RelayShare, "relay-share", config.RelayShare, "subscribed domains using the relay")
+	flags.Float64Var(&config.MailRelayShare, "mail-relay-share", config.MailRelayShare, "subscribed domains using the mail relay")
+	flags.IntVar(&config.Months, "months", config.Months, "months of relay usage per domain")
+	flags.StringVar(&config.MainDomain, "main-domain", config.MainDomain, "domain the device domains are under")
+	flags.IntVar(&config.Batch, "batch", config.Batch, "rows per insert")
+	flags.IntVar(&config.Workers, "workers", config.Workers, "parallel connections")
+	flags.Int64Var(&config.Seed, "seed", config.Seed, "random seed")
+
+	if err := root.Execute(); err != nil {
+		fmt.Println(err)
+		os.Exit(1)
+	}
+}
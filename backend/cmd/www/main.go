@@ -32,9 +32,10 @@ func main() {
 				database *db.MySql,
 				metricsCollector *metrics.Metrics,
 				dbGauges *metrics.DbGauges,
+				tokenCache *db.TokenCache,
 				config *utils.Config,
 			) error {
-				metricsServer := metrics.NewServer(config.GetWwwMetricsAddr(), log.Default(), metricsCollector, dbGauges)
+				metricsServer := metrics.NewServer(config.GetWwwMetricsAddr(), log.Default(), metricsCollector, dbGauges, tokenCache)
 				services := []service.Startable{
 					database,
 					metricsServer,
@@ -0,0 +1 @@
+alter table domain drop column dns_pending;
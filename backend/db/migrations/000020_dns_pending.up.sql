@@ -0,0 +1 @@
+alter table domain add column dns_pending tinyint(1) not null default 0;
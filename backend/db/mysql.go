@@ -7,26 +7,34 @@ import (
 	"github.com/syncloud/redirect/model"
 	"go.uber.org/zap"
 	"log"
+	"sort"
 	"strings"
 	"time"
 )
 import _ "github.com/go-sql-driver/mysql"
 
+const (
+	relayTrafficBatch = 500
+	domainIdBatch     = 1000
+)
+
 type MySql struct {
 	host     string
 	database string
 	user     string
 	password string
 	db       *sql.DB
+	cache    *TokenCache
 	logger   *zap.Logger
 }
 
-func NewMySql(host string, database string, user string, password string, logger *zap.Logger) *MySql {
+func NewMySql(host string, database string, user string, password string, cache *TokenCache, logger *zap.Logger) *MySql {
 	return &MySql{
 		host:     host,
 		database: database,
 		user:     user,
 		password: password,
+		cache:    cache,
 		logger:   logger,
 	}
 }
@@ -54,6 +62,22 @@ func (m *MySql) GetUser(id int64) (*model.User, error) {
 	return m.selectUserByField("id", id)
 }
 
+// GetCachedUser may answer from the token cache, which misses changes made
+// by other processes until the entry expires. Only use it to accept a
+// heartbeat, never before a write.
+func (m *MySql) GetCachedUser(id int64) (*model.User, error) {
+	if user, found := m.cache.User(id); found {
+		return user, nil
+	}
+	version := m.cache.Version()
+	user, err := m.selectUserByField("id", id)
+	if err != nil || user == nil {
+		return user, err
+	}
+	m.cache.PutUser(id, user, version)
+	return user, nil
+}
+
 func (m *MySql) GetUserByEmail(email string) (*model.User, error) {
 	return m.selectUserByField("email", email)
 }
@@ -182,6 +206,7 @@ func (m *MySql) UpdateUser(user *model.User) error {
 		user.StatusAt,
 		user.Id,
 	)
+	m.cache.RemoveUser(user.Id)
 	if err != nil {
 		log.Println("sql error: ", err)
 		return err
@@ -198,6 +223,7 @@ func (m *MySql) DeleteUser(userId int64) error {
 	}
 	defer stmt.Close()
 	_, err = stmt.Exec(userId)
+	m.cache.RemoveUser(userId)
 	if err != nil {
 		log.Println("Cannot delete user: ", userId, err)
 		return fmt.Errorf("DB error")
@@ -209,6 +235,20 @@ func (m *MySql) GetDomainByToken(token string) (*model.Domain, error) {
 	return m.getDomainByField("update_token", token)
 }
 
+// GetCachedDomainByToken is the heartbeat lookup, see GetCachedUser.
+func (m *MySql) GetCachedDomainByToken(token string) (*model.Domain, error) {
+	if domain, found := m.cache.Domain(token); found {
+		return domain, nil
+	}
+	version := m.cache.Version()
+	domain, err := m.getDomainByField("update_token", token)
+	if err != nil || domain == nil {
+		return domain, err
+	}
+	m.cache.PutDomain(token, domain, version)
+	return domain, nil
+}
+
 func (m *MySql) GetDomainByName(name string) (*model.Domain, error) {
 	return m.getDomainByField("name", name)
 }
@@ -231,32 +271,49 @@ order by last_update limit 1`, before)
 	}
 	return token, nil
 }
+
+const domainColumns = "" +
+	"id, " +
+	"ip, " +
+	"ipv6, " +
+	"dkim_key, " +
+	"local_ip, " +
+	"map_local_address, " +
+	"update_token, " +
+	"user_id, " +
+	"device_mac_address, " +
+	"device_name, " +
+	"device_title, " +
+	"platform_version, " +
+	"web_protocol, " +
+	"web_port, " +
+	"web_local_port, " +
+	"relay, " +
+	"mail_relay, " +
+	"last_update, " +
+	"lower(name), " +
+	"hosted_zone_id "
+
 func (m *MySql) getDomainByField(field string, value string) (*model.Domain, error) {
 	row := m.db.QueryRow(
-		"SELECT "+
-			"id, "+
-			"ip, "+
-			"ipv6, "+
-			"dkim_key, "+
-			"local_ip, "+
-			"map_local_address, "+
-			"update_token, "+
-			"user_id, "+
-			"device_mac_address, "+
-			"device_name, "+
-			"device_title, "+
-			"platform_version, "+
-			"web_protocol, "+
-			"web_port, "+
-			"web_local_port, "+
-			"relay, "+
-			"mail_relay, "+
-			"last_update, "+
-			"lower(name), "+
-			"hosted_zone_id "+
+		"SELECT "+domainColumns+
 			"FROM domain "+
 			"WHERE "+field+" = ?", value)
 
+	domain, err := scanDomain(row)
+	if err != nil {
+		if err == sql.ErrNoRows {
+			return nil, nil
+		} else {
+			log.Println("Cannot scan a domain: ", domain, err)
+			return nil, fmt.Errorf("DB error")
+		}
+	}
+	return domain, nil
+}
+
+// scanDomain reads a row selected with domainColumns.
+func scanDomain(row interface{ Scan(...interface{}) error }) (*model.Domain, error) {
 	var mapLocalAddress *bool
 	domain := &model.Domain{}
 	err := row.Scan(
@@ -282,12 +339,7 @@ func (m *MySql) getDomainByField(field string, value string) (*model.Domain, err
 		&domain.HostedZoneId,
 	)
 	if err != nil {
-		if err == sql.ErrNoRows {
-			return nil, nil
-		} else {
-			log.Println("Cannot scan a domain: ", domain, err)
-			return nil, fmt.Errorf("DB error")
-		}
+		return domain, err
 	}
 	if mapLocalAddress != nil {
 		domain.MapLocalAddress = *mapLocalAddress
@@ -306,6 +358,7 @@ func (m *MySql) DeleteDomain(domainId uint64) error {
 	}
 	defer stmt.Close()
 	_, err = stmt.Exec(domainId)
+	m.cache.RemoveDomain(domainId)
 	if err != nil {
 		log.Println("Cannot delete domain (exec): ", domainId, err)
 		return fmt.Errorf("DB error")
@@ -322,6 +375,7 @@ func (m *MySql) DeleteAllDomains(userId int64) error {
 	}
 	defer stmt.Close()
 	_, err = stmt.Exec(userId)
+	m.cache.RemoveUserDomains(userId)
 	if err != nil {
 		log.Println("Cannot delete domains for user: ", userId, err)
 		return fmt.Errorf("DB error")
@@ -448,6 +502,7 @@ func (m *MySql) UpdateDomain(domain *model.Domain) error {
 		domain.LastUpdate,
 		domain.Id,
 	)
+	m.cache.UpdateDomain(domain)
 	if err != nil {
 		log.Println("sql error: ", err)
 		return err
@@ -455,6 +510,126 @@ func (m *MySql) UpdateDomain(domain *model.Domain) error {
 	return nil
 }
 
+// UpdateDomainHeartbeats writes a batch of heartbeats in one statement.
+// A heartbeat older than the stored last_update is skipped, so a late
+// flush never moves a domain back.
+func (m *MySql) UpdateDomainHeartbeats(heartbeats []model.DomainHeartbeat) error {
+	if len(heartbeats) == 0 {
+		return nil
+	}
+	rows := make([]string, len(heartbeats))
+	args := make([]interface{}, 0, len(heartbeats)*6)
+	for i, heartbeat := range heartbeats {
+		rows[i] = "SELECT ?, ?, ?, ?, ?, ?"
+		args = append(args,
+			heartbeat.DomainId,
+			heartbeat.LastUpdate,
+			heartbeat.PlatformVersion,
+			heartbeat.WebProtocol,
+			heartbeat.WebPort,
+			heartbeat.WebLocalPort,
+		)
+	}
+	rows[0] = "SELECT ? AS id, ? AS last_update, ? AS platform_version, ? AS web_protocol, ? AS web_port, ? AS web_local_port"
+	_, err := m.db.Exec(
+		"UPDATE domain d JOIN ("+strings.Join(rows, " UNION ALL ")+") h ON d.id = h.id SET "+
+			"d.last_update = h.last_update, "+
+			"d.platform_version = h.platform_version, "+
+			"d.web_protocol = h.web_protocol, "+
+			"d.web_port = h.web_port, "+
+			"d.web_local_port = h.web_local_port "+
+			"WHERE d.last_update IS NULL OR d.last_update <= h.last_update",
+		args...)
+	if err != nil {
+		log.Println("sql error: ", err)
+		for _, heartbeat := range heartbeats {
+			m.cache.RemoveDomain(heartbeat.DomainId)
+		}
+		return err
+	}
+	m.cache.Heartbeats(heartbeats)
+	return nil
+}
+
+// MarkDomainDnsPending flags a domain whose records wait in the dns queue.
+func (m *MySql) MarkDomainDnsPending(domainId uint64) error {
+	_, err := m.db.Exec("UPDATE domain SET dns_pending = 1 WHERE id = ?", domainId)
+	if err != nil {
+		log.Println("sql error: ", err)
+		return err
+	}
+	return nil
+}
+
+func (m *MySql) ClearDomainsDnsPending(domainIds []uint64) error {
+	for start := 0; start < len(domainIds); start += domainIdBatch {
+		ids := domainIds[start:min(start+domainIdBatch, len(domainIds))]
+		_, err := m.db.Exec("UPDATE domain SET dns_pending = 0 WHERE id IN ("+placeholders(len(ids))+")", idArgs(ids)...)
+		if err != nil {
+			log.Println("sql error: ", err)
+			return err
+		}
+	}
+	return nil
+}
+
+func (m *MySql) GetDnsPendingDomains() ([]*model.Domain, error) {
+	rows, err := m.db.Query("SELECT " + domainColumns + "FROM domain WHERE dns_pending = 1")
+	if err != nil {
+		log.Println("sql error: ", err)
+		return nil, err
+	}
+	defer rows.Close()
+	var domains []*model.Domain
+	for rows.Next() {
+		domain, err := scanDomain(rows)
+		if err != nil {
+			log.Println("Cannot scan a domain: ", domain, err)
+			return nil, err
+		}
+		domains = append(domains, domain)
+	}
+	return domains, rows.Err()
+}
+
+func (m *MySql) GetExistingDomainIds(domainIds []uint64) (map[uint64]bool, error) {
+	existing := map[uint64]bool{}
+	for start := 0; start < len(domainIds); start += domainIdBatch {
+		ids := domainIds[start:min(start+domainIdBatch, len(domainIds))]
+		rows, err := m.db.Query("SELECT id FROM domain WHERE id IN ("+placeholders(len(ids))+")", idArgs(ids)...)
+		if err != nil {
+			log.Println("sql error: ", err)
+			return nil, err
+		}
+		for rows.Next() {
+			var id uint64
+			err = rows.Scan(&id)
+			if err != nil {
+				rows.Close()
+				return nil, err
+			}
+			existing[id] = true
+		}
+		rows.Close()
+		if err = rows.Err(); err != nil {
+			return nil, err
+		}
+	}
+	return existing, nil
+}
+
+func placeholders(count int) string {
+	return strings.TrimSuffix(strings.Repeat("?, ", count), ", ")
+}
+
+func idArgs(ids []uint64) []interface{} {
+	args := make([]interface{}, len(ids))
+	for i, id := range ids {
+		args[i] = id
+	}
+	return args
+}
+
 func (m *MySql) InsertDomain(domain *model.Domain) error {
 	stmt, err := m.db.Prepare(
 		"INSERT into domain (" +
@@ -665,16 +840,41 @@ func (m *MySql) GetDomainCount() (int64, error) {
 	return m.GetCount(`select count(*) from domain`)
 }
 
-func (m *MySql) AddRelayTraffic(name string, yearMonth string, bytes int64) error {
-	stmt, err := m.db.Prepare(
-		"INSERT INTO relay_traffic (name, `year_month`, bytes) VALUES (?, ?, ?) " +
-			"ON DUPLICATE KEY UPDATE bytes = bytes + VALUES(bytes)")
+// AddRelayTraffic adds the bytes of every proxy in deltas to its month
+// total with a few multi-row upserts in one transaction, in name order so
+// concurrent writers lock rows in the same order.
+func (m *MySql) AddRelayTraffic(yearMonth string, deltas map[string]int64) error {
+	if len(deltas) == 0 {
+		return nil
+	}
+	names := make([]string, 0, len(deltas))
+	for name := range deltas {
+		names = append(names, name)
+	}
+	sort.Strings(names)
+
+	tx, err := m.db.Begin()
 	if err != nil {
 		return err
 	}
-	defer stmt.Close()
-	_, err = stmt.Exec(name, yearMonth, bytes)
-	return err
+	defer tx.Rollback()
+	for start := 0; start < len(names); start += relayTrafficBatch {
+		batch := names[start:min(start+relayTrafficBatch, len(names))]
+		rows := make([]string, len(batch))
+		args := make([]interface{}, 0, len(batch)*3)
+		for i, name := range batch {
+			rows[i] = "(?, ?, ?)"
+			args = append(args, name, yearMonth, deltas[name])
+		}
+		_, err = tx.Exec(
+			"INSERT INTO relay_traffic (name, `year_month`, bytes) VALUES "+strings.Join(rows, ", ")+" "+
+				"ON DUPLICATE KEY UPDATE bytes = bytes + VALUES(bytes)",
+			args...)
+		if err != nil {
+			return err
+		}
+	}
+	return tx.Commit()
 }
 
 func (m *MySql) AddMailRelayMessages(name string, yearMonth string, messages int64) error {
@@ -0,0 +1,395 @@
+package db
+
+import (
+	"context"
+	"database/sql"
+	"fmt"
+	"math"
+	"math/rand"
+	"strings"
+	"sync"
+	"time"
+
+	"github.com/google/uuid"
+	"github.com/syncloud/redirect/model"
+	"go.uber.org/zap"
+)
+
+// SeedConfig shapes a synthetic data set of production size, for looking at
+// query plans and cleaner throughput with realistic table sizes.
+type SeedConfig struct {
+	Users int
+	// MaxAge is how far back accounts were registered. Ages are
+	// MaxAge * u^AgeSkew for a uniform u, so 1 spreads them evenly and
+	// larger values crowd them into recent months.
+	MaxAge  time.Duration
+	AgeSkew float64
+	// DomainsPerUser is the mean for users that have domains at all,
+	// NoDomainShare the users that have none.
+	DomainsPerUser float64
+	NoDomainShare  float64
+	// OnlineShare of domains sent a heartbeat in the last 10 hours, the
+	// rest were last seen at some point since their user registered.
+	OnlineShare     float64
+	SubscribedShare float64
+	// RelayShare and MailRelayShare of subscribed users' domains use the
+	// relays; they get Months of relay_traffic and mail_relay_usage rows.
+	RelayShare     float64
+	MailRelayShare float64
+	Months         int
+	MainDomain     string
+	// Batch is the rows per multi-row insert, Workers the connections
+	// inserting in parallel.
+	Batch   int
+	Workers int
+	Seed    int64
+}
+
+func DefaultSeedConfig() SeedConfig {
+	return SeedConfig{
+		Users:           100000,
+		MaxAge:          5 * 365 * 24 * time.Hour,
+		AgeSkew:         2,
+		DomainsPerUser:  1.3,
+		NoDomainShare:   0.3,
+		OnlineShare:     0.4,
+		SubscribedShare: 0.3,
+		RelayShare:      0.2,
+		MailRelayShare:  0.1,
+		Months:          6,
+		MainDomain:      "syncloud.it",
+		Batch:           1000,
+		Workers:         4,
+		Seed:            1,
+	}
+}
+
+type seedTable struct {
+	name    string
+	columns []string
+}
+
+var (
+	seedUser = seedTable{"user", []string{"id", "email", "password_hash", "active", "update_token",
+		"notification_enabled", "timestamp", "subscription_id", "subscription_type", "plan",
+		"registered_at", "status", "status_at"}}
+	seedDomain = seedTable{"domain", []string{"name", "update_token", "user_id", "ip", "ipv6", "dkim_key",
+		"local_ip", "map_local_address", "device_mac_address", "device_name", "device_title",
+		"platform_version", "web_protocol", "web_port", "web_local_port", "last_update", "hosted_zone_id",
+		"relay", "mail_relay"}}
+	seedAction           = seedTable{"action", []string{"action_type_id", "user_id", "token", "timestamp"}}
+	seedRelayTraffic     = seedTable{"relay_traffic", []string{"name", "year_month", "bytes"}}
+	seedMailRelayUsage   = seedTable{"mail_relay_usage", []string{"name", "year_month", "messages", "bounces"}}
+	seedMailRelayBlocked = seedTable{"mail_relay_blocked", []string{"name", "reason", "timestamp"}}
+	seedTables           = []seedTable{seedUser, seedDomain, seedAction, seedRelayTraffic, seedMailRelayUsage, seedMailRelayBlocked}
+)
+
+var seedDevices = []string{"odroid-xu4", "odroid-hc2", "raspberrypi4", "raspberrypi5", "amd64", "helios64", "rock5"}
+var seedPlatforms = []string{"22.01", "23.05", "24.05", "24.09", "25.02", "25.02", "25.09", "25.09", "25.09"}
+
+// seedGenerator makes the rows of one user at a time.
+type seedGenerator struct {
+	config SeedConfig
+	random *rand.Rand
+	now    time.Time
+	months []string
+	dkim   []string
+}
+
+func newSeedGenerator(config SeedConfig, now time.Time) *seedGenerator {
+	g := &seedGenerator{config: config, random: rand.New(rand.NewSource(config.Seed)), now: now}
+	for i := 0; i < config.Months; i++ {
+		g.months = append(g.months, now.UTC().AddDate(0, -i, 0).Format("2006-01"))
+	}
+	for i := 0; i < 64; i++ {
+		g.dkim = append(g.dkim, "v=DKIM1; k=rsa; p="+g.text(200))
+	}
+	return g
+}
+
+func (g *seedGenerator) text(length int) string {
+	const alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+	b := make([]byte, length)
+	for i := range b {
+		b[i] = alphabet[g.random.Intn(len(alphabet))]
+	}
+	return string(b)
+}
+
+func (g *seedGenerator) token() string {
+	token, _ := uuid.NewRandomFromReader(g.random)
+	return token.String()
+}
+
+func (g *seedGenerator) chance(share float64) bool {
+	return g.random.Float64() < share
+}
+
+func (g *seedGenerator) within(duration time.Duration) time.Duration {
+	if duration <= 0 {
+		return 0
+	}
+	return time.Duration(g.random.Int63n(int64(duration)))
+}
+
+// logNormal is e^N(mu, sigma), the long tail of real traffic.
+func (g *seedGenerator) logNormal(mu float64, sigma float64) int64 {
+	return int64(math.Exp(mu + sigma*g.random.NormFloat64()))
+}
+
+// user emits the rows of user id. Users that are not subscribed follow the
+// trial timeline the user cleaner drives: created, trial email a day later,
+// lock email after 20 more days, locked (and without domains) 10 days
+// after that.
+func (g *seedGenerator) user(id int64, emit func(table seedTable, row []interface{})) {
+	day := 24 * time.Hour
+	age := time.Duration(float64(g.config.MaxAge) * math.Pow(g.random.Float64(), g.config.AgeSkew))
+	registered := g.now.Add(-age)
+	updated := registered.Add(g.within(age))
+	active := g.chance(0.9)
+
+	var subscriptionId, plan *string
+	var subscriptionType *int
+	status, statusAt := model.StatusCreated, registered
+	subscribed := g.chance(g.config.SubscribedShare)
+	switch {
+	case subscribed:
+		types := []int{model.SubscriptionTypePayPal, model.SubscriptionTypeStripe, model.SubscriptionTypeStripe, model.SubscriptionTypeCrypto}
+		kind := types[g.random.Intn(len(types))]
+		subscription := fmt.Sprintf("seed-%d", id)
+		chosen := model.PlanPro
+		if g.chance(0.2) {
+			chosen = model.PlanMax
+		}
+		subscriptionId, subscriptionType, plan = &subscription, &kind, &chosen
+		status, statusAt = model.StatusSubscribed, registered.Add(g.within(age))
+	case age > 41*day:
+		status, statusAt = model.StatusLocked, registered.Add(31*day)
+	case age > 31*day:
+		status, statusAt = model.StatusLockEmailSent, registered.Add(21*day)
+	case age > day:
+		status, statusAt = model.StatusTrialEmailSent, registered.Add(day)
+	}
+
+	emit(seedUser, []interface{}{id, fmt.Sprintf("user%d@seed.example.com", id), strings.Repeat("0", 64),
+		active, g.token(), g.chance(0.8), updated, subscriptionId, subscriptionType, plan, registered, status, statusAt})
+
+	if !active {
+		emit(seedAction, []interface{}{1, id, g.token(), registered})
+	}
+	if g.chance(0.03) {
+		emit(seedAction, []interface{}{2, id, g.token(), registered.Add(g.within(age))})
+	}
+
+	if status == model.StatusLocked || g.chance(g.config.NoDomainShare) {
+		return
+	}
+	domains := 1
+	for domains < 50 && g.chance(1-1/math.Max(g.config.DomainsPerUser, 1)) {
+		domains++
+	}
+	for i := 0; i < domains; i++ {
+		g.domain(id, i, age, subscribed, emit)
+	}
+}
+
+func (g *seedGenerator) domain(userId int64, index int, age time.Duration, subscribed bool, emit func(table seedTable, row []interface{})) {
+	device := seedDevices[g.random.Intn(len(seedDevices))]
+	name := fmt.Sprintf("%s%d-%d.%s", strings.ReplaceAll(device, "-", ""), userId, index, g.config.MainDomain)
+
+	var lastUpdate *time.Time
+	switch {
+	case g.chance(g.config.OnlineShare):
+		seen := g.now.Add(-g.within(10 * time.Hour))
+		lastUpdate = &seen
+	case g.chance(0.95):
+		seen := g.now.Add(-g.within(age))
+		lastUpdate = &seen
+	}
+	ip := fmt.Sprintf("%d.%d.%d.%d", 1+g.random.Intn(223), g.random.Intn(256), g.random.Intn(256), 1+g.random.Intn(254))
+	var ipv6, dkim *string
+	if g.chance(0.3) {
+		address := fmt.Sprintf("2001:db8:%x:%x::%x", g.random.Intn(1<<16), g.random.Intn(1<<16), 1+g.random.Intn(1<<16))
+		ipv6 = &address
+	}
+	if g.chance(0.6) {
+		dkim = &g.dkim[g.random.Intn(len(g.dkim))]
+	}
+	localIp := fmt.Sprintf("192.168.%d.%d", g.random.Intn(256), 1+g.random.Intn(254))
+	mac := fmt.Sprintf("%02x:%02x:%02x:%02x:%02x:%02x", g.random.Intn(256), g.random.Intn(256),
+		g.random.Intn(256), g.random.Intn(256), g.random.Intn(256), g.random.Intn(256))
+	relay := subscribed && g.chance(g.config.RelayShare)
+	mailRelay := subscribed && g.chance(g.config.MailRelayShare)
+
+	emit(seedDomain, []interface{}{name, g.token(), userId, ip, ipv6, dkim, localIp, g.chance(0.05), mac,
+		"syncloud-" + device, strings.ToUpper(device[:1]) + device[1:],
+		seedPlatforms[g.random.Intn(len(seedPlatforms))], "https", 443, 443, lastUpdate, "SEED", relay, mailRelay})
+
+	if relay {
+		for _, month := range g.months {
+			emit(seedRelayTraffic, []interface{}{name, month, g.logNormal(21, 2)})
+		}
+	}
+	if mailRelay {
+		for _, month := range g.months {
+			messages := g.logNormal(4, 1.5)
+			emit(seedMailRelayUsage, []interface{}{name, month, messages, messages * int64(g.random.Intn(5)) / 100})
+		}
+		if g.chance(0.01) {
+			emit(seedMailRelayBlocked, []interface{}{name, "seeded", g.now.Add(-g.within(age))})
+		}
+	}
+}
+
+type seedBatch struct {
+	table seedTable
+	rows  [][]interface{}
+}
+
+// Seeder bulk loads SeedConfig worth of rows with multi-row inserts over
+// several connections. It appends after the highest user id, so it can run
+// on top of an existing database.
+type Seeder struct {
+	dsn    string
+	config SeedConfig
+	logger *zap.Logger
+}
+
+func NewSeeder(dsn string, config SeedConfig, logger *zap.Logger) *Seeder {
+	return &Seeder{dsn: dsn, config: config, logger: logger}
+}
+
+func (s *Seeder) Seed() error {
+	db, err := sql.Open("mysql", s.dsn)
+	if err != nil {
+		return fmt.Errorf("cannot connect to db: %v", err)
+	}
+	defer db.Close()
+
+	var first int64
+	if err := db.QueryRow("SELECT COALESCE(MAX(id), 0) + 1 FROM user").Scan(&first); err != nil {
+		return err
+	}
+	config := s.config
+	config.Seed += first
+	generator := newSeedGenerator(config, time.Now())
+
+	// the first failure cancels ctx, which stops the other workers and the
+	// generator, so nothing waits on a channel nobody reads any more
+	ctx, cancel := context.WithCancel(context.Background())
+	defer cancel()
+	var failure error
+	var failOnce sync.Once
+	fail := func(err error) {
+		failOnce.Do(func() {
+			failure = err
+			cancel()
+		})
+	}
+
+	batches := make(chan seedBatch, config.Workers)
+	inserted := map[string]int64{}
+	var mutex sync.Mutex
+	var wg sync.WaitGroup
+	for i := 0; i < config.Workers; i++ {
+		wg.Add(1)
+		go func() {
+			defer wg.Done()
+			err := s.insert(ctx, db, batches, func(batch seedBatch) {
+				mutex.Lock()
+				inserted[batch.table.name] += int64(len(batch.rows))
+				mutex.Unlock()
+			})
+			if err != nil {
+				fail(err)
+			}
+		}()
+	}
+
+	start := time.Now()
+	send := func(batch seedBatch) {
+		select {
+		case batches <- batch:
+		case <-ctx.Done():
+		}
+	}
+	pending := map[string]*seedBatch{}
+	emit := func(table seedTable, row []interface{}) {
+		batch, found := pending[table.name]
+		if !found {
+			batch = &seedBatch{table: table}
+			pending[table.name] = batch
+		}
+		batch.rows = append(batch.rows, row)
+		if len(batch.rows) >= config.Batch {
+			send(*batch)
+			pending[table.name] = &seedBatch{table: table}
+		}
+	}
+	for id := first; id < first+int64(config.Users) && ctx.Err() == nil; id++ {
+		generator.user(id, emit)
+		if (id-first+1)%100000 == 0 {
+			s.logger.Info("seeding", zap.Int64("users", id-first+1), zap.Duration("elapsed", time.Since(start)))
+		}
+	}
+	for _, batch := range pending {
+		if len(batch.rows) > 0 {
+			send(*batch)
+		}
+	}
+	close(batches)
+	wg.Wait()
+	if failure != nil {
+		return failure
+	}
+	for _, table := range seedTables {
+		s.logger.Info("seeded", zap.String("table", table.name), zap.Int64("rows", inserted[table.name]))
+	}
+	s.logger.Info("seeding done", zap.Int64("first user", first), zap.Duration("elapsed", time.Since(start)))
+	return nil
+}
+
+// insert runs batches on one connection with key checks off, which the
+// seeded rows do not need and which make up most of a bulk load.
+func (s *Seeder) insert(ctx context.Context, db *sql.DB, batches <-chan seedBatch, done func(batch seedBatch)) error {
+	connection, err := db.Conn(ctx)
+	if err != nil {
+		return err
+	}
+	defer connection.Close()
+	if _, err := connection.ExecContext(ctx, "SET foreign_key_checks = 0, unique_checks = 0"); err != nil {
+		return err
+	}
+	for {
+		select {
+		case <-ctx.Done():
+			return nil
+		case batch, ok := <-batches:
+			if !ok {
+				return nil
+			}
+			query, args := insertQuery(batch)
+			if _, err := connection.ExecContext(ctx, query, args...); err != nil {
+				return fmt.Errorf("cannot insert into %s: %v", batch.table.name, err)
+			}
+			done(batch)
+		}
+	}
+}
+
+func insertQuery(batch seedBatch) (string, []interface{}) {
+	values := "(" + strings.TrimSuffix(strings.Repeat("?,", len(batch.table.columns)), ",") + ")"
+	var query strings.Builder
+	query.WriteString("INSERT INTO `" + batch.table.name + "` (`")
+	query.WriteString(strings.Join(batch.table.columns, "`, `"))
+	query.WriteString("`) VALUES ")
+	args := make([]interface{}, 0, len(batch.rows)*len(batch.table.columns))
+	for i, row := range batch.rows {
+		if i > 0 {
+			query.WriteString(",")
+		}
+		query.WriteString(values)
+		args = append(args, row...)
+	}
+	return query.String(), args
+}
@@ -0,0 +1,86 @@
+package db
+
+import (
+	"testing"
+	"time"
+
+	"github.com/stretchr/testify/assert"
+)
+
+func seedRows(t *testing.T, config SeedConfig) map[string][][]interface{} {
+	generator := newSeedGenerator(config, time.Date(2025, 6, 15, 0, 0, 0, 0, time.UTC))
+	rows := map[string][][]interface{}{}
+	for id := int64(1); id <= int64(config.Users); id++ {
+		generator.user(id, func(table seedTable, row []interface{}) {
+			assert.Len(t, row, len(table.columns))
+			rows[table.name] = append(rows[table.name], row)
+		})
+	}
+	return rows
+}
+
+func TestSeed_Sizes(t *testing.T) {
+	config := DefaultSeedConfig()
+	config.Users = 10000
+	rows := seedRows(t, config)
+
+	assert.Len(t, rows["user"], 10000)
+	domains := float64(len(rows["domain"]))
+	assert.Greater(t, domains, 3000.0)
+	assert.Less(t, domains, 12000.0)
+	assert.NotEmpty(t, rows["action"])
+	assert.NotEmpty(t, rows["relay_traffic"])
+	assert.NotEmpty(t, rows["mail_relay_usage"])
+	assert.Zero(t, len(rows["relay_traffic"])%config.Months)
+}
+
+func TestSeed_UniqueKeys(t *testing.T) {
+	config := DefaultSeedConfig()
+	config.Users = 5000
+	rows := seedRows(t, config)
+
+	names := map[interface{}]bool{}
+	tokens := map[interface{}]bool{}
+	for _, domain := range rows["domain"] {
+		assert.False(t, names[domain[0]], domain[0])
+		assert.False(t, tokens[domain[1]], domain[1])
+		names[domain[0]] = true
+		tokens[domain[1]] = true
+	}
+	for _, user := range rows["user"] {
+		assert.False(t, tokens[user[4]], user[4])
+		tokens[user[4]] = true
+	}
+}
+
+func TestSeed_AgeSkew(t *testing.T) {
+	now := time.Date(2025, 6, 15, 0, 0, 0, 0, time.UTC)
+	recent := func(skew float64) int {
+		config := DefaultSeedConfig()
+		config.Users = 2000
+		config.AgeSkew = skew
+		count := 0
+		for _, user := range seedRows(t, config)["user"] {
+			if now.Sub(user[10].(time.Time)) < config.MaxAge/4 {
+				count++
+			}
+		}
+		return count
+	}
+	assert.Greater(t, recent(3), recent(1))
+}
+
+func TestSeed_Deterministic(t *testing.T) {
+	config := DefaultSeedConfig()
+	config.Users = 100
+	assert.Equal(t, seedRows(t, config), seedRows(t, config))
+}
+
+func TestInsertQuery(t *testing.T) {
+	query, args := insertQuery(seedBatch{table: seedRelayTraffic, rows: [][]interface{}{
+		{"a.syncloud.it", "2025-06", int64(1)},
+		{"b.syncloud.it", "2025-06", int64(2)},
+	}})
+	assert.Equal(t, "INSERT INTO `relay_traffic` (`name`, `year_month`, `bytes`) VALUES (?,?,?),(?,?,?)", query)
+	assert.Equal(t, 6, len(args))
+}
@@ -0,0 +1,282 @@
+package db
+
+import (
+	"container/list"
+	"strconv"
+	"sync"
+	"time"
+
+	"github.com/prometheus/client_golang/prometheus"
+	"github.com/syncloud/redirect/model"
+)
+
+const (
+	cacheDomainByToken = "domain_by_token"
+	cacheUserById      = "user_by_id"
+)
+
+type cacheKey struct {
+	kind string
+	key  string
+}
+
+type cacheEntry struct {
+	key     cacheKey
+	value   interface{} // *model.Domain or *model.User
+	expires time.Time
+}
+
+// TokenCache holds what a heartbeat looks up on every call: the domain by
+// update token and its user by id. Entries live for ttl and the least
+// recently used go once there are more than size. Only rows that exist are
+// cached, so an unknown token always goes to the database. MySql drops the
+// entries its own writes touch and patches cached domains with flushed
+// heartbeats; writes from another process show up when the entry expires,
+// which is why only heartbeats read through it.
+type TokenCache struct {
+	mutex   sync.Mutex
+	size    int
+	ttl     time.Duration
+	now     func() time.Time
+	version uint64
+	lru     *list.List
+	entries map[cacheKey]*list.Element
+	// what to drop when a domain or user changes
+	domainTokens map[uint64]string
+	userDomains  map[int64]map[string]bool
+	lookups      *prometheus.CounterVec
+	evictions    *prometheus.CounterVec
+	entriesDesc  *prometheus.Desc
+}
+
+func NewTokenCache(size int, ttl time.Duration) *TokenCache {
+	return &TokenCache{
+		size:         size,
+		ttl:          ttl,
+		now:          time.Now,
+		lru:          list.New(),
+		entries:      map[cacheKey]*list.Element{},
+		domainTokens: map[uint64]string{},
+		userDomains:  map[int64]map[string]bool{},
+		lookups: prometheus.NewCounterVec(
+			prometheus.CounterOpts{
+				Name: "redirect_token_cache_lookups_total",
+				Help: "Token cache lookups, by cache and result (hit|miss).",
+			},
+			[]string{"cache", "result"},
+		),
+		evictions: prometheus.NewCounterVec(
+			prometheus.CounterOpts{
+				Name: "redirect_token_cache_evictions_total",
+				Help: "Token cache entries dropped, by cache and reason (expired|size|write).",
+			},
+			[]string{"cache", "reason"},
+		),
+		entriesDesc: prometheus.NewDesc("redirect_token_cache_entries", "Entries in the token cache.", nil, nil),
+	}
+}
+
+func (c *TokenCache) enabled() bool {
+	return c.size > 0 && c.ttl > 0
+}
+
+// Version changes with every write. Read it before going to the database
+// and pass it to the Put call, so a row read before a concurrent write is
+// not cached after it.
+func (c *TokenCache) Version() uint64 {
+	c.mutex.Lock()
+	defer c.mutex.Unlock()
+	return c.version
+}
+
+func (c *TokenCache) Domain(token string) (*model.Domain, bool) {
+	value, found := c.get(cacheKey{cacheDomainByToken, token})
+	if !found {
+		return nil, false
+	}
+	domain := *value.(*model.Domain)
+	return &domain, true
+}
+
+func (c *TokenCache) PutDomain(token string, domain *model.Domain, version uint64) {
+	copied := *domain
+	c.put(cacheKey{cacheDomainByToken, token}, &copied, version)
+}
+
+func (c *TokenCache) User(id int64) (*model.User, bool) {
+	value, found := c.get(cacheKey{cacheUserById, strconv.FormatInt(id, 10)})
+	if !found {
+		return nil, false
+	}
+	user := *value.(*model.User)
+	return &user, true
+}
+
+func (c *TokenCache) PutUser(id int64, user *model.User, version uint64) {
+	copied := *user
+	c.put(cacheKey{cacheUserById, strconv.FormatInt(id, 10)}, &copied, version)
+}
+
+// UpdateDomain drops the domain under the token it was cached with, which
+// the write may have replaced.
+func (c *TokenCache) UpdateDomain(domain *model.Domain) {
+	c.mutex.Lock()
+	defer c.mutex.Unlock()
+	c.version++
+	if token, found := c.domainTokens[domain.Id]; found {
+		c.drop(cacheKey{cacheDomainByToken, token})
+	}
+}
+
+// Heartbeats patches cached domains with a flushed batch of heartbeats,
+// skipping any that are older than what is cached.
+func (c *TokenCache) Heartbeats(heartbeats []model.DomainHeartbeat) {
+	c.mutex.Lock()
+	defer c.mutex.Unlock()
+	c.version++
+	for _, heartbeat := range heartbeats {
+		token, cached := c.domainTokens[heartbeat.DomainId]
+		if !cached {
+			continue
+		}
+		domain := c.entries[cacheKey{cacheDomainByToken, token}].Value.(*cacheEntry).value.(*model.Domain)
+		if domain.LastUpdate != nil && domain.LastUpdate.After(heartbeat.LastUpdate) {
+			continue
+		}
+		lastUpdate := heartbeat.LastUpdate
+		domain.LastUpdate = &lastUpdate
+		domain.PlatformVersion = heartbeat.PlatformVersion
+		domain.WebProtocol = heartbeat.WebProtocol
+		domain.WebPort = heartbeat.WebPort
+		domain.WebLocalPort = heartbeat.WebLocalPort
+	}
+}
+
+func (c *TokenCache) RemoveDomain(id uint64) {
+	c.mutex.Lock()
+	defer c.mutex.Unlock()
+	c.version++
+	if token, found := c.domainTokens[id]; found {
+		c.drop(cacheKey{cacheDomainByToken, token})
+	}
+}
+
+func (c *TokenCache) RemoveUserDomains(userId int64) {
+	c.mutex.Lock()
+	defer c.mutex.Unlock()
+	c.version++
+	for token := range c.userDomains[userId] {
+		c.drop(cacheKey{cacheDomainByToken, token})
+	}
+}
+
+func (c *TokenCache) RemoveUser(id int64) {
+	c.mutex.Lock()
+	defer c.mutex.Unlock()
+	c.version++
+	c.drop(cacheKey{cacheUserById, strconv.FormatInt(id, 10)})
+}
+
+func (c *TokenCache) get(key cacheKey) (interface{}, bool) {
+	if !c.enabled() {
+		return nil, false
+	}
+	c.mutex.Lock()
+	defer c.mutex.Unlock()
+	element, found := c.entries[key]
+	if found && c.now().After(element.Value.(*cacheEntry).expires) {
+		c.remove(element, "expired")
+		found = false
+	}
+	if !found {
+		c.lookups.WithLabelValues(key.kind, "miss").Inc()
+		return nil, false
+	}
+	c.lookups.WithLabelValues(key.kind, "hit").Inc()
+	c.lru.MoveToFront(element)
+	return element.Value.(*cacheEntry).value, true
+}
+
+func (c *TokenCache) put(key cacheKey, value interface{}, version uint64) {
+	if !c.enabled() {
+		return
+	}
+	c.mutex.Lock()
+	defer c.mutex.Unlock()
+	if version != c.version {
+		return
+	}
+	if element, found := c.entries[key]; found {
+		entry := element.Value.(*cacheEntry)
+		c.unindex(entry)
+		entry.value, entry.expires = value, c.now().Add(c.ttl)
+		c.index(entry)
+		c.lru.MoveToFront(element)
+		return
+	}
+	entry := &cacheEntry{key: key, value: value, expires: c.now().Add(c.ttl)}
+	c.entries[key] = c.lru.PushFront(entry)
+	c.index(entry)
+	for c.lru.Len() > c.size {
+		c.remove(c.lru.Back(), "size")
+	}
+}
+
+func (c *TokenCache) drop(key cacheKey) {
+	if element, found := c.entries[key]; found {
+		c.remove(element, "write")
+	}
+}
+
+func (c *TokenCache) remove(element *list.Element, reason string) {
+	entry := element.Value.(*cacheEntry)
+	c.lru.Remove(element)
+	delete(c.entries, entry.key)
+	c.unindex(entry)
+	c.evictions.WithLabelValues(entry.key.kind, reason).Inc()
+}
+
+func (c *TokenCache) index(entry *cacheEntry) {
+	domain, ok := entry.value.(*model.Domain)
+	if !ok {
+		return
+	}
+	c.domainTokens[domain.Id] = entry.key.key
+	tokens, found := c.userDomains[domain.UserId]
+	if !found {
+		tokens = map[string]bool{}
+		c.userDomains[domain.UserId] = tokens
+	}
+	tokens[entry.key.key] = true
+}
+
+func (c *TokenCache) unindex(entry *cacheEntry) {
+	domain, ok := entry.value.(*model.Domain)
+	if !ok {
+		return
+	}
+	if c.domainTokens[domain.Id] == entry.key.key {
+		delete(c.domainTokens, domain.Id)
+	}
+	if tokens, found := c.userDomains[domain.UserId]; found {
+		delete(tokens, entry.key.key)
+		if len(tokens) == 0 {
+			delete(c.userDomains, domain.UserId)
+		}
+	}
+}
+
+func (c *TokenCache) Describe(ch chan<- *prometheus.Desc) {
+	c.lookups.Describe(ch)
+	c.evictions.Describe(ch)
+	ch <- c.entriesDesc
+}
+
+func (c *TokenCache) Collect(ch chan<- prometheus.Metric) {
+	c.lookups.Collect(ch)
+	c.evictions.Collect(ch)
+	c.mutex.Lock()
+	entries := c.lru.Len()
+	c.mutex.Unlock()
+	ch <- prometheus.MustNewConstMetric(c.entriesDesc, prometheus.GaugeValue, float64(entries))
+}
@@ -0,0 +1,148 @@
+package db
+
+import (
+	"testing"
+	"time"
+
+	"github.com/prometheus/client_golang/prometheus/testutil"
+	"github.com/stretchr/testify/assert"
+	"github.com/syncloud/redirect/model"
+)
+
+func cacheAt(size int, now *time.Time) *TokenCache {
+	cache := NewTokenCache(size, time.Minute)
+	cache.now = func() time.Time { return *now }
+	return cache
+}
+
+func cachedDomain(id uint64, userId int64, token string) *model.Domain {
+	return &model.Domain{Id: id, UserId: userId, UpdateToken: &token, Name: "device.syncloud.it", HostedZoneId: "zone"}
+}
+
+func TestTokenCache_HitAndMiss(t *testing.T) {
+	now := time.Unix(0, 0)
+	cache := cacheAt(10, &now)
+	_, found := cache.Domain("token")
+	assert.False(t, found)
+
+	cache.PutDomain("token", cachedDomain(1, 7, "token"), cache.Version())
+	domain, found := cache.Domain("token")
+	assert.True(t, found)
+	assert.Equal(t, uint64(1), domain.Id)
+	assert.Equal(t, 1.0, testutil.ToFloat64(cache.lookups.WithLabelValues(cacheDomainByToken, "hit")))
+	assert.Equal(t, 1.0, testutil.ToFloat64(cache.lookups.WithLabelValues(cacheDomainByToken, "miss")))
+}
+
+func TestTokenCache_ReturnsCopies(t *testing.T) {
+	now := time.Unix(0, 0)
+	cache := cacheAt(10, &now)
+	cache.PutDomain("token", cachedDomain(1, 7, "token"), cache.Version())
+	domain, _ := cache.Domain("token")
+	domain.Name = "changed.syncloud.it"
+	domain, _ = cache.Domain("token")
+	assert.Equal(t, "device.syncloud.it", domain.Name)
+}
+
+func TestTokenCache_Expires(t *testing.T) {
+	now := time.Unix(0, 0)
+	cache := cacheAt(10, &now)
+	cache.PutUser(7, &model.User{Id: 7}, cache.Version())
+	now = now.Add(time.Minute + time.Second)
+	_, found := cache.User(7)
+	assert.False(t, found)
+	assert.Equal(t, 1.0, testutil.ToFloat64(cache.evictions.WithLabelValues(cacheUserById, "expired")))
+}
+
+func TestTokenCache_EvictsLeastRecentlyUsed(t *testing.T) {
+	now := time.Unix(0, 0)
+	cache := cacheAt(2, &now)
+	cache.PutUser(1, &model.User{Id: 1}, cache.Version())
+	cache.PutUser(2, &model.User{Id: 2}, cache.Version())
+	cache.User(1)
+	cache.PutUser(3, &model.User{Id: 3}, cache.Version())
+
+	_, found := cache.User(2)
+	assert.False(t, found)
+	_, found = cache.User(1)
+	assert.True(t, found)
+	assert.Equal(t, 1.0, testutil.ToFloat64(cache.evictions.WithLabelValues(cacheUserById, "size")))
+}
+
+func TestTokenCache_UpdateDomain_Drops(t *testing.T) {
+	now := time.Unix(0, 0)
+	cache := cacheAt(10, &now)
+	cache.PutDomain("token", cachedDomain(1, 7, "token"), cache.Version())
+
+	cache.UpdateDomain(cachedDomain(1, 7, "token"))
+	_, found := cache.Domain("token")
+	assert.False(t, found)
+	assert.Equal(t, 1.0, testutil.ToFloat64(cache.evictions.WithLabelValues(cacheDomainByToken, "write")))
+}
+
+func TestTokenCache_UpdateDomain_NewToken(t *testing.T) {
+	now := time.Unix(0, 0)
+	cache := cacheAt(10, &now)
+	cache.PutDomain("old", cachedDomain(1, 7, "old"), cache.Version())
+
+	cache.UpdateDomain(cachedDomain(1, 7, "new"))
+	_, found := cache.Domain("old")
+	assert.False(t, found)
+}
+
+func TestTokenCache_RemoveUserDomains(t *testing.T) {
+	now := time.Unix(0, 0)
+	cache := cacheAt(10, &now)
+	cache.PutDomain("one", cachedDomain(1, 7, "one"), cache.Version())
+	cache.PutDomain("two", cachedDomain(2, 7, "two"), cache.Version())
+	cache.PutDomain("other", cachedDomain(3, 8, "other"), cache.Version())
+
+	cache.RemoveUserDomains(7)
+	_, found := cache.Domain("one")
+	assert.False(t, found)
+	_, found = cache.Domain("two")
+	assert.False(t, found)
+	_, found = cache.Domain("other")
+	assert.True(t, found)
+}
+
+func TestTokenCache_RemoveUser(t *testing.T) {
+	now := time.Unix(0, 0)
+	cache := cacheAt(10, &now)
+	cache.PutUser(7, &model.User{Id: 7}, cache.Version())
+
+	cache.RemoveUser(7)
+	_, found := cache.User(7)
+	assert.False(t, found)
+}
+
+func TestTokenCache_StaleReadIsNotCached(t *testing.T) {
+	now := time.Unix(0, 0)
+	cache := cacheAt(10, &now)
+	version := cache.Version()
+	cache.RemoveDomain(1)
+	cache.PutDomain("token", cachedDomain(1, 7, "token"), version)
+	_, found := cache.Domain("token")
+	assert.False(t, found)
+}
+
+func TestTokenCache_Disabled(t *testing.T) {
+	cache := NewTokenCache(10, 0)
+	cache.PutDomain("token", cachedDomain(1, 7, "token"), cache.Version())
+	_, found := cache.Domain("token")
+	assert.False(t, found)
+}
+
+func TestTokenCache_Heartbeats(t *testing.T) {
+	now := time.Unix(0, 0)
+	cache := cacheAt(10, &now)
+	cache.PutDomain("token", cachedDomain(1, 7, "token"), cache.Version())
+
+	version := "25.01"
+	cache.Heartbeats([]model.DomainHeartbeat{{DomainId: 1, LastUpdate: time.Unix(20, 0), PlatformVersion: &version}, {DomainId: 2}})
+	cache.Heartbeats([]model.DomainHeartbeat{{DomainId: 1, LastUpdate: time.Unix(10, 0)}})
+
+	domain, found := cache.Domain("token")
+	assert.True(t, found)
+	assert.Equal(t, time.Unix(20, 0), *domain.LastUpdate)
+	assert.Equal(t, "25.01", *domain.PlatformVersion)
+}
@@ -0,0 +1,536 @@
+package dns
+
+import (
+	"errors"
+	"math/rand"
+	"sort"
+	"sync"
+	"time"
+
+	"github.com/aws/aws-sdk-go/aws/awserr"
+	"github.com/aws/aws-sdk-go/service/route53"
+	"github.com/prometheus/client_golang/prometheus"
+	"github.com/syncloud/redirect/model"
+	"go.uber.org/zap"
+)
+
+const (
+	// ChangeResourceRecordSets takes at most this many records and value
+	// characters per request, an UPSERT counting twice towards both
+	maxBatchRecords    = 1000
+	maxBatchValueChars = 32000
+
+	maxThrottleRetries = 5
+	throttleBackoff    = 200 * time.Millisecond
+
+	// every so many updates of a domain upsert all of its records, so
+	// records changed behind the queue's back do not stay wrong for good
+	fullWriteEvery = 10
+)
+
+type queuedChange struct {
+	// nil when the records were left in an unknown state
+	previous *model.Domain
+	domain   *model.Domain
+	queued   time.Time
+	changes  []*route53.Change
+}
+
+// ChangeQueueDb marks the domains with records waiting in the queue, so a
+// restart can write what it dropped, and tells which domains still exist.
+type ChangeQueueDb interface {
+	MarkDomainDnsPending(domainId uint64) error
+	ClearDomainsDnsPending(domainIds []uint64) error
+	GetDnsPendingDomains() ([]*model.Domain, error)
+	GetExistingDomainIds(domainIds []uint64) (map[uint64]bool, error)
+}
+
+// ChangeQueue sends record updates to Route53 in the background. It keeps
+// the latest state per domain, so a domain that changes several times
+// between flushes is written once, and every interval packs what is
+// pending into as few ChangeResourceRecordSets calls per hosted zone as
+// the api limits allow. Throttled calls are retried with backoff and
+// whatever still fails is kept for the next flush. With no interval every
+// update is sent right away. Everything else goes straight to AmazonDns.
+//
+// Queued domains are marked in the database until written, never while
+// holding the mutex. On start the queue takes the marked domains back and
+// upserts all of their records, as what was written for them is unknown.
+type ChangeQueue struct {
+	*AmazonDns
+	db        ChangeQueueDb
+	interval  time.Duration
+	mutex     sync.Mutex
+	pending   map[uint64]*queuedChange
+	updates   map[uint64]int
+	flushing  sync.Mutex
+	stop      chan struct{}
+	stopped   chan struct{}
+	now       func() time.Time
+	sleep     func(time.Duration)
+	logger    *zap.Logger
+	requests  *prometheus.CounterVec
+	throttled prometheus.Counter
+	applyLag  prometheus.Histogram
+	depthDesc *prometheus.Desc
+	lagDesc   *prometheus.Desc
+}
+
+func NewChangeQueue(amazonDns *AmazonDns, db ChangeQueueDb, interval time.Duration, logger *zap.Logger) *ChangeQueue {
+	return &ChangeQueue{
+		AmazonDns: amazonDns,
+		db:        db,
+		interval:  interval,
+		pending:   map[uint64]*queuedChange{},
+		updates:   map[uint64]int{},
+		stop:      make(chan struct{}),
+		stopped:   make(chan struct{}),
+		now:       time.Now,
+		sleep:     time.Sleep,
+		logger:    logger,
+		requests: prometheus.NewCounterVec(
+			prometheus.CounterOpts{
+				Name: "redirect_dns_queue_requests_total",
+				Help: "Change batches sent to Route53, by result (ok|invalid|error).",
+			},
+			[]string{"result"},
+		),
+		throttled: prometheus.NewCounter(prometheus.CounterOpts{
+			Name: "redirect_dns_queue_throttled_total",
+			Help: "Change batches Route53 throttled and the queue retried.",
+		}),
+		applyLag: prometheus.NewHistogram(prometheus.HistogramOpts{
+			Name:    "redirect_dns_queue_apply_lag_seconds",
+			Help:    "Time from a domain update to its records being written.",
+			Buckets: prometheus.ExponentialBuckets(0.1, 2, 12),
+		}),
+		depthDesc: prometheus.NewDesc("redirect_dns_queue_depth", "Domains waiting for a record update.", nil, nil),
+		lagDesc:   prometheus.NewDesc("redirect_dns_queue_lag_seconds", "Age of the oldest waiting record update.", nil, nil),
+	}
+}
+
+// UpdateDomainRecords queues the records of domain, previous being the
+// state they were last written with.
+func (q *ChangeQueue) UpdateDomainRecords(previous *model.Domain, domain *model.Domain) error {
+	change := &queuedChange{domain: copyDomain(domain), previous: copyDomain(previous), queued: q.now()}
+	if q.interval <= 0 {
+		change.changes = q.changes(change)
+		if len(change.changes) == 0 {
+			return nil
+		}
+		_, err := q.apply(domain.HostedZoneId, []*queuedChange{change})
+		return err
+	}
+	q.mutex.Lock()
+	if waiting, found := q.pending[domain.Id]; found {
+		change.previous = waiting.previous
+		change.queued = waiting.queued
+	}
+	q.pending[domain.Id] = change
+	q.mutex.Unlock()
+	// marked once queued: a settle that clears the mark first sees the
+	// domain queued again and marks it back
+	err := q.db.MarkDomainDnsPending(domain.Id)
+	if err != nil {
+		q.logger.Error("mark pending record update", zap.String("domain", domain.Name), zap.Error(err))
+	}
+	return nil
+}
+
+// DeleteDomainRecords drops what is queued for the domain, waiting for a
+// flush that may be writing it, before deleting its records.
+func (q *ChangeQueue) DeleteDomainRecords(domain *model.Domain) error {
+	q.flushing.Lock()
+	q.mutex.Lock()
+	delete(q.pending, domain.Id)
+	delete(q.updates, domain.Id)
+	q.mutex.Unlock()
+	q.flushing.Unlock()
+	return q.AmazonDns.DeleteDomainRecords(domain)
+}
+
+func (q *ChangeQueue) Start() error {
+	err := q.restorePending()
+	if err != nil {
+		return err
+	}
+	if q.interval <= 0 {
+		q.flushLogged()
+		close(q.stopped)
+		return nil
+	}
+	go func() {
+		defer close(q.stopped)
+		ticker := time.NewTicker(q.interval)
+		defer ticker.Stop()
+		for {
+			select {
+			case <-ticker.C:
+			case <-q.stop:
+				q.flushLogged()
+				return
+			}
+			q.flushLogged()
+		}
+	}()
+	return nil
+}
+
+// restorePending queues the domains a previous run left marked.
+func (q *ChangeQueue) restorePending() error {
+	domains, err := q.db.GetDnsPendingDomains()
+	if err != nil {
+		return err
+	}
+	now := q.now()
+	q.mutex.Lock()
+	defer q.mutex.Unlock()
+	for _, domain := range domains {
+		if _, found := q.pending[domain.Id]; !found {
+			q.pending[domain.Id] = &queuedChange{domain: domain, queued: now}
+		}
+	}
+	if len(domains) > 0 {
+		q.logger.Info("recovered pending record updates", zap.Int("domains", len(domains)))
+	}
+	return nil
+}
+
+// Stop sends what is queued and waits for it.
+func (q *ChangeQueue) Stop() {
+	close(q.stop)
+	<-q.stopped
+}
+
+func (q *ChangeQueue) flushLogged() {
+	if err := q.Flush(); err != nil {
+		q.logger.Error("dns queue flush", zap.Error(err))
+	}
+}
+
+// Flush sends the queued updates, one hosted zone at a time. Domains
+// deleted since they were queued, which another process may have done,
+// are skipped, and records written for a domain deleted meanwhile are
+// deleted again.
+func (q *ChangeQueue) Flush() error {
+	q.flushing.Lock()
+	defer q.flushing.Unlock()
+
+	q.mutex.Lock()
+	pending := q.pending
+	q.pending = map[uint64]*queuedChange{}
+	q.mutex.Unlock()
+
+	if len(pending) == 0 {
+		return nil
+	}
+	queued := make([]*queuedChange, 0, len(pending))
+	for _, change := range pending {
+		queued = append(queued, change)
+	}
+	sort.Slice(queued, func(i, j int) bool { return queued[i].domain.Id < queued[j].domain.Id })
+	existing, err := q.db.GetExistingDomainIds(domainIds(queued))
+	if err != nil {
+		q.requeue(queued)
+		return err
+	}
+
+	zones := map[string][]*queuedChange{}
+	var unchanged []*queuedChange
+	for _, change := range queued {
+		if !existing[change.domain.Id] {
+			continue
+		}
+		change.changes = q.changes(change)
+		if len(change.changes) == 0 {
+			unchanged = append(unchanged, change)
+			continue
+		}
+		zones[change.domain.HostedZoneId] = append(zones[change.domain.HostedZoneId], change)
+	}
+	q.settle(unchanged)
+
+	var lastErr error
+	var written []*queuedChange
+	for zone, changes := range zones {
+		for _, batch := range batches(changes) {
+			failed, err := q.apply(zone, batch)
+			if err != nil {
+				lastErr = err
+			}
+			q.requeue(failed)
+			written = append(written, without(batch, failed)...)
+		}
+	}
+	q.removeDeleted(written)
+	return lastErr
+}
+
+// changes works out the records to send for an update, all of them on
+// every fullWriteEvery-th update of the domain and when the previous
+// records are unknown.
+func (q *ChangeQueue) changes(change *queuedChange) []*route53.Change {
+	id := change.domain.Id
+	q.mutex.Lock()
+	q.updates[id]++
+	full := q.updates[id] >= fullWriteEvery
+	if full {
+		delete(q.updates, id)
+	}
+	q.mutex.Unlock()
+	return q.domainChanges(change.previous, change.domain, full)
+}
+
+// batches packs whole domains into requests within the api limits.
+func batches(changes []*queuedChange) [][]*queuedChange {
+	var result [][]*queuedChange
+	var batch []*queuedChange
+	records, chars := 0, 0
+	for _, change := range changes {
+		changeRecords, changeChars := size(change.changes)
+		if len(batch) > 0 && (records+changeRecords > maxBatchRecords || chars+changeChars > maxBatchValueChars) {
+			result = append(result, batch)
+			batch, records, chars = nil, 0, 0
+		}
+		batch = append(batch, change)
+		records += changeRecords
+		chars += changeChars
+	}
+	if len(batch) > 0 {
+		result = append(result, batch)
+	}
+	return result
+}
+
+func size(changes []*route53.Change) (int, int) {
+	records, chars := 0, 0
+	for _, change := range changes {
+		weight := 1
+		if *change.Action == "UPSERT" {
+			weight = 2
+		}
+		for _, record := range change.ResourceRecordSet.ResourceRecords {
+			records += weight
+			chars += weight * len(*record.Value)
+		}
+	}
+	return records, chars
+}
+
+// apply writes a batch and returns the updates it could not write. A batch
+// Route53 rejects as invalid, usually because records were changed behind
+// the queue's back, is retried a domain at a time, and a domain that is
+// still rejected has its records reset.
+func (q *ChangeQueue) apply(zone string, batch []*queuedChange) ([]*queuedChange, error) {
+	var changes []*route53.Change
+	for _, change := range batch {
+		changes = append(changes, change.changes...)
+	}
+	err := q.commitRetrying(changes, zone)
+	if err == nil {
+		q.requests.WithLabelValues("ok").Inc()
+		q.applied(batch)
+		return nil, nil
+	}
+	if !hasCode(err, route53.ErrCodeInvalidChangeBatch) {
+		q.requests.WithLabelValues("error").Inc()
+		return batch, err
+	}
+	q.requests.WithLabelValues("invalid").Inc()
+	if len(batch) > 1 {
+		var failed []*queuedChange
+		var lastErr error
+		for _, change := range batch {
+			changeFailed, changeErr := q.apply(zone, []*queuedChange{change})
+			if changeErr != nil {
+				lastErr = changeErr
+			}
+			failed = append(failed, changeFailed...)
+		}
+		return failed, lastErr
+	}
+	q.logger.Warn("resetting domain records", zap.String("domain", batch[0].domain.Name), zap.Error(err))
+	err = q.ResetDomainRecords(batch[0].domain)
+	if err != nil {
+		return batch, err
+	}
+	q.applied(batch)
+	return nil, nil
+}
+
+func (q *ChangeQueue) commitRetrying(changes []*route53.Change, zone string) error {
+	backoff := throttleBackoff
+	for attempt := 0; ; attempt++ {
+		err := q.commit(changes, zone)
+		if err == nil || attempt == maxThrottleRetries || !isThrottling(err) {
+			return err
+		}
+		q.throttled.Inc()
+		q.sleep(backoff/2 + time.Duration(rand.Int63n(int64(backoff/2)+1)))
+		backoff *= 2
+	}
+}
+
+func (q *ChangeQueue) applied(batch []*queuedChange) {
+	now := q.now()
+	for _, change := range batch {
+		q.applyLag.Observe(now.Sub(change.queued).Seconds())
+	}
+	q.settle(batch)
+}
+
+// settle clears the mark of domains with nothing left to write, keeping it
+// for those queued again since. A domain queued while the mark was being
+// cleared may have been marked before the clear, so it is marked again.
+func (q *ChangeQueue) settle(changes []*queuedChange) {
+	if len(changes) == 0 {
+		return
+	}
+	ids := q.notPending(domainIds(changes))
+	if len(ids) == 0 {
+		return
+	}
+	err := q.db.ClearDomainsDnsPending(ids)
+	if err != nil {
+		q.logger.Error("clear pending record updates", zap.Error(err))
+		return
+	}
+	q.mutex.Lock()
+	var requeued []uint64
+	for _, id := range ids {
+		if _, found := q.pending[id]; found {
+			requeued = append(requeued, id)
+		}
+	}
+	q.mutex.Unlock()
+	for _, id := range requeued {
+		err = q.db.MarkDomainDnsPending(id)
+		if err != nil {
+			q.logger.Error("mark pending record update", zap.Uint64("domain", id), zap.Error(err))
+		}
+	}
+}
+
+func (q *ChangeQueue) notPending(ids []uint64) []uint64 {
+	q.mutex.Lock()
+	defer q.mutex.Unlock()
+	var result []uint64
+	for _, id := range ids {
+		if _, found := q.pending[id]; !found {
+			result = append(result, id)
+		}
+	}
+	return result
+}
+
+// removeDeleted deletes the records just written for domains that are gone
+// by now, whose records were deleted before they were written back.
+func (q *ChangeQueue) removeDeleted(written []*queuedChange) {
+	if len(written) == 0 {
+		return
+	}
+	existing, err := q.db.GetExistingDomainIds(domainIds(written))
+	if err != nil {
+		q.logger.Error("check written domains", zap.Error(err))
+		return
+	}
+	for _, change := range written {
+		if existing[change.domain.Id] {
+			continue
+		}
+		err = q.AmazonDns.DeleteDomainRecords(change.domain)
+		if err != nil {
+			q.logger.Error("delete records of a deleted domain", zap.String("domain", change.domain.Name), zap.Error(err))
+		}
+	}
+}
+
+// requeue keeps failed updates for the next flush. An update queued for
+// the same domain since then wins, but its records were last written as
+// the failed one found them.
+func (q *ChangeQueue) requeue(failed []*queuedChange) {
+	if len(failed) == 0 || q.interval <= 0 {
+		return
+	}
+	q.mutex.Lock()
+	defer q.mutex.Unlock()
+	for _, change := range failed {
+		if newer, found := q.pending[change.domain.Id]; found {
+			newer.previous = change.previous
+			newer.queued = change.queued
+			continue
+		}
+		q.pending[change.domain.Id] = change
+	}
+}
+
+func domainIds(changes []*queuedChange) []uint64 {
+	ids := make([]uint64, len(changes))
+	for i, change := range changes {
+		ids[i] = change.domain.Id
+	}
+	return ids
+}
+
+func without(batch []*queuedChange, failed []*queuedChange) []*queuedChange {
+	if len(failed) == 0 {
+		return batch
+	}
+	skip := map[*queuedChange]bool{}
+	for _, change := range failed {
+		skip[change] = true
+	}
+	var result []*queuedChange
+	for _, change := range batch {
+		if !skip[change] {
+			result = append(result, change)
+		}
+	}
+	return result
+}
+
+func isThrottling(err error) bool {
+	return hasCode(err, "Throttling") || hasCode(err, route53.ErrCodePriorRequestNotComplete)
+}
+
+func hasCode(err error, code string) bool {
+	var aErr awserr.Error
+	return errors.As(err, &aErr) && aErr.Code() == code
+}
+
+func copyDomain(domain *model.Domain) *model.Domain {
+	if domain == nil {
+		return nil
+	}
+	copied := *domain
+	return &copied
+}
+
+func (q *ChangeQueue) Describe(ch chan<- *prometheus.Desc) {
+	q.requests.Describe(ch)
+	q.throttled.Describe(ch)
+	q.applyLag.Describe(ch)
+	ch <- q.depthDesc
+	ch <- q.lagDesc
+}
+
+func (q *ChangeQueue) Collect(ch chan<- prometheus.Metric) {
+	q.requests.Collect(ch)
+	q.throttled.Collect(ch)
+	q.applyLag.Collect(ch)
+	q.mutex.Lock()
+	depth := len(q.pending)
+	var oldest time.Time
+	for _, change := range q.pending {
+		if oldest.IsZero() || change.queued.Before(oldest) {
+			oldest = change.queued
+		}
+	}
+	q.mutex.Unlock()
+	lag := 0.0
+	if !oldest.IsZero() {
+		lag = q.now().Sub(oldest).Seconds()
+	}
+	ch <- prometheus.MustNewConstMetric(q.depthDesc, prometheus.GaugeValue, float64(depth))
+	ch <- prometheus.MustNewConstMetric(q.lagDesc, prometheus.GaugeValue, lag)
+}
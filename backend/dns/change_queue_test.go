@@ -0,0 +1,320 @@
+package dns
+
+import (
+	"fmt"
+	"strings"
+	"testing"
+	"time"
+
+	"github.com/aws/aws-sdk-go/aws/awserr"
+	"github.com/aws/aws-sdk-go/service/route53"
+	"github.com/prometheus/client_golang/prometheus/testutil"
+	"github.com/stretchr/testify/assert"
+	"github.com/syncloud/redirect/log"
+	"github.com/syncloud/redirect/metrics"
+	"github.com/syncloud/redirect/model"
+)
+
+type ChangesRoute53Stub struct {
+	Route53Stub
+	inputs []*route53.ChangeResourceRecordSetsInput
+	errors []error
+}
+
+func (r *ChangesRoute53Stub) ChangeResourceRecordSets(input *route53.ChangeResourceRecordSetsInput) (*route53.ChangeResourceRecordSetsOutput, error) {
+	r.inputs = append(r.inputs, input)
+	if len(r.errors) > 0 {
+		err := r.errors[0]
+		r.errors = r.errors[1:]
+		return nil, err
+	}
+	return nil, nil
+}
+
+func (r *ChangesRoute53Stub) records(call int) []string {
+	var records []string
+	for _, change := range r.inputs[call].ChangeBatch.Changes {
+		records = append(records, fmt.Sprintf("%s %s %s %s", *change.Action, *change.ResourceRecordSet.Type,
+			*change.ResourceRecordSet.Name, *change.ResourceRecordSet.ResourceRecords[0].Value))
+	}
+	return records
+}
+
+type QueueDbStub struct {
+	pending  map[uint64]bool
+	deleted  map[uint64]bool
+	restored []*model.Domain
+	// called after each existence check
+	checked func()
+	// called before clearing marks
+	clearing func()
+}
+
+func (d *QueueDbStub) MarkDomainDnsPending(domainId uint64) error {
+	d.pending[domainId] = true
+	return nil
+}
+
+func (d *QueueDbStub) ClearDomainsDnsPending(domainIds []uint64) error {
+	if d.clearing != nil {
+		d.clearing()
+	}
+	for _, id := range domainIds {
+		delete(d.pending, id)
+	}
+	return nil
+}
+
+func (d *QueueDbStub) GetDnsPendingDomains() ([]*model.Domain, error) {
+	return d.restored, nil
+}
+
+func (d *QueueDbStub) GetExistingDomainIds(domainIds []uint64) (map[uint64]bool, error) {
+	existing := map[uint64]bool{}
+	for _, id := range domainIds {
+		existing[id] = !d.deleted[id]
+	}
+	if d.checked != nil {
+		d.checked()
+	}
+	return existing, nil
+}
+
+func newQueueDb() *QueueDbStub {
+	return &QueueDbStub{pending: map[uint64]bool{}, deleted: map[uint64]bool{}}
+}
+
+func newQueue(client *ChangesRoute53Stub) (*ChangeQueue, *[]time.Duration) {
+	queue := NewChangeQueue(New(client, metrics.New(), 255, "syncloud.it", log.Default()), newQueueDb(), time.Hour, log.Default())
+	var sleeps []time.Duration
+	queue.sleep = func(duration time.Duration) { sleeps = append(sleeps, duration) }
+	return queue, &sleeps
+}
+
+func queuedDomain(id uint64, zone string, ip string) *model.Domain {
+	return &model.Domain{Id: id, Name: fmt.Sprintf("device%d.syncloud.it", id), HostedZoneId: zone, Ip: &ip}
+}
+
+func TestChangeQueue_KeepsLatestPerDomain(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	queue, _ := newQueue(client)
+	first := queuedDomain(1, "zone", "1.1.1.1")
+	ipv6 := "2001:db8::1"
+	first.Ipv6 = &ipv6
+	second := queuedDomain(1, "zone", "2.2.2.2")
+	third := queuedDomain(1, "zone", "3.3.3.3")
+
+	assert.Nil(t, queue.UpdateDomainRecords(first, second))
+	assert.Nil(t, queue.UpdateDomainRecords(second, third))
+	assert.Empty(t, client.inputs)
+	assert.Nil(t, queue.Flush())
+
+	assert.Len(t, client.inputs, 1)
+	records := client.records(0)
+	assert.Contains(t, records, "DELETE AAAA device1.syncloud.it. 2001:db8::1")
+	assert.Contains(t, records, "UPSERT A device1.syncloud.it. 3.3.3.3")
+	assert.NotContains(t, records, "UPSERT A device1.syncloud.it. 2.2.2.2")
+
+	assert.Nil(t, queue.Flush())
+	assert.Len(t, client.inputs, 1)
+}
+
+func TestChangeQueue_BatchesPerZone(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	queue, _ := newQueue(client)
+	for id := uint64(1); id <= 4; id++ {
+		zone := "zone1"
+		if id > 3 {
+			zone = "zone2"
+		}
+		assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(id, zone, "1.1.1.1"), queuedDomain(id, zone, "2.2.2.2")))
+	}
+	assert.Nil(t, queue.Flush())
+
+	calls := map[string]int{}
+	for _, input := range client.inputs {
+		calls[*input.HostedZoneId] = len(input.ChangeBatch.Changes)
+	}
+	assert.Equal(t, map[string]int{"zone1": 3 * 2, "zone2": 2}, calls)
+}
+
+func TestChangeQueue_SplitsAtApiLimits(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	queue, _ := newQueue(client)
+	for id := uint64(1); id <= 300; id++ {
+		assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(id, "zone", "1.1.1.1"), queuedDomain(id, "zone", "2.2.2.2")))
+	}
+	assert.Nil(t, queue.Flush())
+
+	assert.Len(t, client.inputs, 2)
+	for _, input := range client.inputs {
+		records, chars := size(input.ChangeBatch.Changes)
+		assert.LessOrEqual(t, records, maxBatchRecords)
+		assert.LessOrEqual(t, chars, maxBatchValueChars)
+	}
+}
+
+func TestChangeQueue_RetriesThrottling(t *testing.T) {
+	client := &ChangesRoute53Stub{errors: []error{
+		awserr.New("Throttling", "Rate exceeded", nil),
+		awserr.New(route53.ErrCodePriorRequestNotComplete, "busy", nil),
+	}}
+	queue, sleeps := newQueue(client)
+	assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), queuedDomain(1, "zone", "2.2.2.2")))
+	assert.Nil(t, queue.Flush())
+
+	assert.Len(t, client.inputs, 3)
+	assert.Len(t, *sleeps, 2)
+	assert.Greater(t, (*sleeps)[1], throttleBackoff/2)
+	assert.Equal(t, 2.0, testutil.ToFloat64(queue.throttled))
+}
+
+func TestChangeQueue_KeepsFailedForNextFlush(t *testing.T) {
+	client := &ChangesRoute53Stub{errors: []error{fmt.Errorf("connection refused")}}
+	queue, _ := newQueue(client)
+	first := queuedDomain(1, "zone", "1.1.1.1")
+	second := queuedDomain(1, "zone", "2.2.2.2")
+	assert.Nil(t, queue.UpdateDomainRecords(first, second))
+	assert.NotNil(t, queue.Flush())
+	assert.Len(t, queue.pending, 1)
+
+	assert.Nil(t, queue.UpdateDomainRecords(second, queuedDomain(1, "zone", "3.3.3.3")))
+	assert.Nil(t, queue.Flush())
+	assert.Len(t, client.inputs, 2)
+	assert.Contains(t, client.records(1), "UPSERT A device1.syncloud.it. 3.3.3.3")
+	assert.Empty(t, queue.pending)
+}
+
+func TestChangeQueue_InvalidBatchIsRetriedPerDomain(t *testing.T) {
+	client := &ChangesRoute53Stub{errors: []error{
+		awserr.New(route53.ErrCodeInvalidChangeBatch, "record not found", nil),
+		nil,
+		awserr.New(route53.ErrCodeInvalidChangeBatch, "record not found", nil),
+	}}
+	queue, _ := newQueue(client)
+	for id := uint64(1); id <= 2; id++ {
+		assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(id, "zone", "1.1.1.1"), queuedDomain(id, "zone", "2.2.2.2")))
+	}
+	assert.Nil(t, queue.Flush())
+
+	// both, each on its own, then the upsert, delete and create of a reset
+	assert.Len(t, client.inputs, 6)
+	assert.Contains(t, client.records(5), "CREATE A device2.syncloud.it. 2.2.2.2")
+	assert.Empty(t, queue.pending)
+}
+
+func TestChangeQueue_SkipsUnchanged(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	queue, _ := newQueue(client)
+	assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), queuedDomain(1, "zone", "2.2.2.2")))
+	assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "2.2.2.2"), queuedDomain(1, "zone", "1.1.1.1")))
+	assert.Nil(t, queue.Flush())
+	assert.Empty(t, client.inputs)
+}
+
+func TestChangeQueue_DeleteDropsQueued(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	queue, _ := newQueue(client)
+	domain := queuedDomain(1, "zone", "2.2.2.2")
+	assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), domain))
+	assert.Nil(t, queue.DeleteDomainRecords(domain))
+	calls := len(client.inputs)
+	assert.Nil(t, queue.Flush())
+	assert.Len(t, client.inputs, calls)
+}
+
+func TestChangeQueue_NoIntervalWritesNow(t *testing.T) {
+	client := &ChangesRoute53Stub{errors: []error{fmt.Errorf("connection refused")}}
+	queue := NewChangeQueue(New(client, metrics.New(), 255, "syncloud.it", log.Default()), newQueueDb(), 0, log.Default())
+	assert.NotNil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), queuedDomain(1, "zone", "2.2.2.2")))
+	assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), queuedDomain(1, "zone", "2.2.2.2")))
+	assert.Len(t, client.inputs, 2)
+	assert.Empty(t, queue.pending)
+}
+
+func TestChangeQueue_MarksUntilWritten(t *testing.T) {
+	client := &ChangesRoute53Stub{errors: []error{fmt.Errorf("connection refused")}}
+	queue, _ := newQueue(client)
+	db := queue.db.(*QueueDbStub)
+	assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), queuedDomain(1, "zone", "2.2.2.2")))
+	assert.True(t, db.pending[1])
+
+	assert.NotNil(t, queue.Flush())
+	assert.True(t, db.pending[1])
+	assert.Nil(t, queue.Flush())
+	assert.False(t, db.pending[1])
+}
+
+func TestChangeQueue_RestoredAreUpserted(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	db := newQueueDb()
+	db.pending[1] = true
+	db.pending[2] = true
+	db.restored = []*model.Domain{queuedDomain(1, "zone", "2.2.2.2"), queuedDomain(2, "zone", "3.3.3.3")}
+	queue := NewChangeQueue(New(client, metrics.New(), 255, "syncloud.it", log.Default()), db, 0, log.Default())
+	assert.Nil(t, queue.Start())
+
+	assert.Len(t, client.inputs, 1)
+	records := client.records(0)
+	assert.Contains(t, records, "UPSERT A device1.syncloud.it. 2.2.2.2")
+	assert.Contains(t, records, "UPSERT A device2.syncloud.it. 3.3.3.3")
+	for _, record := range records {
+		assert.True(t, strings.HasPrefix(record, "UPSERT "), record)
+	}
+	assert.Empty(t, db.pending)
+}
+
+func TestChangeQueue_QueuedWhileClearingStaysMarked(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	queue, _ := newQueue(client)
+	db := queue.db.(*QueueDbStub)
+	assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), queuedDomain(1, "zone", "2.2.2.2")))
+	db.clearing = func() {
+		db.clearing = nil
+		assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "2.2.2.2"), queuedDomain(1, "zone", "3.3.3.3")))
+	}
+	assert.Nil(t, queue.Flush())
+
+	assert.True(t, db.pending[1])
+	assert.Nil(t, queue.Flush())
+	assert.False(t, db.pending[1])
+}
+
+func TestChangeQueue_SkipsDeletedElsewhere(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	queue, _ := newQueue(client)
+	assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), queuedDomain(1, "zone", "2.2.2.2")))
+	queue.db.(*QueueDbStub).deleted[1] = true
+	assert.Nil(t, queue.Flush())
+	assert.Empty(t, client.inputs)
+}
+
+func TestChangeQueue_RemovesDeletedWhileWriting(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	queue, _ := newQueue(client)
+	db := queue.db.(*QueueDbStub)
+	db.checked = func() {
+		db.deleted[1] = true
+		db.checked = nil
+	}
+	assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), queuedDomain(1, "zone", "2.2.2.2")))
+	assert.Nil(t, queue.Flush())
+
+	// the update, then the upsert and delete of the defaults
+	assert.Len(t, client.inputs, 3)
+	assert.Equal(t, "DELETE", *client.inputs[2].ChangeBatch.Changes[0].Action)
+}
+
+func TestChangeQueue_FullWriteEveryFewUpdates(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	queue, _ := newQueue(client)
+	for update := 1; update <= fullWriteEvery; update++ {
+		assert.Nil(t, queue.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), queuedDomain(1, "zone", fmt.Sprintf("2.2.2.%d", update))))
+		assert.Nil(t, queue.Flush())
+	}
+
+	assert.Len(t, client.inputs, fullWriteEvery)
+	assert.Len(t, client.records(0), 2)
+	assert.Len(t, client.records(fullWriteEvery-1), 5)
+	assert.Empty(t, queue.updates)
+}
@@ -11,6 +11,7 @@ import (
 	"github.com/syncloud/redirect/utils"
 	"go.uber.org/zap"
 	"log"
+	"strconv"
 	"strings"
 )
 
@@ -39,7 +40,7 @@ type Dns interface {
 	DeleteHostedZone(hostedZoneId string) error
 	CreateCertbotRecord(hostedZoneId string, name string, value string) error
 	DeleteCertbotRecord(hostedZoneId string, name string, value string) error
-	UpdateDomainRecords(domain *model.Domain) error
+	UpdateDomainRecords(previous *model.Domain, domain *model.Domain) error
 	DeleteDomainRecords(domain *model.Domain) error
 	GetHostedZoneNameServers(id string) ([]*string, error)
 }
@@ -116,7 +117,18 @@ func (a *AmazonDns) DeleteHostedZone(hostedZoneId string) error {
 	return nil
 }
 
-func (a *AmazonDns) UpdateDomainRecords(domain *model.Domain) error {
+// UpdateDomainRecords writes the records of domain that differ from
+// previous, the state they were last written with.
+func (a *AmazonDns) UpdateDomainRecords(previous *model.Domain, domain *model.Domain) error {
+	changes := a.domainChanges(previous, domain, false)
+	if len(changes) == 0 {
+		return nil
+	}
+	return a.commit(changes, domain.HostedZoneId)
+}
+
+// ResetDomainRecords rewrites every record of domain, whatever is there.
+func (a *AmazonDns) ResetDomainRecords(domain *model.Domain) error {
 	err := a.DeleteDomainRecords(domain)
 	if err != nil {
 		return err
@@ -197,6 +209,10 @@ func (a *AmazonDns) changeDKIM(domain string, dkim string, action string) *route
 }
 
 func (a *AmazonDns) actionDomain(domain string, ipv4 *string, ipv6 *string, dkim *string, spf string, mx string, action string, hostedZoneId string) error {
+	return a.commit(a.domainRecords(domain, ipv4, ipv6, dkim, spf, mx, action), hostedZoneId)
+}
+
+func (a *AmazonDns) domainRecords(domain string, ipv4 *string, ipv6 *string, dkim *string, spf string, mx string, action string) []*route53.Change {
 
 	var changes []*route53.Change
 
@@ -215,8 +231,56 @@ func (a *AmazonDns) actionDomain(domain string, ipv4 *string, ipv6 *string, dkim
 	changes = append(changes, a.change(action, domain, "SPF", defaultTtl, spf))
 	changes = append(changes, a.change(action, domain, "TXT", defaultTtl, spf))
 
-	err := a.commit(changes, hostedZoneId)
-	return err
+	return changes
+}
+
+func (a *AmazonDns) records(domain *model.Domain, action string) []*route53.Change {
+	return a.domainRecords(domain.FQDN(), domain.DnsIpv4(), domain.DnsIpv6(), domain.DkimKey,
+		allowDeviceAndMxSpf, a.mx(domain), action)
+}
+
+// domainChanges moves the records of a domain from previous to domain in
+// one batch: the ones domain no longer has are deleted with the values
+// previous gave them and only the ones that differ are upserted, or all of
+// them when full. A domain gets its records on the first update with an
+// address, so when previous has none nothing was written to delete and
+// all of them are upserted.
+func (a *AmazonDns) domainChanges(previous *model.Domain, domain *model.Domain, full bool) []*route53.Change {
+	desired := a.records(domain, "UPSERT")
+	if previous == nil || (previous.DnsIpv4() == nil && previous.DnsIpv6() == nil) {
+		return desired
+	}
+	values := map[string]string{}
+	for _, change := range desired {
+		values[recordKey(change)] = recordValue(change)
+	}
+	var changes []*route53.Change
+	for _, change := range a.records(previous, "DELETE") {
+		value, kept := values[recordKey(change)]
+		if !kept {
+			changes = append(changes, change)
+		} else if !full && value == recordValue(change) {
+			delete(values, recordKey(change))
+		}
+	}
+	for _, change := range desired {
+		if _, differs := values[recordKey(change)]; differs {
+			changes = append(changes, change)
+		}
+	}
+	return changes
+}
+
+func recordKey(change *route53.Change) string {
+	return *change.ResourceRecordSet.Type + " " + *change.ResourceRecordSet.Name
+}
+
+func recordValue(change *route53.Change) string {
+	values := []string{strconv.FormatInt(*change.ResourceRecordSet.TTL, 10)}
+	for _, record := range change.ResourceRecordSet.ResourceRecords {
+		values = append(values, *record.Value)
+	}
+	return strings.Join(values, " ")
 }
 
 func (a *AmazonDns) commit(changes []*route53.Change, hostedZoneId string) error {
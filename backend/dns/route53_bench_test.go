@@ -0,0 +1,24 @@
+package dns
+
+import (
+	"fmt"
+	"strings"
+	"testing"
+)
+
+// go test ./dns -run '^$' -bench . -benchmem
+
+var splitSink []string
+
+func BenchmarkSplitBy(b *testing.B) {
+	// a 2048 bit dkim key makes a txt value of about 400 characters
+	for _, size := range []int{200, 400, 800} {
+		value := strings.Repeat("k", size)
+		b.Run(fmt.Sprintf("chars=%d", size), func(b *testing.B) {
+			b.ReportAllocs()
+			for i := 0; i < b.N; i++ {
+				splitSink = splitBy(value, 255)
+			}
+		})
+	}
+}
@@ -7,6 +7,7 @@ import (
 	"github.com/syncloud/redirect/log"
 	"github.com/syncloud/redirect/metrics"
 	"github.com/syncloud/redirect/model"
+	"strings"
 	"testing"
 )
 
@@ -52,7 +53,7 @@ func TestAmazonDns_UpdateDomainRecords_Dkim255CharsLimit(t *testing.T) {
 	amazonDns := New(client, metrics.New(), 10, "syncloud.it", log.Default())
 	dkimKey := "12345abcde"
 	domain := &model.Domain{DkimKey: &dkimKey}
-	err := amazonDns.UpdateDomainRecords(domain)
+	err := amazonDns.UpdateDomainRecords(nil, domain)
 	assert.Nil(t, err)
 	record := client.resourceRecordSetsInput.ChangeBatch.Changes[0].ResourceRecordSet.ResourceRecords[0]
 	assert.Equal(t, `"v=DKIM1; k" "=rsa; p=12" "345abcde"`, *record.Value)
@@ -72,7 +73,7 @@ func TestAmazonDns_UpdateDomainRecords_MxPointsAtTheDeviceWithoutRelay(t *testin
 	client := &Route53Stub{}
 	amazonDns := New(client, metrics.New(), 10, "syncloud.it", log.Default())
 
-	err := amazonDns.UpdateDomainRecords(&model.Domain{Name: "alice.syncloud.it"})
+	err := amazonDns.UpdateDomainRecords(nil, &model.Domain{Name: "alice.syncloud.it"})
 
 	assert.Nil(t, err)
 	mx, err := mxRecord(client)
@@ -84,7 +85,7 @@ func TestAmazonDns_UpdateDomainRecords_MxPointsAtTheRelayWithRelay(t *testing.T)
 	client := &Route53Stub{}
 	amazonDns := New(client, metrics.New(), 10, "syncloud.it", log.Default())
 
-	err := amazonDns.UpdateDomainRecords(&model.Domain{Name: "alice.syncloud.it", Relay: true})
+	err := amazonDns.UpdateDomainRecords(nil, &model.Domain{Name: "alice.syncloud.it", Relay: true})
 
 	assert.Nil(t, err)
 	mx, err := mxRecord(client)
@@ -96,10 +97,78 @@ func TestAmazonDns_UpdateDomainRecords_MxForACustomDomain(t *testing.T) {
 	client := &Route53Stub{}
 	amazonDns := New(client, metrics.New(), 10, "syncloud.it", log.Default())
 
-	err := amazonDns.UpdateDomainRecords(&model.Domain{Name: "example.com", Relay: true})
+	err := amazonDns.UpdateDomainRecords(nil, &model.Domain{Name: "example.com", Relay: true})
 
 	assert.Nil(t, err)
 	mx, err := mxRecord(client)
 	assert.Nil(t, err)
 	assert.Equal(t, "1 example-com.mx.syncloud.it.", mx)
 }
+
+func TestAmazonDns_UpdateDomainRecords_OnlyWritesWhatChanged(t *testing.T) {
+	previous := queuedDomain(1, "zone", "1.1.1.1")
+	ipv6 := "2001:db8::1"
+	previous.Ipv6 = &ipv6
+	moved := queuedDomain(1, "zone", "2.2.2.2")
+	moved.Ipv6 = &ipv6
+	relayed := queuedDomain(1, "zone", "1.1.1.1")
+	relayed.Relay = true
+
+	tests := []struct {
+		name    string
+		domain  *model.Domain
+		records []string
+	}{
+		{"ip", moved, []string{
+			"UPSERT A device1.syncloud.it. 2.2.2.2",
+			"UPSERT A *.device1.syncloud.it. 2.2.2.2",
+		}},
+		{"ipv6 dropped", queuedDomain(1, "zone", "1.1.1.1"), []string{
+			"DELETE AAAA device1.syncloud.it. 2001:db8::1",
+			"DELETE AAAA *.device1.syncloud.it. 2001:db8::1",
+		}},
+		{"relay", relayed, []string{
+			"DELETE AAAA device1.syncloud.it. 2001:db8::1",
+			"DELETE AAAA *.device1.syncloud.it. 2001:db8::1",
+			"UPSERT MX device1.syncloud.it. 1 device1.mx.syncloud.it.",
+		}},
+	}
+	for _, test := range tests {
+		t.Run(test.name, func(t *testing.T) {
+			client := &ChangesRoute53Stub{}
+			amazonDns := New(client, metrics.New(), 255, "syncloud.it", log.Default())
+			assert.Nil(t, amazonDns.UpdateDomainRecords(previous, test.domain))
+			assert.Len(t, client.inputs, 1)
+			assert.Equal(t, test.records, client.records(0))
+		})
+	}
+}
+
+func TestAmazonDns_UpdateDomainRecords_NothingChanged(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	amazonDns := New(client, metrics.New(), 255, "syncloud.it", log.Default())
+	err := amazonDns.UpdateDomainRecords(queuedDomain(1, "zone", "1.1.1.1"), queuedDomain(1, "zone", "1.1.1.1"))
+	assert.Nil(t, err)
+	assert.Empty(t, client.inputs)
+}
+
+func TestAmazonDns_UpdateDomainRecords_FirstAddressWritesAll(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	amazonDns := New(client, metrics.New(), 255, "syncloud.it", log.Default())
+	acquired := &model.Domain{Id: 1, Name: "device1.syncloud.it", HostedZoneId: "zone"}
+	err := amazonDns.UpdateDomainRecords(acquired, queuedDomain(1, "zone", "1.1.1.1"))
+	assert.Nil(t, err)
+	assert.Len(t, client.records(0), 5)
+}
+
+func TestAmazonDns_UpdateDomainRecords_NothingWrittenIsNotDeleted(t *testing.T) {
+	client := &ChangesRoute53Stub{}
+	amazonDns := New(client, metrics.New(), 255, "syncloud.it", log.Default())
+	dkim := "dkim"
+	acquired := &model.Domain{Id: 1, Name: "device1.syncloud.it", HostedZoneId: "zone", DkimKey: &dkim}
+	err := amazonDns.UpdateDomainRecords(acquired, queuedDomain(1, "zone", "1.1.1.1"))
+	assert.Nil(t, err)
+	for _, record := range client.records(0) {
+		assert.True(t, strings.HasPrefix(record, "UPSERT"), record)
+	}
+}
@@ -50,12 +50,20 @@ func NewContainer(configPath string, secretPath string, mailPath string) (contai
 		return nil, err
 	}
 
-	err = c.Singleton(func(config *utils.Config) *db.MySql {
+	err = c.Singleton(func(config *utils.Config) *db.TokenCache {
+		return db.NewTokenCache(config.GetTokenCacheSize(), time.Duration(config.GetTokenCacheTtlSeconds())*time.Second)
+	})
+	if err != nil {
+		return nil, err
+	}
+
+	err = c.Singleton(func(config *utils.Config, cache *db.TokenCache) *db.MySql {
 		return db.NewMySql(
 			config.GetMySqlHost(),
 			config.GetMySqlDB(),
 			config.GetMySqlLogin(),
 			config.GetMySqlPassword(),
+			cache,
 			logger,
 		)
 	})
@@ -113,6 +121,13 @@ func NewContainer(configPath string, secretPath string, mailPath string) (contai
 		return nil, err
 	}
 
+	err = c.Singleton(func(amazonDns *dns.AmazonDns, database *db.MySql, config *utils.Config) *dns.ChangeQueue {
+		return dns.NewChangeQueue(amazonDns, database, time.Duration(config.GetDnsQueueIntervalMs())*time.Millisecond, logger)
+	})
+	if err != nil {
+		return nil, err
+	}
+
 	err = c.Singleton(func() *dns.PublicResolver {
 		return dns.NewPublicResolver()
 	})
@@ -222,16 +237,24 @@ func NewContainer(configPath string, secretPath string, mailPath string) (contai
 		return nil, err
 	}
 
+	err = c.Singleton(func(database *db.MySql, config *utils.Config) *service.Heartbeats {
+		return service.NewHeartbeats(database, time.Duration(config.GetHeartbeatFlushSeconds())*time.Second, logger)
+	})
+	if err != nil {
+		return nil, err
+	}
+
 	err = c.Singleton(func(
 		database *db.MySql,
 		users *service.Users,
+		heartbeats *service.Heartbeats,
 		detector *change.RequestDetector,
-		amazonDns *dns.AmazonDns,
+		dnsQueue *dns.ChangeQueue,
 		metrics *metrics.Metrics,
 		config *utils.Config,
 	) *service.Domains {
-		return service.NewDomains(amazonDns, database, users, metrics, config.Domain(), config.AwsHostedZoneId(),
-			detector, config.GetRelayAddress())
+		return service.NewDomains(dnsQueue, database, users, metrics, config.Domain(), config.AwsHostedZoneId(),
+			detector, config.GetRelayAddress(), heartbeats)
 	})
 	if err != nil {
 		return nil, err
@@ -0,0 +1,264 @@
+package inbound
+
+import (
+	"fmt"
+	"net"
+	"net/http"
+	"os/exec"
+	"slices"
+	"strings"
+	"sync"
+	"sync/atomic"
+	"testing"
+	"time"
+
+	"github.com/syncloud/redirect/mail"
+	"github.com/syncloud/redirect/model"
+	"go.uber.org/zap"
+)
+
+// Delivery capacity of one redirect node. Concurrent senders each deliver
+// one message through the inbound Server to device-faker, either straight
+// to its smtp port ("direct") or through startFakeMuxer with a CONNECT per
+// message, the way TunnelDialer reaches a device behind frps ("tunnel"):
+//
+//	go test ./mail/inbound -run '^$' -bench InboundServer -benchtime 2000x
+//
+// Besides ns/op every case reports msgs/s, sender latency percentiles and
+// the mean time per message in each stage: dial (tcp to the muxer, or to
+// the device when direct), connect (the CONNECT handshake), greeting
+// (until the device banner arrives), rcpt (the rest of RCPT: routing, EHLO
+// and MAIL/RCPT on the device) and data (DATA copied to the device and
+// its reply).
+
+type inboundStages struct {
+	dial     atomic.Int64
+	connect  atomic.Int64
+	greeting atomic.Int64
+	rcpt     atomic.Int64
+	data     atomic.Int64
+}
+
+// greetingConn records how long the device took to send its first bytes.
+type greetingConn struct {
+	net.Conn
+	since time.Time
+	spent *atomic.Int64
+	seen  bool
+}
+
+func (c *greetingConn) Read(b []byte) (int, error) {
+	n, err := c.Conn.Read(b)
+	if !c.seen {
+		c.seen = true
+		c.spent.Add(int64(time.Since(c.since)))
+	}
+	return n, err
+}
+
+// timedDialer is TunnelDialer.Dial split in two, so the tcp dial and the
+// CONNECT handshake are timed apart. Without a muxer it dials the device.
+type timedDialer struct {
+	tunnel *TunnelDialer
+	device string
+	stages *inboundStages
+}
+
+func (d *timedDialer) Dial(domain string) (net.Conn, error) {
+	address := d.device
+	if d.tunnel != nil {
+		address = d.tunnel.muxer
+	}
+	start := time.Now()
+	connection, err := net.DialTimeout("tcp", address, DialTimeout)
+	if err != nil {
+		return nil, err
+	}
+	connected := time.Now()
+	d.stages.dial.Add(int64(connected.Sub(start)))
+	if d.tunnel != nil {
+		if err := d.tunnel.connect(connection, domain); err != nil {
+			_ = connection.Close()
+			return nil, err
+		}
+		handshaken := time.Now()
+		d.stages.connect.Add(int64(handshaken.Sub(connected)))
+		connected = handshaken
+	}
+	return &greetingConn{Conn: connection, since: connected, spent: &d.stages.greeting}, nil
+}
+
+func freeAddress(b *testing.B) string {
+	b.Helper()
+	listener, err := net.Listen("tcp", "127.0.0.1:0")
+	if err != nil {
+		b.Fatal(err)
+	}
+	address := listener.Addr().String()
+	_ = listener.Close()
+	return address
+}
+
+// startDeviceFaker runs device-faker and returns its smtp address and the
+// url of its control api.
+func startDeviceFaker(b *testing.B) (string, string) {
+	b.Helper()
+	binary := b.TempDir() + "/device-faker"
+	build := exec.Command("go", "build", "-o", binary, ".")
+	build.Dir = "../../../device-faker"
+	if out, err := build.CombinedOutput(); err != nil {
+		b.Skipf("cannot build device faker: %v %s", err, out)
+	}
+
+	smtpAddress := freeAddress(b)
+	apiAddress := freeAddress(b)
+	faker := exec.Command(binary, "-smtp", smtpAddress, "-api", apiAddress, "-work-dir", b.TempDir())
+	if err := faker.Start(); err != nil {
+		b.Fatal(err)
+	}
+	b.Cleanup(func() { _ = faker.Process.Kill() })
+
+	url := "http://" + apiAddress + "/faker"
+	for i := 0; i < 100; i++ {
+		if response, err := http.Get(url + "/messages"); err == nil {
+			_ = response.Body.Close()
+			return smtpAddress, url
+		}
+		time.Sleep(20 * time.Millisecond)
+	}
+	b.Fatal("device faker did not start")
+	return "", ""
+}
+
+func benchMessage(size int) []byte {
+	var message strings.Builder
+	message.WriteString("From: sender@example.com\r\nTo: user@alice.syncloud.it\r\nSubject: bench\r\n\r\n")
+	line := strings.Repeat("x", 76) + "\r\n"
+	for message.Len() < size {
+		message.WriteString(line)
+	}
+	return []byte(message.String())
+}
+
+func benchDeliver(address string, message []byte, stages *inboundStages) error {
+	client, err := proxyDial(address, "203.0.113.1")
+	if err != nil {
+		return err
+	}
+	defer client.Close()
+	if err := client.Mail("sender@example.com"); err != nil {
+		return err
+	}
+	rcptStart := time.Now()
+	if err := client.Rcpt("user@alice.syncloud.it"); err != nil {
+		return err
+	}
+	dataStart := time.Now()
+	stages.rcpt.Add(int64(dataStart.Sub(rcptStart)))
+
+	writer, err := client.Data()
+	if err != nil {
+		return err
+	}
+	if _, err := writer.Write(message); err != nil {
+		return err
+	}
+	if err := writer.Close(); err != nil {
+		return err
+	}
+	stages.data.Add(int64(time.Since(dataStart)))
+	return client.Quit()
+}
+
+func percentileMs(sorted []time.Duration, p int) float64 {
+	if len(sorted) == 0 {
+		return 0
+	}
+	return float64(sorted[min(len(sorted)-1, len(sorted)*p/100)]) / float64(time.Millisecond)
+}
+
+func benchmarkInbound(b *testing.B, device string, fakerUrl string, tunnel bool, sessions int, size int) {
+	response, err := http.Post(fakerUrl+"/reset", "application/json", nil)
+	if err != nil {
+		b.Fatal(err)
+	}
+	_ = response.Body.Close()
+
+	stages := &inboundStages{}
+	dialer := &timedDialer{device: device, stages: stages}
+	if tunnel {
+		muxer, stopMuxer, err := startFakeMuxer(device, "alice.syncloud.it")
+		if err != nil {
+			b.Fatal(err)
+		}
+		defer stopMuxer()
+		dialer.tunnel = NewTunnelDialer(muxer, DialTimeout)
+	}
+	address, stop, err := relayedWith(dialer, map[string]*model.Domain{
+		"alice.syncloud.it": relayDomain("alice.syncloud.it")}, mail.NewConnections(0))
+	if err != nil {
+		b.Fatal(err)
+	}
+	defer stop()
+
+	message := benchMessage(size)
+	var next atomic.Int64
+	latencies := make([][]time.Duration, sessions)
+	failures := make(chan error, sessions)
+	var wg sync.WaitGroup
+	b.SetBytes(int64(len(message)))
+	b.ResetTimer()
+	start := time.Now()
+	for worker := range sessions {
+		wg.Add(1)
+		go func() {
+			defer wg.Done()
+			for next.Add(1) <= int64(b.N) {
+				sent := time.Now()
+				if err := benchDeliver(address, message, stages); err != nil {
+					failures <- err
+					return
+				}
+				latencies[worker] = append(latencies[worker], time.Since(sent))
+			}
+		}()
+	}
+	wg.Wait()
+	elapsed := time.Since(start)
+	b.StopTimer()
+	select {
+	case err := <-failures:
+		b.Fatal(err)
+	default:
+	}
+
+	all := slices.Concat(latencies...)
+	slices.Sort(all)
+	perMessage := func(total int64) float64 {
+		return float64(total) / float64(b.N) / float64(time.Millisecond)
+	}
+	setup := stages.dial.Load() + stages.connect.Load() + stages.greeting.Load()
+	b.ReportMetric(float64(b.N)/elapsed.Seconds(), "msgs/s")
+	b.ReportMetric(percentileMs(all, 50), "p50-ms")
+	b.ReportMetric(percentileMs(all, 95), "p95-ms")
+	b.ReportMetric(percentileMs(all, 99), "p99-ms")
+	b.ReportMetric(perMessage(stages.dial.Load()), "dial-ms")
+	b.ReportMetric(perMessage(stages.connect.Load()), "connect-ms")
+	b.ReportMetric(perMessage(stages.greeting.Load()), "greeting-ms")
+	b.ReportMetric(perMessage(stages.rcpt.Load()-setup), "rcpt-ms")
+	b.ReportMetric(perMessage(stages.data.Load()), "data-ms")
+}
+
+func BenchmarkInboundServer(b *testing.B) {
+	device, fakerUrl := startDeviceFaker(b)
+	for _, mode := range []string{"direct", "tunnel"} {
+		for _, sessions := range []int{1, 16, 64} {
+			for _, size := range []int{4 << 10, 256 << 10} {
+				name := fmt.Sprintf("%s/sessions=%d/size=%dKiB", mode, sessions, size>>10)
+				b.Run(name, func(b *testing.B) {
+					benchmarkInbound(b, device, fakerUrl, mode == "tunnel", sessions, size)
+				})
+			}
+		}
+	}
+}
@@ -0,0 +1,51 @@
+package outbound
+
+import (
+	"fmt"
+	"sync/atomic"
+	"testing"
+)
+
+// go test ./mail/outbound -run '^$' -bench Limiter -benchmem
+//
+// Contended spreads the sends over limiterDomains devices the way a relay
+// node sees them, so the cost includes contention on the shared mutex. It
+// only measures that with several cpus, so bench.sh runs it apart from
+// the single cpu baseline.
+
+const limiterDomains = 10000
+
+func benchLimiter() *Limiter {
+	return NewLimiter(Limits{Minute: 1 << 40, Hour: 1 << 40, Day: 1 << 40, Recipients: 50})
+}
+
+func BenchmarkLimiter_Allow(b *testing.B) {
+	limiter := benchLimiter()
+	b.ReportAllocs()
+	for i := 0; i < b.N; i++ {
+		if err := limiter.Allow("device.syncloud.it", 1); err != nil {
+			b.Fatal(err)
+		}
+	}
+}
+
+func BenchmarkLimiter_Contended(b *testing.B) {
+	domains := make([]string, limiterDomains)
+	for i := range domains {
+		domains[i] = fmt.Sprintf("device%d.syncloud.it", i)
+	}
+	limiter := benchLimiter()
+	for _, domain := range domains {
+		_ = limiter.Allow(domain, 1)
+	}
+	var next atomic.Int64
+	b.ReportAllocs()
+	b.ResetTimer()
+	b.RunParallel(func(pb *testing.PB) {
+		for pb.Next() {
+			if err := limiter.Allow(domains[next.Add(1)%limiterDomains], 1); err != nil {
+				b.Fatal(err)
+			}
+		}
+	})
+}
@@ -0,0 +1,258 @@
+package outbound
+
+import (
+	"fmt"
+	"io"
+	"net"
+	"net/http"
+	"net/http/httptest"
+	"net/smtp"
+	"slices"
+	"strings"
+	"sync"
+	"sync/atomic"
+	"testing"
+	"time"
+
+	"github.com/syncloud/redirect/mail"
+	"github.com/syncloud/redirect/model"
+	"go.uber.org/zap"
+)
+
+// Capacity of one relay node. Concurrent devices each open a session, AUTH,
+// send one message and QUIT, through the real Rspamd client (against a stub
+// that accepts everything) and the real SesSender (against ses-faker):
+//
+//	go test ./mail/outbound -run '^$' -bench RelayServer -benchtime 2000x
+//
+// Besides ns/op every case reports msgs/s, client latency percentiles and
+// the mean time a message spends in each stage: connect (dial, greeting,
+// EHLO), auth, envelope (MAIL, RCPT), scan, send, and the rest of DATA
+// (upload, limiter, in-flight slot, usage accounting).
+
+type relayStages struct {
+	connect  atomic.Int64
+	auth     atomic.Int64
+	envelope atomic.Int64
+	data     atomic.Int64
+	scan     atomic.Int64
+	send     atomic.Int64
+}
+
+type timedScanner struct {
+	Scanner
+	spent *atomic.Int64
+}
+
+func (s timedScanner) Scan(from string, recipients []string, domain string, message []byte) error {
+	start := time.Now()
+	defer func() { s.spent.Add(int64(time.Since(start))) }()
+	return s.Scanner.Scan(from, recipients, domain, message)
+}
+
+type timedSender struct {
+	Sender
+	spent *atomic.Int64
+}
+
+func (s timedSender) Send(from string, recipients []string, message []byte) error {
+	start := time.Now()
+	defer func() { s.spent.Add(int64(time.Since(start))) }()
+	return s.Sender.Send(from, recipients, message)
+}
+
+// benchUsage is fakeUsage made safe for concurrent sessions.
+type benchUsage struct{ sent atomic.Int64 }
+
+func (u *benchUsage) Sent(_ string) (int64, error)      { return u.sent.Load(), nil }
+func (u *benchUsage) SentByUser(_ int64) (int64, error) { return u.sent.Load(), nil }
+func (u *benchUsage) Increment(_ string, count int64) error {
+	u.sent.Add(count)
+	return nil
+}
+
+func benchRelay() *Relay {
+	token := "the-token"
+	return New(
+		&fakeDomains{domain: &model.Domain{Name: "device.syncloud.it", UserId: 7, UpdateToken: &token}},
+		&fakePlans{limit: 1 << 40},
+		&benchUsage{},
+		&fakeBlocklist{},
+		nil,
+		zap.NewNop())
+}
+
+func stubRspamd(b *testing.B) (*Rspamd, func()) {
+	b.Helper()
+	server := httptest.NewServer(http.HandlerFunc(func(w http.ResponseWriter, r *http.Request) {
+		_, _ = io.Copy(io.Discard, r.Body)
+		_, _ = w.Write([]byte(`{"action":"no action","score":0.1}`))
+	}))
+	scanner := NewRspamd(&fakeRspamdConfig{url: server.URL}, 10*time.Second, zap.NewNop())
+	if err := scanner.Start(); err != nil {
+		b.Fatal(err)
+	}
+	return scanner, server.Close
+}
+
+func benchMessage(size int) []byte {
+	var message strings.Builder
+	message.WriteString("From: user@device.syncloud.it\r\nTo: someone@example.com\r\nSubject: bench\r\n\r\n")
+	line := strings.Repeat("x", 76) + "\r\n"
+	for message.Len() < size {
+		message.WriteString(line)
+	}
+	return []byte(message.String())
+}
+
+func benchSend(address string, recipients []string, message []byte, stages *relayStages) error {
+	start := time.Now()
+	client, err := smtp.Dial(address)
+	if err != nil {
+		return err
+	}
+	defer client.Close()
+	if err := client.Hello("device.syncloud.it"); err != nil {
+		return err
+	}
+	authStart := time.Now()
+	stages.connect.Add(int64(authStart.Sub(start)))
+
+	if err := client.Auth(smtp.PlainAuth("", "device.syncloud.it", "the-token", "127.0.0.1")); err != nil {
+		return err
+	}
+	envelopeStart := time.Now()
+	stages.auth.Add(int64(envelopeStart.Sub(authStart)))
+
+	if err := client.Mail("user@device.syncloud.it"); err != nil {
+		return err
+	}
+	for _, to := range recipients {
+		if err := client.Rcpt(to); err != nil {
+			return err
+		}
+	}
+	dataStart := time.Now()
+	stages.envelope.Add(int64(dataStart.Sub(envelopeStart)))
+
+	writer, err := client.Data()
+	if err != nil {
+		return err
+	}
+	if _, err := writer.Write(message); err != nil {
+		return err
+	}
+	if err := writer.Close(); err != nil {
+		return err
+	}
+	stages.data.Add(int64(time.Since(dataStart)))
+	return client.Quit()
+}
+
+func startBenchRelay(b *testing.B, sender Sender, scanner Scanner) (string, func()) {
+	b.Helper()
+	listener, err := net.Listen("tcp", "127.0.0.1:0")
+	if err != nil {
+		b.Fatal(err)
+	}
+	address := listener.Addr().String()
+	_ = listener.Close()
+
+	server := NewServer(address, "syncloud.it", benchRelay(), sender, scanner,
+		NewLimiter(Limits{}), mail.NewConnections(0), mail.NewInFlight(0), 32<<20, zap.NewNop())
+	if err := server.Start(); err != nil {
+		b.Fatal(err)
+	}
+	for i := 0; i < 100; i++ {
+		if conn, err := net.Dial("tcp", address); err == nil {
+			_ = conn.Close()
+			return address, func() { _ = server.Close() }
+		}
+		time.Sleep(20 * time.Millisecond)
+	}
+	b.Fatal("relay did not start")
+	return "", nil
+}
+
+func percentileMs(sorted []time.Duration, p int) float64 {
+	if len(sorted) == 0 {
+		return 0
+	}
+	return float64(sorted[min(len(sorted)-1, len(sorted)*p/100)]) / float64(time.Millisecond)
+}
+
+func benchmarkRelay(b *testing.B, sesUrl string, sessions int, size int, recipientCount int) {
+	stages := &relayStages{}
+	rspamd, stopRspamd := stubRspamd(b)
+	defer stopRspamd()
+	address, stopRelay := startBenchRelay(b,
+		timedSender{Sender: sesSenderFor(sesUrl), spent: &stages.send},
+		timedScanner{Scanner: rspamd, spent: &stages.scan})
+	defer stopRelay()
+
+	message := benchMessage(size)
+	recipients := make([]string, recipientCount)
+	for i := range recipients {
+		recipients[i] = fmt.Sprintf("rcpt%d@example.com", i)
+	}
+
+	var next atomic.Int64
+	latencies := make([][]time.Duration, sessions)
+	failures := make(chan error, sessions)
+	var wg sync.WaitGroup
+	b.SetBytes(int64(len(message)))
+	b.ResetTimer()
+	start := time.Now()
+	for worker := range sessions {
+		wg.Add(1)
+		go func() {
+			defer wg.Done()
+			for next.Add(1) <= int64(b.N) {
+				sent := time.Now()
+				if err := benchSend(address, recipients, message, stages); err != nil {
+					failures <- err
+					return
+				}
+				latencies[worker] = append(latencies[worker], time.Since(sent))
+			}
+		}()
+	}
+	wg.Wait()
+	elapsed := time.Since(start)
+	b.StopTimer()
+	select {
+	case err := <-failures:
+		b.Fatal(err)
+	default:
+	}
+
+	all := slices.Concat(latencies...)
+	slices.Sort(all)
+	perMessage := func(total *atomic.Int64) float64 {
+		return float64(total.Load()) / float64(b.N) / float64(time.Millisecond)
+	}
+	b.ReportMetric(float64(b.N)/elapsed.Seconds(), "msgs/s")
+	b.ReportMetric(percentileMs(all, 50), "p50-ms")
+	b.ReportMetric(percentileMs(all, 95), "p95-ms")
+	b.ReportMetric(percentileMs(all, 99), "p99-ms")
+	b.ReportMetric(perMessage(&stages.connect), "connect-ms")
+	b.ReportMetric(perMessage(&stages.auth), "auth-ms")
+	b.ReportMetric(perMessage(&stages.envelope), "envelope-ms")
+	b.ReportMetric(perMessage(&stages.scan), "scan-ms")
+	b.ReportMetric(perMessage(&stages.send), "send-ms")
+	b.ReportMetric(perMessage(&stages.data)-perMessage(&stages.scan)-perMessage(&stages.send), "data-other-ms")
+}
+
+func BenchmarkRelayServer(b *testing.B) {
+	sesUrl := startSesFaker(b, "SESSIM_DISCARD=1")
+	for _, sessions := range []int{1, 32} {
+		for _, size := range []int{1 << 10, 100 << 10, 1 << 20} {
+			for _, recipients := range []int{1, 10, 50} {
+				name := fmt.Sprintf("sessions=%d/size=%dKiB/rcpt=%d", sessions, size>>10, recipients)
+				b.Run(name, func(b *testing.B) {
+					benchmarkRelay(b, sesUrl, sessions, size, recipients)
+				})
+			}
+		}
+	}
+}
@@ -21,18 +21,18 @@ type fakerMessage struct {
 	Body         string   `json:"body"`
 }
 
-func startSesFaker(t *testing.T) string {
+func startSesFaker(t testing.TB, env ...string) string {
 	t.Helper()
 	binary := t.TempDir() + "/ses-faker"
 	build := exec.Command("go", "build", "-o", binary, ".")
-	build.Dir = "../../ses-faker"
+	build.Dir = "../../../ses-faker"
 	if out, err := build.CombinedOutput(); err != nil {
 		t.Skipf("cannot build ses faker: %v %s", err, out)
 	}
 
 	address := "127.0.0.1:14579"
 	faker := exec.Command(binary)
-	faker.Env = append(faker.Environ(), "SESSIM_ADDR="+address)
+	faker.Env = append(append(faker.Environ(), "SESSIM_ADDR="+address), env...)
 	assert.NoError(t, faker.Start())
 	t.Cleanup(func() { _ = faker.Process.Kill() })
 
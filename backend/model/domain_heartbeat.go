@@ -0,0 +1,14 @@
+package model
+
+import "time"
+
+// DomainHeartbeat is what a device heartbeat writes when none of its
+// addresses changed.
+type DomainHeartbeat struct {
+	DomainId        uint64
+	LastUpdate      time.Time
+	PlatformVersion *string
+	WebProtocol     *string
+	WebPort         *int
+	WebLocalPort    *int
+}
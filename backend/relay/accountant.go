@@ -13,7 +13,7 @@ type TrafficSource interface {
 }
 
 type RelayDb interface {
-	AddRelayTraffic(name string, yearMonth string, bytes int64) error
+	AddRelayTraffic(yearMonth string, deltas map[string]int64) error
 	GetRelayTrafficMonth(yearMonth string) (map[string]int64, error)
 }
 
@@ -25,6 +25,11 @@ type Warner interface {
 	Warn(userId int64, usedBytes int64, limitBytes int64) error
 }
 
+type owner struct {
+	userId int64
+	limit  int64
+}
+
 type warning struct {
 	userId int64
 	used   int64
@@ -46,8 +51,15 @@ type Accountant struct {
 	over    map[string]bool
 	warned  map[int64]bool
 
+	// deltas a failed write left for the next poll, by month, only
+	// touched by the poll loop
+	unsaved map[string]map[string]int64
+
 	trafficDesc *prometheus.Desc
 	overDesc    *prometheus.Desc
+	pollTime    prometheus.Histogram
+	lockTime    prometheus.Histogram
+	overruns    prometheus.Counter
 }
 
 func NewAccountant(source TrafficSource, db RelayDb, directory Directory, warner Warner, interval time.Duration, logger *zap.Logger) *Accountant {
@@ -62,8 +74,23 @@ func NewAccountant(source TrafficSource, db RelayDb, directory Directory, warner
 		monthly:     map[string]int64{},
 		over:        map[string]bool{},
 		warned:      map[int64]bool{},
+		unsaved:     map[string]map[string]int64{},
 		trafficDesc: prometheus.NewDesc("redirect_relay_traffic_bytes", "Relay traffic this month, by proxy.", []string{"proxy"}, nil),
 		overDesc:    prometheus.NewDesc("redirect_relay_over_limit", "1 if the proxy is over its monthly traffic limit.", []string{"proxy"}, nil),
+		pollTime: prometheus.NewHistogram(prometheus.HistogramOpts{
+			Name:    "redirect_relay_poll_seconds",
+			Help:    "Time a relay traffic poll takes, fetch and write included.",
+			Buckets: prometheus.ExponentialBuckets(0.005, 2, 14),
+		}),
+		lockTime: prometheus.NewHistogram(prometheus.HistogramOpts{
+			Name:    "redirect_relay_accounting_lock_seconds",
+			Help:    "Time a relay traffic poll holds the lock OverLimit waits on.",
+			Buckets: prometheus.ExponentialBuckets(0.00001, 4, 12),
+		}),
+		overruns: prometheus.NewCounter(prometheus.CounterOpts{
+			Name: "redirect_relay_poll_overruns_total",
+			Help: "Relay traffic polls that took longer than the poll interval.",
+		}),
 	}
 }
 
@@ -72,13 +99,17 @@ func month() string {
 }
 
 func (a *Accountant) Start() error {
+	current := month()
+	seed, err := a.db.GetRelayTrafficMonth(current)
+	if err != nil {
+		a.logger.Warn("relay accounting seed failed", zap.Error(err))
+	}
+	owners := a.owners(seed)
 	a.mu.Lock()
-	a.month = month()
-	if seed, err := a.db.GetRelayTrafficMonth(a.month); err == nil {
+	a.month = current
+	if err == nil {
 		a.monthly = seed
-		a.recomputeOver()
-	} else {
-		a.logger.Warn("relay accounting seed failed", zap.Error(err))
+		a.recomputeOver(owners)
 	}
 	a.mu.Unlock()
 	go a.loop()
@@ -93,7 +124,19 @@ func (a *Accountant) loop() {
 	}
 }
 
+// poll adds the traffic since the last poll. The lock OverLimit waits on
+// is only held to update the totals and the over limit flags; the
+// database write and the owner lookups happen outside of it.
 func (a *Accountant) poll() {
+	started := time.Now()
+	defer func() {
+		elapsed := time.Since(started)
+		a.pollTime.Observe(elapsed.Seconds())
+		if elapsed > a.interval {
+			a.overruns.Inc()
+		}
+	}()
+
 	raw, err := a.source.Fetch()
 	if err != nil {
 		a.logger.Warn("relay traffic fetch failed", zap.Error(err))
@@ -101,6 +144,7 @@ func (a *Accountant) poll() {
 	}
 	current := month()
 
+	locked := time.Now()
 	a.mu.Lock()
 
 	if current != a.month {
@@ -110,6 +154,7 @@ func (a *Accountant) poll() {
 		a.warned = map[int64]bool{}
 	}
 
+	deltas := map[string]int64{}
 	for name, cur := range raw {
 		last, seen := a.lastRaw[name]
 		a.lastRaw[name] = cur
@@ -124,12 +169,26 @@ func (a *Accountant) poll() {
 			continue
 		}
 		a.monthly[name] += delta
-		if err := a.db.AddRelayTraffic(name, current, delta); err != nil {
-			a.logger.Warn("relay traffic persist failed", zap.String("proxy", name), zap.Error(err))
-		}
+		deltas[name] = delta
+	}
+	monthly := make(map[string]int64, len(a.monthly))
+	for name, bytes := range a.monthly {
+		monthly[name] = bytes
 	}
-	warnings := a.recomputeOver()
 	a.mu.Unlock()
+	a.lockTime.Observe(time.Since(locked).Seconds())
+
+	a.persist(current, deltas)
+	owners := a.owners(monthly)
+
+	locked = time.Now()
+	a.mu.Lock()
+	var warnings []warning
+	if a.month == current {
+		warnings = a.recomputeOver(owners)
+	}
+	a.mu.Unlock()
+	a.lockTime.Observe(time.Since(locked).Seconds())
 
 	for _, w := range warnings {
 		if err := a.warner.Warn(w.userId, w.used, w.limit); err != nil {
@@ -138,18 +197,54 @@ func (a *Accountant) poll() {
 	}
 }
 
-func (a *Accountant) recomputeOver() []warning {
+// persist writes the deltas of this poll along with whatever an earlier
+// write failed to store, keeping them for the next poll on failure.
+func (a *Accountant) persist(current string, deltas map[string]int64) {
+	if len(deltas) > 0 {
+		unsaved, found := a.unsaved[current]
+		if !found {
+			unsaved = map[string]int64{}
+			a.unsaved[current] = unsaved
+		}
+		for name, delta := range deltas {
+			unsaved[name] += delta
+		}
+	}
+	for yearMonth, unsaved := range a.unsaved {
+		if err := a.db.AddRelayTraffic(yearMonth, unsaved); err != nil {
+			a.logger.Warn("relay traffic persist failed", zap.String("month", yearMonth),
+				zap.Int("proxies", len(unsaved)), zap.Error(err))
+			continue
+		}
+		delete(a.unsaved, yearMonth)
+	}
+}
+
+// owners looks up who owns each proxy and their limit, which may go to
+// the database.
+func (a *Accountant) owners(monthly map[string]int64) map[string]owner {
+	owners := make(map[string]owner, len(monthly))
+	for name := range monthly {
+		userId, limit, ok := a.directory.OwnerLimit(name)
+		if ok {
+			owners[name] = owner{userId: userId, limit: limit}
+		}
+	}
+	return owners
+}
+
+func (a *Accountant) recomputeOver(owners map[string]owner) []warning {
 	perUser := map[int64]int64{}
 	limitOf := map[int64]int64{}
 	ownerOf := map[string]int64{}
 	for name, bytes := range a.monthly {
-		userId, limit, ok := a.directory.OwnerLimit(name)
+		owner, ok := owners[name]
 		if !ok {
 			continue
 		}
-		ownerOf[name] = userId
-		limitOf[userId] = limit
-		perUser[userId] += bytes
+		ownerOf[name] = owner.userId
+		limitOf[owner.userId] = owner.limit
+		perUser[owner.userId] += bytes
 	}
 	over := map[string]bool{}
 	for name, userId := range ownerOf {
@@ -179,9 +274,15 @@ func (a *Accountant) OverLimit(name string) bool {
 func (a *Accountant) Describe(ch chan<- *prometheus.Desc) {
 	ch <- a.trafficDesc
 	ch <- a.overDesc
+	a.pollTime.Describe(ch)
+	a.lockTime.Describe(ch)
+	a.overruns.Describe(ch)
 }
 
 func (a *Accountant) Collect(ch chan<- prometheus.Metric) {
+	a.pollTime.Collect(ch)
+	a.lockTime.Collect(ch)
+	a.overruns.Collect(ch)
 	a.mu.Lock()
 	defer a.mu.Unlock()
 	for name, bytes := range a.monthly {
@@ -1,6 +1,8 @@
 package relay
 
 import (
+	"errors"
+	"fmt"
 	"strings"
 	"testing"
 	"time"
@@ -25,13 +27,21 @@ func (f *fakeSource) Fetch() (map[string]int64, error) {
 
 type fakeRelayDb struct {
 	stored map[string]int64
+	writes int
+	err    error
 }
 
-func (f *fakeRelayDb) AddRelayTraffic(name string, yearMonth string, bytes int64) error {
+func (f *fakeRelayDb) AddRelayTraffic(_ string, deltas map[string]int64) error {
+	if f.err != nil {
+		return f.err
+	}
 	if f.stored == nil {
 		f.stored = map[string]int64{}
 	}
-	f.stored[name] += bytes
+	f.writes++
+	for name, bytes := range deltas {
+		f.stored[name] += bytes
+	}
 	return nil
 }
 
@@ -95,6 +105,65 @@ func TestAccountant_BaselineThenAccumulatesDelta(t *testing.T) {
 	assert.Equal(t, int64(2000), db.stored["alice"])
 }
 
+func TestAccountant_WritesAllProxiesAtOnce(t *testing.T) {
+	baseline, traffic := map[string]int64{}, map[string]int64{}
+	for i := range 1000 {
+		name := fmt.Sprintf("device%d.syncloud.it", i)
+		baseline[name] = 0
+		traffic[name] = int64(i + 1)
+	}
+	db := &fakeRelayDb{}
+	a := newAccountant(oneUser(0), &fakeSource{values: []map[string]int64{baseline, traffic}}, db)
+	a.poll()
+	a.poll()
+	assert.Equal(t, 1, db.writes)
+	assert.Len(t, db.stored, 1000)
+}
+
+func TestAccountant_FailedWriteIsKeptForNextPoll(t *testing.T) {
+	source := &fakeSource{values: []map[string]int64{
+		{"alice": 0},
+		{"alice": 100},
+		{"alice": 300},
+	}}
+	db := &fakeRelayDb{err: errors.New("db is down")}
+	a := newAccountant(oneUser(0, "alice"), source, db)
+	a.poll()
+	a.poll()
+	db.err = nil
+	a.poll()
+	assert.Equal(t, int64(300), db.stored["alice"])
+	assert.Empty(t, a.unsaved)
+}
+
+type lockCheckingDb struct {
+	fakeRelayDb
+	accountant *Accountant
+	unlocked   bool
+}
+
+func (d *lockCheckingDb) AddRelayTraffic(yearMonth string, deltas map[string]int64) error {
+	if d.accountant.mu.TryLock() {
+		d.unlocked = true
+		d.accountant.mu.Unlock()
+	}
+	return d.fakeRelayDb.AddRelayTraffic(yearMonth, deltas)
+}
+
+func TestAccountant_WritesWithoutHoldingTheLock(t *testing.T) {
+	source := &fakeSource{values: []map[string]int64{
+		{"alice": 0},
+		{"alice": 100},
+	}}
+	db := &lockCheckingDb{}
+	a := newAccountant(oneUser(0, "alice"), source, db)
+	db.accountant = a
+	a.poll()
+	a.poll()
+	assert.True(t, db.unlocked)
+	assert.Equal(t, int64(100), db.stored["alice"])
+}
+
 func TestAccountant_CounterResetCountsCurrentValue(t *testing.T) {
 	source := &fakeSource{values: []map[string]int64{
 		{"alice": 5000},
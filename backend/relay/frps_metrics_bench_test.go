@@ -0,0 +1,39 @@
+package relay
+
+import (
+	"fmt"
+	"strings"
+	"testing"
+)
+
+// go test ./relay -run '^$' -bench ParseTraffic -benchmem
+//
+// The scrape holds, per proxy, traffic in and out plus the other frps
+// series the accountant skips.
+
+var trafficSink map[string]int64
+
+func frpsScrape(proxies int) string {
+	var scrape strings.Builder
+	scrape.WriteString("# HELP frp_server_traffic_in The total in traffic\n# TYPE frp_server_traffic_in counter\n")
+	for i := 0; i < proxies; i++ {
+		name := fmt.Sprintf("device%d.syncloud.it", i)
+		fmt.Fprintf(&scrape, "frp_server_traffic_in{name=\"%s\",type=\"https\"} %d\n", name, 1000+i)
+		fmt.Fprintf(&scrape, "frp_server_traffic_out{name=\"%s\",type=\"https\"} %g\n", name, 2.5e9+float64(i))
+		fmt.Fprintf(&scrape, "frp_server_connection_count{name=\"%s\",type=\"https\"} 3\n", name)
+	}
+	return scrape.String()
+}
+
+func BenchmarkParseTraffic(b *testing.B) {
+	for _, proxies := range []int{100, 10000} {
+		scrape := frpsScrape(proxies)
+		b.Run(fmt.Sprintf("proxies=%d", proxies), func(b *testing.B) {
+			b.SetBytes(int64(len(scrape)))
+			b.ReportAllocs()
+			for i := 0; i < b.N; i++ {
+				trafficSink = parseTraffic(strings.NewReader(scrape))
+			}
+		})
+	}
+}
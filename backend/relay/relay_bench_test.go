@@ -0,0 +1,332 @@
+package relay
+
+import (
+	"context"
+	"crypto/tls"
+	"fmt"
+	"io"
+	"net"
+	"net/http"
+	"net/http/httptest"
+	"os"
+	"os/exec"
+	"path/filepath"
+	"slices"
+	"sync"
+	"sync/atomic"
+	"testing"
+	"time"
+
+	"github.com/syncloud/redirect/model"
+	"go.uber.org/zap"
+)
+
+// Relay data plane through a real frps and frpc (set FRPS and FRPC to the
+// binaries, or have them on PATH), with a local https backend behind an
+// https proxy as the relay tests use:
+//
+//	FRPS=/tmp/frp/frps FRPC=/tmp/frp/frpc go test ./relay -run '^$' -bench RelayTunnel
+//
+// Every case runs with the auth plugin off and on. With it on, frps asks
+// AuthServer about every new user connection, and Enforce asks an
+// Accountant that scrapes the frps metrics every accountingInterval and
+// holds benchProxies proxies, so OverLimit waits behind a realistic poll.
+// conns opens a new tls connection per request, so its reqs/s is
+// connections/s; bulk streams benchBulkBytes per request over kept alive
+// connections and reports MB/s. Both report latency percentiles. With the plugin on both also report
+// the mean time Enforce spent in OverLimit.
+
+const (
+	benchDomain        = "bench.syncloud.it"
+	benchToken         = "the-token"
+	benchProxies       = 10000
+	benchBulkBytes     = 8 << 20
+	accountingInterval = 100 * time.Millisecond
+)
+
+func frpBinary(b *testing.B, env string, name string) string {
+	b.Helper()
+	if path := os.Getenv(env); path != "" {
+		return path
+	}
+	path, err := exec.LookPath(name)
+	if err != nil {
+		b.Skipf("%s not found, set %s", name, env)
+	}
+	return path
+}
+
+func freeAddress(b *testing.B) string {
+	b.Helper()
+	listener, err := net.Listen("tcp", "127.0.0.1:0")
+	if err != nil {
+		b.Fatal(err)
+	}
+	address := listener.Addr().String()
+	_ = listener.Close()
+	return address
+}
+
+func portOf(address string) string {
+	_, port, _ := net.SplitHostPort(address)
+	return port
+}
+
+func waitListening(b *testing.B, address string) {
+	b.Helper()
+	for i := 0; i < 250; i++ {
+		if connection, err := net.Dial("tcp", address); err == nil {
+			_ = connection.Close()
+			return
+		}
+		time.Sleep(20 * time.Millisecond)
+	}
+	b.Fatalf("nothing listening on %s", address)
+}
+
+func startProcess(b *testing.B, binary string, config string, content string) {
+	b.Helper()
+	path := filepath.Join(b.TempDir(), config)
+	if err := os.WriteFile(path, []byte(content), 0644); err != nil {
+		b.Fatal(err)
+	}
+	command := exec.Command(binary, "-c", path)
+	if err := command.Start(); err != nil {
+		b.Fatal(err)
+	}
+	b.Cleanup(func() {
+		_ = command.Process.Kill()
+		_ = command.Wait()
+	})
+}
+
+func startBackend(b *testing.B) string {
+	b.Helper()
+	big := make([]byte, benchBulkBytes)
+	backend := httptest.NewTLSServer(http.HandlerFunc(func(w http.ResponseWriter, r *http.Request) {
+		if r.URL.Path == "/big" {
+			_, _ = w.Write(big)
+			return
+		}
+		_, _ = w.Write([]byte("relay-backend-ok"))
+	}))
+	b.Cleanup(backend.Close)
+	return backend.Listener.Addr().String()
+}
+
+// timedLimiter measures what Enforce pays for OverLimit, lock wait included.
+type timedLimiter struct {
+	limiter Limiter
+	calls   atomic.Int64
+	spent   atomic.Int64
+}
+
+func (l *timedLimiter) OverLimit(name string) bool {
+	start := time.Now()
+	defer func() {
+		l.spent.Add(int64(time.Since(start)))
+		l.calls.Add(1)
+	}()
+	return l.limiter.OverLimit(name)
+}
+
+type benchRelayDb struct{ seed map[string]int64 }
+
+func (d *benchRelayDb) AddRelayTraffic(_ string, _ map[string]int64) error { return nil }
+func (d *benchRelayDb) GetRelayTrafficMonth(_ string) (map[string]int64, error) {
+	return d.seed, nil
+}
+
+// startAuth runs AuthServer in front of an Accountant polling metricsUrl.
+func startAuth(b *testing.B, metricsUrl string) (string, *timedLimiter) {
+	b.Helper()
+	seed := map[string]int64{}
+	directory := &fakeDirectory{owners: map[string]int64{}, limits: map[int64]int64{}}
+	for i := range benchProxies {
+		name := fmt.Sprintf("device%d.syncloud.it", i)
+		seed[name] = 1 << 20
+		directory.owners[name] = int64(i)
+		directory.limits[int64(i)] = 1 << 40
+	}
+	directory.owners[benchDomain] = benchProxies
+	directory.limits[benchProxies] = 1 << 40
+
+	accountant := NewAccountant(NewFrpsMetrics(metricsUrl), &benchRelayDb{seed: seed}, directory,
+		noopWarner{}, accountingInterval, zap.NewNop())
+	if err := accountant.Start(); err != nil {
+		b.Fatal(err)
+	}
+	limiter := &timedLimiter{limiter: accountant}
+	address := freeAddress(b)
+	server := NewAuthServer(address, &fakeDomains{byToken: map[string]*model.Domain{
+		benchToken: domainNamed(benchDomain)}}, limiter, "syncloud.it", zap.NewNop())
+	if err := server.Start(); err != nil {
+		b.Fatal(err)
+	}
+	waitListening(b, address)
+	return address, limiter
+}
+
+type benchTunnel struct {
+	vhost   string
+	limiter *timedLimiter
+}
+
+func startTunnel(b *testing.B, frps string, frpc string, backend string, plugin bool) *benchTunnel {
+	b.Helper()
+	bind, vhost, web := freeAddress(b), freeAddress(b), freeAddress(b)
+	config := fmt.Sprintf(`bindAddr = "127.0.0.1"
+bindPort = %s
+proxyBindAddr = "127.0.0.1"
+vhostHTTPSPort = %s
+webServer.addr = "127.0.0.1"
+webServer.port = %s
+enablePrometheus = true
+log.level = "warn"
+`, portOf(bind), portOf(vhost), portOf(web))
+	tunnel := &benchTunnel{vhost: vhost}
+	if plugin {
+		var auth string
+		auth, tunnel.limiter = startAuth(b, "http://"+web+"/metrics")
+		config += fmt.Sprintf(`
+[[httpPlugins]]
+name = "redirect-relay-auth"
+addr = "%s"
+path = "/plugin"
+ops = ["NewProxy", "NewUserConn"]
+`, auth)
+	}
+	startProcess(b, frps, "frps.toml", config)
+	waitListening(b, bind)
+
+	startProcess(b, frpc, "frpc.toml", fmt.Sprintf(`serverAddr = "127.0.0.1"
+serverPort = %s
+metadatas.token = "%s"
+log.level = "warn"
+
+[[proxies]]
+name = "%s"
+type = "https"
+customDomains = ["%s"]
+localIP = "127.0.0.1"
+localPort = %s
+`, portOf(bind), benchToken, benchDomain, benchDomain, portOf(backend)))
+
+	client := tunnel.client(1, false)
+	for i := 0; i < 150; i++ {
+		if response, err := client.Get("https://" + benchDomain + "/"); err == nil {
+			_ = response.Body.Close()
+			if response.StatusCode == http.StatusOK {
+				return tunnel
+			}
+		}
+		time.Sleep(100 * time.Millisecond)
+	}
+	b.Fatal("tunnel did not come up")
+	return nil
+}
+
+// client sends every request to the frps vhost port, with the relayed
+// domain as sni, like a browser resolving the domain to the relay.
+func (t *benchTunnel) client(connections int, keepAlive bool) *http.Client {
+	dialer := &net.Dialer{Timeout: 10 * time.Second}
+	return &http.Client{
+		Timeout: time.Minute,
+		Transport: &http.Transport{
+			DialContext: func(ctx context.Context, network string, _ string) (net.Conn, error) {
+				return dialer.DialContext(ctx, network, t.vhost)
+			},
+			TLSClientConfig:     &tls.Config{ServerName: benchDomain, InsecureSkipVerify: true},
+			DisableKeepAlives:   !keepAlive,
+			MaxIdleConnsPerHost: connections,
+		},
+	}
+}
+
+func percentileMs(sorted []time.Duration, p int) float64 {
+	if len(sorted) == 0 {
+		return 0
+	}
+	return float64(sorted[min(len(sorted)-1, len(sorted)*p/100)]) / float64(time.Millisecond)
+}
+
+func benchmarkTunnel(b *testing.B, tunnel *benchTunnel, path string, workers int, keepAlive bool) {
+	client := tunnel.client(workers, keepAlive)
+	defer client.CloseIdleConnections()
+	var calls, spent int64
+	if tunnel.limiter != nil {
+		calls, spent = tunnel.limiter.calls.Load(), tunnel.limiter.spent.Load()
+	}
+
+	var next atomic.Int64
+	latencies := make([][]time.Duration, workers)
+	failures := make(chan error, workers)
+	var wg sync.WaitGroup
+	b.ResetTimer()
+	start := time.Now()
+	for worker := range workers {
+		wg.Add(1)
+		go func() {
+			defer wg.Done()
+			for next.Add(1) <= int64(b.N) {
+				sent := time.Now()
+				response, err := client.Get("https://" + benchDomain + path)
+				if err != nil {
+					failures <- err
+					return
+				}
+				_, err = io.Copy(io.Discard, response.Body)
+				_ = response.Body.Close()
+				if err == nil && response.StatusCode != http.StatusOK {
+					err = fmt.Errorf("relay returned %s", response.Status)
+				}
+				if err != nil {
+					failures <- err
+					return
+				}
+				latencies[worker] = append(latencies[worker], time.Since(sent))
+			}
+		}()
+	}
+	wg.Wait()
+	elapsed := time.Since(start)
+	b.StopTimer()
+	select {
+	case err := <-failures:
+		b.Fatal(err)
+	default:
+	}
+
+	all := slices.Concat(latencies...)
+	slices.Sort(all)
+	b.ReportMetric(float64(b.N)/elapsed.Seconds(), "reqs/s")
+	b.ReportMetric(percentileMs(all, 50), "p50-ms")
+	b.ReportMetric(percentileMs(all, 99), "p99-ms")
+	if tunnel.limiter != nil {
+		if enforced := tunnel.limiter.calls.Load() - calls; enforced > 0 {
+			b.ReportMetric(float64(tunnel.limiter.spent.Load()-spent)/float64(enforced), "overlimit-ns")
+		}
+	}
+}
+
+func BenchmarkRelayTunnel(b *testing.B) {
+	frps := frpBinary(b, "FRPS", "frps")
+	frpc := frpBinary(b, "FRPC", "frpc")
+	backend := startBackend(b)
+	for _, plugin := range []bool{false, true} {
+		b.Run(fmt.Sprintf("plugin=%v", plugin), func(b *testing.B) {
+			tunnel := startTunnel(b, frps, frpc, backend, plugin)
+			for _, workers := range []int{1, 32} {
+				b.Run(fmt.Sprintf("conns/workers=%d", workers), func(b *testing.B) {
+					benchmarkTunnel(b, tunnel, "/", workers, false)
+				})
+			}
+			for _, workers := range []int{1, 8} {
+				b.Run(fmt.Sprintf("bulk/workers=%d", workers), func(b *testing.B) {
+					b.SetBytes(benchBulkBytes)
+					benchmarkTunnel(b, tunnel, "/big", workers, true)
+				})
+			}
+		})
+	}
+}
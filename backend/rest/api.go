@@ -1,6 +1,7 @@
 package rest
 
 import (
+	"context"
 	"encoding/json"
 	"errors"
 	"fmt"
@@ -62,6 +63,7 @@ type Api struct {
 	domain     string
 	count404   int64
 	socket     string
+	server     *http.Server
 	logger     *zap.Logger
 }
 
@@ -87,7 +89,12 @@ func NewApi(
 		metrics:    metrics,
 		domain:     domain,
 		socket:     socket,
-		logger:     logger,
+		server: &http.Server{
+			WriteTimeout: 5 * time.Second,
+			ReadTimeout:  10 * time.Second,
+			IdleTimeout:  15 * time.Second,
+		},
+		logger: logger,
 	}
 }
 
@@ -139,15 +146,20 @@ func (a *Api) Start() error {
 		listener = unixListener
 	}
 
-	srv := &http.Server{
-		Handler:      r,
-		WriteTimeout: 5 * time.Second,
-		ReadTimeout:  10 * time.Second,
-		IdleTimeout:  15 * time.Second,
-	}
+	a.server.Handler = r
 	l := netutil.LimitListener(listener, 1000)
 	log.Printf("Started backend (%s)\n", a.socket)
-	return srv.Serve(l)
+	return a.server.Serve(l)
+}
+
+// Stop stops taking requests and waits for the ones being handled.
+func (a *Api) Stop() {
+	ctx, cancel := context.WithTimeout(context.Background(), 10*time.Second)
+	defer cancel()
+	err := a.server.Shutdown(ctx)
+	if err != nil {
+		a.logger.Error("api shutdown", zap.Error(err))
+	}
 }
 
 func (a *Api) Status(_ http.ResponseWriter, req *http.Request) (interface{}, error) {
@@ -0,0 +1,54 @@
+package rest
+
+import (
+	"encoding/json"
+	"errors"
+	"net/http"
+	"testing"
+
+	"github.com/syncloud/redirect/model"
+)
+
+// go test ./rest -run '^$' -bench . -benchmem
+
+type discardWriter struct{ header http.Header }
+
+func (w *discardWriter) Header() http.Header         { return w.header }
+func (w *discardWriter) Write(b []byte) (int, error) { return len(b), nil }
+func (w *discardWriter) WriteHeader(_ int)           {}
+
+func BenchmarkSuccess(b *testing.B) {
+	w := &discardWriter{header: http.Header{}}
+	data := &model.UserResponse{Email: "user@example.com", Active: true,
+		Domains: []*model.Domain{{Name: "mydevice.syncloud.it"}}}
+	b.Run("nil", func(b *testing.B) {
+		b.ReportAllocs()
+		for i := 0; i < b.N; i++ {
+			success(w, nil)
+		}
+	})
+	b.Run("user", func(b *testing.B) {
+		b.ReportAllocs()
+		for i := 0; i < b.N; i++ {
+			success(w, data)
+		}
+	})
+}
+
+func BenchmarkErrorToResponse(b *testing.B) {
+	for name, err := range map[string]error{
+		"unknown":   errors.New("unknown"),
+		"service":   model.NewServiceError("domain is already taken"),
+		"parameter": model.SingleParameterError("domain", "Invalid characters"),
+	} {
+		b.Run(name, func(b *testing.B) {
+			b.ReportAllocs()
+			for i := 0; i < b.N; i++ {
+				response, _ := ErrorToResponse(err)
+				if _, err := json.Marshal(response); err != nil {
+					b.Fatal(err)
+				}
+			}
+		})
+	}
+}
@@ -23,10 +23,13 @@ type Domains struct {
 	freeHostedZoneId string
 	detector         change.Detector
 	relayAddress     string
+	heartbeats       DomainsHeartbeats
 }
 
 type DomainsDb interface {
 	GetDomainByToken(token string) (*model.Domain, error)
+	GetCachedDomainByToken(token string) (*model.Domain, error)
+	GetCachedUser(id int64) (*model.User, error)
 	GetUserDomains(userId int64) ([]*model.Domain, error)
 	GetUser(id int64) (*model.User, error)
 	DeleteAllDomains(userId int64) error
@@ -36,6 +39,10 @@ type DomainsDb interface {
 	DeleteDomain(domainId uint64) error
 }
 
+type DomainsHeartbeats interface {
+	Add(heartbeat model.DomainHeartbeat) error
+}
+
 type DomainsUsers interface {
 	Authenticate(email *string, password *string) (*model.User, error)
 }
@@ -43,7 +50,7 @@ type DomainsUsers interface {
 type DomainsDns interface {
 	CreateHostedZone(domain string) (*string, error)
 	DeleteHostedZone(hostedZoneId string) error
-	UpdateDomainRecords(domain *model.Domain) error
+	UpdateDomainRecords(previous *model.Domain, domain *model.Domain) error
 	DeleteDomainRecords(domain *model.Domain) error
 	DeleteCertbotRecord(hostedZoneId string, name string) error
 	GetHostedZoneNameServers(id string) ([]*string, error)
@@ -58,6 +65,7 @@ func NewDomains(
 	freeHostedZoneId string,
 	detector change.Detector,
 	relayAddress string,
+	heartbeats DomainsHeartbeats,
 ) *Domains {
 	return &Domains{
 		amazonDns:        dnsImpl,
@@ -67,7 +75,8 @@ func NewDomains(
 		domain:           domain,
 		freeHostedZoneId: freeHostedZoneId,
 		detector:         detector,
-		relayAddress:     relayAddress}
+		relayAddress:     relayAddress,
+		heartbeats:       heartbeats}
 }
 
 func (d *Domains) GetDomain(token string) (*model.Domain, error) {
@@ -302,27 +311,6 @@ func (d *Domains) Update(request model.DomainUpdateRequest, requestIp *string) (
 		return nil, &model.ParameterError{ParameterErrors: fieldValidator.ToParametersMessages()}
 	}
 
-	domain, err := d.db.GetDomainByToken(*request.Token)
-	if err != nil {
-		return nil, err
-	}
-	if domain == nil {
-		d.metrics.Rogue(ptrOrEmpty(platformVersion), *request.Token)
-		return nil, model.NewServiceError("unknown domain update token")
-	}
-
-	user, err := d.db.GetUser(domain.UserId)
-	if err != nil {
-		return nil, err
-	}
-	if user == nil || !user.Active {
-		d.metrics.Rogue(ptrOrEmpty(platformVersion), *request.Token)
-		return nil, model.NewServiceError("unknown domain update token")
-	}
-	if user.IsLocked() {
-		return nil, model.NewServiceError("user is locked")
-	}
-
 	var ipv4 *string
 	var localIpv4 *string
 	if request.Ipv4Enabled {
@@ -341,9 +329,31 @@ func (d *Domains) Update(request model.DomainUpdateRequest, requestIp *string) (
 		ipv6 = request.Ipv6
 	}
 
-	changed := d.detector.Changed(
-		domain.MapLocalAddress, domain.Ip, domain.Ipv6, domain.DkimKey, domain.LocalIp, domain.Relay,
-		mapLocalAddress, ipv4, ipv6, dkimKey, localIpv4, request.Relay)
+	changes := func(domain *model.Domain) (bool, bool) {
+		changed := d.detector.Changed(
+			domain.MapLocalAddress, domain.Ip, domain.Ipv6, domain.DkimKey, domain.LocalIp, domain.Relay,
+			mapLocalAddress, ipv4, ipv6, dkimKey, localIpv4, request.Relay)
+		return changed, domain.MailRelay != request.MailRelay
+	}
+
+	// the cache does not see what www or the cleaners change, so it only
+	// answers plain heartbeats; anything that writes or refuses on a cached
+	// user reads MySql
+	changed, mailRelayChanged := false, false
+	domain, err := d.updatedDomain(*request.Token, platformVersion, true)
+	if err == nil {
+		changed, mailRelayChanged = changes(domain)
+	} else if !errors.Is(err, errCachedRefusal) {
+		return nil, err
+	}
+	if err != nil || changed || mailRelayChanged {
+		domain, err = d.updatedDomain(*request.Token, platformVersion, false)
+		if err != nil {
+			return nil, err
+		}
+		changed, mailRelayChanged = changes(domain)
+	}
+	previous := *domain
 
 	domain.Ip = ipv4
 	domain.LocalIp = localIpv4
@@ -358,7 +368,7 @@ func (d *Domains) Update(request model.DomainUpdateRequest, requestIp *string) (
 	domain.MailRelay = request.MailRelay
 
 	if changed {
-		err := d.amazonDns.UpdateDomainRecords(domain)
+		err := d.amazonDns.UpdateDomainRecords(&previous, domain)
 		if err != nil {
 			return nil, err
 		}
@@ -366,7 +376,18 @@ func (d *Domains) Update(request model.DomainUpdateRequest, requestIp *string) (
 
 	now := time.Now()
 	domain.LastUpdate = &now
-	err = d.db.UpdateDomain(domain)
+	if changed || mailRelayChanged {
+		err = d.db.UpdateDomain(domain)
+	} else {
+		err = d.heartbeats.Add(model.DomainHeartbeat{
+			DomainId:        domain.Id,
+			LastUpdate:      now,
+			PlatformVersion: platformVersion,
+			WebProtocol:     webProtocol,
+			WebPort:         webPort,
+			WebLocalPort:    webLocalPort,
+		})
+	}
 	if err != nil {
 		return nil, err
 	}
@@ -375,6 +396,42 @@ func (d *Domains) Update(request model.DomainUpdateRequest, requestIp *string) (
 	return domain, nil
 }
 
+// errCachedRefusal stands in for refusing a heartbeat on a cached user, who
+// may have been activated or unlocked since; misses are never cached, so an
+// unknown token is refused straight away.
+var errCachedRefusal = errors.New("refused on a cached user")
+
+func (d *Domains) updatedDomain(token string, platformVersion *string, cached bool) (*model.Domain, error) {
+	getDomain, getUser := d.db.GetDomainByToken, d.db.GetUser
+	if cached {
+		getDomain, getUser = d.db.GetCachedDomainByToken, d.db.GetCachedUser
+	}
+	domain, err := getDomain(token)
+	if err != nil {
+		return nil, err
+	}
+	if domain == nil {
+		d.metrics.Rogue(ptrOrEmpty(platformVersion), token)
+		return nil, model.NewServiceError("unknown domain update token")
+	}
+
+	user, err := getUser(domain.UserId)
+	if err != nil {
+		return nil, err
+	}
+	if user != nil && cached && (!user.Active || user.IsLocked()) {
+		return nil, errCachedRefusal
+	}
+	if user == nil || !user.Active {
+		d.metrics.Rogue(ptrOrEmpty(platformVersion), token)
+		return nil, model.NewServiceError("unknown domain update token")
+	}
+	if user.IsLocked() {
+		return nil, model.NewServiceError("user is locked")
+	}
+	return domain, nil
+}
+
 func ptrOrEmpty(s *string) string {
 	if s == nil {
 		return ""
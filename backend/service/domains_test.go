@@ -40,7 +40,7 @@ func (dns *DnsStub) CreateHostedZone(_ string) (*string, error) {
 	return &id, nil
 }
 
-func (dns *DnsStub) UpdateDomainRecords(_ *model.Domain) error {
+func (dns *DnsStub) UpdateDomainRecords(_ *model.Domain, _ *model.Domain) error {
 	if dns.error != nil {
 		return dns.error
 	}
@@ -74,9 +74,13 @@ type DomainsDbStub struct {
 	userStatus   int64
 	relay        bool
 	ip           *string
+	// what a cache that missed a delete still answers
+	stale        bool
+	tokenLookups int
 }
 
 func (db *DomainsDbStub) GetDomainByToken(_ string) (*model.Domain, error) {
+	db.tokenLookups++
 	if db.found {
 		return &model.Domain{
 			Name: "name", UserId: db.userId, HostedZoneId: db.hostedZoneId,
@@ -85,6 +89,20 @@ func (db *DomainsDbStub) GetDomainByToken(_ string) (*model.Domain, error) {
 	return nil, nil
 }
 
+func (db *DomainsDbStub) GetCachedDomainByToken(token string) (*model.Domain, error) {
+	if db.stale {
+		return &model.Domain{Name: "name", UserId: db.userId, HostedZoneId: db.hostedZoneId}, nil
+	}
+	return db.GetDomainByToken(token)
+}
+
+func (db *DomainsDbStub) GetCachedUser(id int64) (*model.User, error) {
+	if db.stale {
+		return &model.User{Id: db.userId, Active: true}, nil
+	}
+	return db.GetUser(id)
+}
+
 func (db *DomainsDbStub) GetUserDomains(_ int64) ([]*model.Domain, error) {
 	if db.found {
 		return []*model.Domain{{Name: "name", UserId: db.userId, HostedZoneId: db.hostedZoneId}}, nil
@@ -125,6 +143,15 @@ func (db *DomainsDbStub) UpdateDomain(_ *model.Domain) error {
 
 }
 
+type HeartbeatsStub struct {
+	added []model.DomainHeartbeat
+}
+
+func (h *HeartbeatsStub) Add(heartbeat model.DomainHeartbeat) error {
+	h.added = append(h.added, heartbeat)
+	return nil
+}
+
 type DomainsUsersStub struct {
 	userId         int64
 	authenticated  bool
@@ -162,7 +189,7 @@ func TestAcquireFreeDomain_ExistingMine(t *testing.T) {
 	db := &DomainsDbStub{found: true, userId: 1}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "", &HeartbeatsStub{})
 	domain := "test123.syncloud.it"
 	password := "password"
 	email := "test@example.com"
@@ -181,7 +208,7 @@ func TestAcquireFreeDomain_ExistingNotMine(t *testing.T) {
 	db := &DomainsDbStub{found: true, userId: 2}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "", &HeartbeatsStub{})
 	userDomain := "test.syncloud.it"
 	password := "password"
 	email := "test@example.com"
@@ -201,7 +228,7 @@ func TestAcquireFreeDomain_Available(t *testing.T) {
 	db := &DomainsDbStub{found: false}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "", &HeartbeatsStub{})
 	domain := "test123.syncloud.it"
 	password := "password"
 	email := "test@example.com"
@@ -221,7 +248,7 @@ func TestAcquirePremiumDomain_FreeUser_NotAvailable(t *testing.T) {
 	db := &DomainsDbStub{found: false}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "", &HeartbeatsStub{})
 	domain := "example.com"
 	password := "password"
 	email := "test@example.com"
@@ -240,7 +267,7 @@ func TestAcquirePremiumDomain_PremiumUser_Available(t *testing.T) {
 	dnsStub := &DnsStub{}
 	subscriptionId := "1"
 	users := &DomainsUsersStub{authenticated: true, userId: 1, subscriptionId: &subscriptionId}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "", &HeartbeatsStub{})
 	domain := "example.com"
 	password := "password"
 	email := "test@example.com"
@@ -260,7 +287,7 @@ func TestFreeAvailability_SameUser(t *testing.T) {
 	db := &DomainsDbStub{found: true, userId: 1}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "", &HeartbeatsStub{})
 	domain := "test123.syncloud.it"
 	password := "password"
 	email := "test@example.com"
@@ -276,7 +303,7 @@ func TestFreeAvailability_OtherUser(t *testing.T) {
 	db := &DomainsDbStub{found: true, userId: 2}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "", &HeartbeatsStub{})
 	domain := "test.syncloud.it"
 	password := "password"
 	email := "test@example.com"
@@ -292,7 +319,7 @@ func TestFreeAvailability_Available(t *testing.T) {
 	db := &DomainsDbStub{found: false}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "", &HeartbeatsStub{})
 	domain := "test123.syncloud.it"
 	password := "password"
 	email := "test@example.com"
@@ -308,7 +335,7 @@ func TestPremiumAvailability_FreeUser_NotAvailable(t *testing.T) {
 	db := &DomainsDbStub{found: false}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "", &HeartbeatsStub{})
 	domain := "example.com"
 	password := "password"
 	email := "test@example.com"
@@ -325,7 +352,7 @@ func TestPremiumAvailability_PremiumUser_NotAvailable(t *testing.T) {
 	dnsStub := &DnsStub{}
 	subscriptionId := "1"
 	users := &DomainsUsersStub{authenticated: true, userId: 1, subscriptionId: &subscriptionId}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "", &DetectorStub{}, "", &HeartbeatsStub{})
 	domain := "example.com"
 	password := "password"
 	email := "test@example.com"
@@ -341,7 +368,7 @@ func TestDeleteDomain_Free_DeleteRecords(t *testing.T) {
 	db := &DomainsDbStub{found: true, userId: 1, hostedZoneId: "1"}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "1", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "1", &DetectorStub{}, "", &HeartbeatsStub{})
 	err := domains.DeleteDomain(1, "test.syncloud.it")
 
 	assert.Nil(t, err)
@@ -356,7 +383,7 @@ func TestDeleteDomain_Premium_DeleteRecordsAndHostedZone(t *testing.T) {
 	db := &DomainsDbStub{found: true, userId: 1, hostedZoneId: "1"}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "2", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "2", &DetectorStub{}, "", &HeartbeatsStub{})
 	err := domains.DeleteDomain(1, "test.com")
 
 	assert.Nil(t, err)
@@ -371,7 +398,7 @@ func TestDeleteDomain_Premium_DeleteRecordsAndHostedZone_IgnoreNoSuchHostedZoneE
 	db := &DomainsDbStub{found: true, userId: 1, hostedZoneId: "1"}
 	dnsStub := &DnsStub{error: awserr.New(route53.ErrCodeNoSuchHostedZone, "not found", nil)}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "2", &DetectorStub{}, "")
+	domains := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "2", &DetectorStub{}, "", &HeartbeatsStub{})
 	err := domains.DeleteDomain(1, "test.com")
 
 	assert.Nil(t, err)
@@ -386,7 +413,7 @@ func TestGetDomains_Free_NoNameServers(t *testing.T) {
 	db := &DomainsDbStub{found: true, userId: 1, hostedZoneId: "1"}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "1", &DetectorStub{}, "")
+	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "1", &DetectorStub{}, "", &HeartbeatsStub{})
 	domains, err := domainService.GetDomains(&model.User{Id: 1})
 
 	assert.Nil(t, err)
@@ -397,7 +424,7 @@ func TestGetDomains_Premium_NameServers(t *testing.T) {
 	db := &DomainsDbStub{found: true, userId: 1, hostedZoneId: "1"}
 	dnsStub := &DnsStub{}
 	users := &DomainsUsersStub{authenticated: true, userId: 1}
-	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "2", &DetectorStub{}, "")
+	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "2", &DetectorStub{}, "", &HeartbeatsStub{})
 	domains, err := domainService.GetDomains(&model.User{Id: 1})
 
 	assert.Nil(t, err)
@@ -414,7 +441,7 @@ func TestDomains_Update_Ipv6_Changed(t *testing.T) {
 	webLocalPort := 443
 	webProtocol := "https"
 	detector := &DetectorStub{changed: true}
-	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "2", detector, "")
+	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "2", detector, "", &HeartbeatsStub{})
 	domain, err := domainService.Update(model.DomainUpdateRequest{
 		MapLocalAddress: false,
 		WebLocalPort:    &webLocalPort,
@@ -441,7 +468,7 @@ func TestDomains_Update_LockedUser_Error(t *testing.T) {
 	webLocalPort := 443
 	webProtocol := "https"
 	detector := &DetectorStub{changed: true}
-	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "2", detector, "")
+	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "2", detector, "", &HeartbeatsStub{})
 	_, err := domainService.Update(model.DomainUpdateRequest{
 		MapLocalAddress: false,
 		WebLocalPort:    &webLocalPort,
@@ -463,7 +490,7 @@ func updateWithMailRelay(db *DomainsDbStub, mailRelay bool) (*model.Domain, erro
 	webLocalPort := 443
 	webProtocol := "https"
 	detector := &DetectorStub{changed: true}
-	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "1", detector, "")
+	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "1", detector, "", &HeartbeatsStub{})
 	return domainService.Update(model.DomainUpdateRequest{
 		WebLocalPort: &webLocalPort,
 		WebProtocol:  &webProtocol,
@@ -481,7 +508,7 @@ func updateRelayWithoutAddressChange(db *DomainsDbStub, relay bool) *DnsStub {
 	webLocalPort := 443
 	webProtocol := "https"
 	db.ip = &requestIp
-	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "1", change.New(), "")
+	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "1", change.New(), "", &HeartbeatsStub{})
 	_, _ = domainService.Update(model.DomainUpdateRequest{
 		WebLocalPort: &webLocalPort,
 		WebProtocol:  &webProtocol,
@@ -515,3 +542,73 @@ func TestDomains_Update_UnchangedRelayLeavesDnsAlone(t *testing.T) {
 
 	assert.False(t, dnsStub.updated)
 }
+
+func heartbeatUpdate(db *DomainsDbStub, changed bool, mailRelay bool) (*DnsStub, *HeartbeatsStub) {
+	dnsStub := &DnsStub{}
+	heartbeats := &HeartbeatsStub{}
+	users := &DomainsUsersStub{authenticated: true, userId: 1}
+	token := "123"
+	requestIp := "10.0.0.1"
+	webLocalPort := 443
+	webProtocol := "https"
+	platformVersion := "25.09"
+	domainService := NewDomains(dnsStub, db, users, metrics.New(), "syncloud.it", "1", &DetectorStub{changed: changed}, "", heartbeats)
+	_, _ = domainService.Update(model.DomainUpdateRequest{
+		WebLocalPort:    &webLocalPort,
+		WebProtocol:     &webProtocol,
+		PlatformVersion: &platformVersion,
+		Token:           &token,
+		Ipv4Enabled:     true,
+		MailRelay:       mailRelay,
+	}, &requestIp)
+	return dnsStub, heartbeats
+}
+
+func TestDomains_Update_UnchangedIsBuffered(t *testing.T) {
+	db := &DomainsDbStub{found: true, userId: 1, hostedZoneId: "1"}
+
+	dnsStub, heartbeats := heartbeatUpdate(db, false, false)
+
+	assert.False(t, db.updated)
+	assert.False(t, dnsStub.updated)
+	assert.Len(t, heartbeats.added, 1)
+	assert.Equal(t, "25.09", *heartbeats.added[0].PlatformVersion)
+	assert.Equal(t, 443, *heartbeats.added[0].WebLocalPort)
+}
+
+func TestDomains_Update_ChangedIsWritten(t *testing.T) {
+	db := &DomainsDbStub{found: true, userId: 1, hostedZoneId: "1"}
+
+	dnsStub, heartbeats := heartbeatUpdate(db, true, false)
+
+	assert.True(t, db.updated)
+	assert.True(t, dnsStub.updated)
+	assert.Empty(t, heartbeats.added)
+}
+
+func TestDomains_Update_MailRelayChangeIsWritten(t *testing.T) {
+	db := &DomainsDbStub{found: true, userId: 1, hostedZoneId: "1"}
+
+	_, heartbeats := heartbeatUpdate(db, false, true)
+
+	assert.True(t, db.updated)
+	assert.Empty(t, heartbeats.added)
+}
+
+func TestDomains_Update_ChangeOnStaleCacheIsRefused(t *testing.T) {
+	db := &DomainsDbStub{userId: 1, hostedZoneId: "1", stale: true}
+
+	dnsStub, heartbeats := heartbeatUpdate(db, true, false)
+
+	assert.False(t, db.updated)
+	assert.False(t, dnsStub.updated, "a deleted domain must not get its records back")
+	assert.Empty(t, heartbeats.added)
+}
+
+func TestDomains_Update_UnknownTokenIsReadOnce(t *testing.T) {
+	db := &DomainsDbStub{}
+
+	heartbeatUpdate(db, false, false)
+
+	assert.Equal(t, 1, db.tokenLookups)
+}
@@ -0,0 +1,117 @@
+package service
+
+import (
+	"sort"
+	"sync"
+	"time"
+
+	"github.com/syncloud/redirect/model"
+	"go.uber.org/zap"
+)
+
+const heartbeatBatch = 500
+
+type HeartbeatsDb interface {
+	UpdateDomainHeartbeats(heartbeats []model.DomainHeartbeat) error
+}
+
+// Heartbeats buffers the heartbeats of devices whose addresses did not
+// change, keeps the latest per domain and writes them in multi-row
+// batches, at most interval after they came in. With no interval every
+// heartbeat is written right away.
+type Heartbeats struct {
+	db       HeartbeatsDb
+	interval time.Duration
+	mutex    sync.Mutex
+	pending  map[uint64]model.DomainHeartbeat
+	stop     chan struct{}
+	stopped  chan struct{}
+	logger   *zap.Logger
+}
+
+func NewHeartbeats(db HeartbeatsDb, interval time.Duration, logger *zap.Logger) *Heartbeats {
+	return &Heartbeats{
+		db:       db,
+		interval: interval,
+		pending:  map[uint64]model.DomainHeartbeat{},
+		stop:     make(chan struct{}),
+		stopped:  make(chan struct{}),
+		logger:   logger,
+	}
+}
+
+func (h *Heartbeats) Add(heartbeat model.DomainHeartbeat) error {
+	if h.interval <= 0 {
+		return h.db.UpdateDomainHeartbeats([]model.DomainHeartbeat{heartbeat})
+	}
+	h.mutex.Lock()
+	defer h.mutex.Unlock()
+	h.pending[heartbeat.DomainId] = heartbeat
+	return nil
+}
+
+func (h *Heartbeats) Start() error {
+	if h.interval <= 0 {
+		close(h.stopped)
+		return nil
+	}
+	go func() {
+		defer close(h.stopped)
+		ticker := time.NewTicker(h.interval)
+		defer ticker.Stop()
+		for {
+			select {
+			case <-ticker.C:
+			case <-h.stop:
+				h.flushLogged()
+				return
+			}
+			h.flushLogged()
+		}
+	}()
+	return nil
+}
+
+// Stop writes what is buffered and waits for it.
+func (h *Heartbeats) Stop() {
+	close(h.stop)
+	<-h.stopped
+}
+
+func (h *Heartbeats) flushLogged() {
+	if err := h.Flush(); err != nil {
+		h.logger.Error("heartbeats flush", zap.Error(err))
+	}
+}
+
+// Flush writes the buffered heartbeats. The ones a failed batch could not
+// write go back to the buffer unless a newer one came in meanwhile.
+func (h *Heartbeats) Flush() error {
+	h.mutex.Lock()
+	pending := make([]model.DomainHeartbeat, 0, len(h.pending))
+	for _, heartbeat := range h.pending {
+		pending = append(pending, heartbeat)
+	}
+	h.pending = map[uint64]model.DomainHeartbeat{}
+	h.mutex.Unlock()
+
+	sort.Slice(pending, func(i, j int) bool { return pending[i].DomainId < pending[j].DomainId })
+	for start := 0; start < len(pending); start += heartbeatBatch {
+		batch := pending[start:min(start+heartbeatBatch, len(pending))]
+		if err := h.db.UpdateDomainHeartbeats(batch); err != nil {
+			h.requeue(pending[start:])
+			return err
+		}
+	}
+	return nil
+}
+
+func (h *Heartbeats) requeue(heartbeats []model.DomainHeartbeat) {
+	h.mutex.Lock()
+	defer h.mutex.Unlock()
+	for _, heartbeat := range heartbeats {
+		if _, newer := h.pending[heartbeat.DomainId]; !newer {
+			h.pending[heartbeat.DomainId] = heartbeat
+		}
+	}
+}
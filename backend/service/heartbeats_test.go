@@ -0,0 +1,86 @@
+package service
+
+import (
+	"errors"
+	"testing"
+	"time"
+
+	"github.com/stretchr/testify/assert"
+	"github.com/syncloud/redirect/model"
+	"go.uber.org/zap"
+)
+
+type HeartbeatsDbStub struct {
+	batches [][]model.DomainHeartbeat
+	err     error
+}
+
+func (db *HeartbeatsDbStub) UpdateDomainHeartbeats(heartbeats []model.DomainHeartbeat) error {
+	if db.err != nil {
+		return db.err
+	}
+	db.batches = append(db.batches, append([]model.DomainHeartbeat(nil), heartbeats...))
+	return nil
+}
+
+func heartbeat(id uint64, seconds int64) model.DomainHeartbeat {
+	return model.DomainHeartbeat{DomainId: id, LastUpdate: time.Unix(seconds, 0)}
+}
+
+func TestHeartbeats_CoalescesPerDomain(t *testing.T) {
+	db := &HeartbeatsDbStub{}
+	heartbeats := NewHeartbeats(db, time.Hour, zap.NewNop())
+	assert.NoError(t, heartbeats.Add(heartbeat(1, 1)))
+	assert.NoError(t, heartbeats.Add(heartbeat(2, 1)))
+	assert.NoError(t, heartbeats.Add(heartbeat(1, 2)))
+	assert.Empty(t, db.batches)
+
+	assert.NoError(t, heartbeats.Flush())
+	assert.Equal(t, [][]model.DomainHeartbeat{{heartbeat(1, 2), heartbeat(2, 1)}}, db.batches)
+
+	assert.NoError(t, heartbeats.Flush())
+	assert.Len(t, db.batches, 1)
+}
+
+func TestHeartbeats_Batches(t *testing.T) {
+	db := &HeartbeatsDbStub{}
+	heartbeats := NewHeartbeats(db, time.Hour, zap.NewNop())
+	for id := uint64(1); id <= heartbeatBatch+1; id++ {
+		assert.NoError(t, heartbeats.Add(heartbeat(id, 1)))
+	}
+	assert.NoError(t, heartbeats.Flush())
+	assert.Len(t, db.batches, 2)
+	assert.Len(t, db.batches[0], heartbeatBatch)
+	assert.Len(t, db.batches[1], 1)
+}
+
+func TestHeartbeats_FailedFlushKeepsNewer(t *testing.T) {
+	db := &HeartbeatsDbStub{err: errors.New("db is down")}
+	heartbeats := NewHeartbeats(db, time.Hour, zap.NewNop())
+	assert.NoError(t, heartbeats.Add(heartbeat(1, 1)))
+	assert.NoError(t, heartbeats.Add(heartbeat(2, 1)))
+	assert.Error(t, heartbeats.Flush())
+	assert.NoError(t, heartbeats.Add(heartbeat(2, 5)))
+
+	db.err = nil
+	assert.NoError(t, heartbeats.Flush())
+	assert.Equal(t, [][]model.DomainHeartbeat{{heartbeat(1, 1), heartbeat(2, 5)}}, db.batches)
+}
+
+func TestHeartbeats_StopFlushes(t *testing.T) {
+	db := &HeartbeatsDbStub{}
+	heartbeats := NewHeartbeats(db, time.Hour, zap.NewNop())
+	assert.NoError(t, heartbeats.Start())
+	assert.NoError(t, heartbeats.Add(heartbeat(1, 1)))
+	heartbeats.Stop()
+	assert.Len(t, db.batches, 1)
+}
+
+func TestHeartbeats_NoIntervalWritesNow(t *testing.T) {
+	db := &HeartbeatsDbStub{}
+	heartbeats := NewHeartbeats(db, 0, zap.NewNop())
+	assert.NoError(t, heartbeats.Start())
+	assert.NoError(t, heartbeats.Add(heartbeat(1, 1)))
+	assert.Len(t, db.batches, 1)
+	heartbeats.Stop()
+}
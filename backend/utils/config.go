@@ -88,6 +88,27 @@ func (config *Config) GetMySqlDB() string {
 	return db
 }
 
+func (config *Config) GetTokenCacheSize() int {
+	if value, err := config.parser.GetInt64("mysql", "token_cache_size"); err == nil {
+		return int(value)
+	}
+	return 200000
+}
+
+func (config *Config) GetTokenCacheTtlSeconds() int {
+	if value, err := config.parser.GetInt64("mysql", "token_cache_ttl_seconds"); err == nil {
+		return int(value)
+	}
+	return 600
+}
+
+func (config *Config) GetHeartbeatFlushSeconds() int {
+	if value, err := config.parser.GetInt64("api", "heartbeat_flush_seconds"); err == nil {
+		return int(value)
+	}
+	return 10
+}
+
 func (config *Config) GetApiSocket() string {
 	value, err := config.parser.Get("api", "socket")
 	if err != nil {
@@ -513,6 +534,13 @@ func (config *Config) GetMailInboundMaxConcurrent() int {
 	return config.mailInboundPort("max_concurrent", 200)
 }
 
+func (config *Config) GetDnsQueueIntervalMs() int {
+	if value, err := config.parser.GetInt64("aws", "dns_queue_interval_ms"); err == nil {
+		return int(value)
+	}
+	return 1000
+}
+
 func (config *Config) AwsEndpoint() string {
 	value, err := config.parser.Get("aws", "endpoint")
 	if err != nil {
@@ -0,0 +1,48 @@
+package validation
+
+import "testing"
+
+// go test ./validation -run '^$' -bench . -benchmem
+
+func BenchmarkFieldValidator_Domain(b *testing.B) {
+	domain := "mydevice.syncloud.it"
+	b.ReportAllocs()
+	for i := 0; i < b.N; i++ {
+		New().Domain(&domain, "domain", "syncloud.it")
+	}
+}
+
+func BenchmarkFieldValidator_DomainInvalid(b *testing.B) {
+	domain := "my_dev!.syncloud.it"
+	b.ReportAllocs()
+	for i := 0; i < b.N; i++ {
+		New().Domain(&domain, "domain", "syncloud.it")
+	}
+}
+
+func BenchmarkFieldValidator_Email(b *testing.B) {
+	email := "User@Example.com"
+	b.ReportAllocs()
+	for i := 0; i < b.N; i++ {
+		New().Email(&email)
+	}
+}
+
+func BenchmarkFieldValidator_DeviceMacAddress(b *testing.B) {
+	mac := "00:11:22:33:44:55"
+	b.ReportAllocs()
+	for i := 0; i < b.N; i++ {
+		New().DeviceMacAddress(&mac)
+	}
+}
+
+func BenchmarkFieldValidator_Ip(b *testing.B) {
+	for _, ip := range []string{"192.168.1.2", "2001:db8::68"} {
+		b.Run(ip, func(b *testing.B) {
+			b.ReportAllocs()
+			for i := 0; i < b.N; i++ {
+				New().Ip(&ip, nil)
+			}
+		})
+	}
+}
@@ -1,6 +1,9 @@
 package main
 
-import "sync"
+import (
+	"context"
+	"sync"
+)
 
 const (
 	Accept = "accept"
@@ -22,24 +25,53 @@ type Mailbox struct {
 	mutex     sync.Mutex
 	messages  []Message
 	behaviour Behaviour
+	// changed is closed and replaced whenever messages changes, waking Wait
+	changed chan struct{}
 }
 
 func NewMailbox() *Mailbox {
-	return &Mailbox{behaviour: Behaviour{Rcpt: Accept, Data: Accept}}
+	return &Mailbox{behaviour: Behaviour{Rcpt: Accept, Data: Accept}, changed: make(chan struct{})}
 }
 
 func (m *Mailbox) Add(message Message) {
 	m.mutex.Lock()
 	defer m.mutex.Unlock()
 	m.messages = append(m.messages, message)
+	m.notify()
 }
 
 func (m *Mailbox) Messages() []Message {
+	messages, _ := m.Since(0)
+	return messages
+}
+
+// Since returns the messages after the first since of them, and a channel
+// that is closed on the next change.
+func (m *Mailbox) Since(since int) ([]Message, <-chan struct{}) {
 	m.mutex.Lock()
 	defer m.mutex.Unlock()
-	messages := make([]Message, len(m.messages))
-	copy(messages, m.messages)
-	return messages
+	if since < 0 || since > len(m.messages) {
+		since = len(m.messages)
+	}
+	messages := make([]Message, len(m.messages)-since)
+	copy(messages, m.messages[since:])
+	return messages, m.changed
+}
+
+// Wait blocks until there are messages after the first since of them, or
+// ctx is done, and returns them (possibly none).
+func (m *Mailbox) Wait(ctx context.Context, since int) []Message {
+	for {
+		messages, changed := m.Since(since)
+		if len(messages) > 0 {
+			return messages
+		}
+		select {
+		case <-changed:
+		case <-ctx.Done():
+			return messages
+		}
+	}
 }
 
 func (m *Mailbox) Behaviour() Behaviour {
@@ -65,4 +97,10 @@ func (m *Mailbox) Reset() {
 	defer m.mutex.Unlock()
 	m.messages = nil
 	m.behaviour = Behaviour{Rcpt: Accept, Data: Accept}
+	m.notify()
+}
+
+func (m *Mailbox) notify() {
+	close(m.changed)
+	m.changed = make(chan struct{})
 }
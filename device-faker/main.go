@@ -25,13 +25,13 @@ func main() {
 		log.Fatalf("smtp port is not a number: %v", err)
 	}
 
-	mailbox := NewMailbox()
+	namespaces := NewNamespaces()
 	tunnels := NewTunnels(*frpc, *serverAddr, *serverName, localPort, *workDir)
 
-	if err := NewSmtpServer(*smtpAddress, mailbox).Start(); err != nil {
+	if err := NewSmtpServer(*smtpAddress, namespaces).Start(); err != nil {
 		log.Fatalf("device smtp failed to start: %v", err)
 	}
-	if err := NewRest(*apiAddress, mailbox, tunnels).Start(); err != nil {
+	if err := NewRest(*apiAddress, namespaces, tunnels).Start(); err != nil {
 		log.Fatalf("device api failed to start: %v", err)
 	}
 	log.Printf("device faker smtp %s api %s", *smtpAddress, *apiAddress)
@@ -0,0 +1,61 @@
+package main
+
+import (
+	"strings"
+	"sync"
+)
+
+// Namespaces lets several test workers share one faker. Each namespace has
+// its own mailbox and behaviour, and owns the domains it opened tunnels
+// for; incoming mail is routed by the recipient's domain. The empty
+// namespace is what callers get when they do not ask for one.
+type Namespaces struct {
+	mutex     sync.Mutex
+	mailboxes map[string]*Mailbox
+	domains   map[string]string
+}
+
+func NewNamespaces() *Namespaces {
+	return &Namespaces{mailboxes: map[string]*Mailbox{}, domains: map[string]string{}}
+}
+
+func (n *Namespaces) Mailbox(namespace string) *Mailbox {
+	n.mutex.Lock()
+	defer n.mutex.Unlock()
+	mailbox, found := n.mailboxes[namespace]
+	if !found {
+		mailbox = NewMailbox()
+		n.mailboxes[namespace] = mailbox
+	}
+	return mailbox
+}
+
+func (n *Namespaces) Bind(domain string, namespace string) {
+	n.mutex.Lock()
+	defer n.mutex.Unlock()
+	n.domains[domain] = namespace
+}
+
+// Release forgets the domains bound to namespace and returns them.
+func (n *Namespaces) Release(namespace string) []string {
+	n.mutex.Lock()
+	defer n.mutex.Unlock()
+	var released []string
+	for domain, owner := range n.domains {
+		if owner == namespace {
+			released = append(released, domain)
+			delete(n.domains, domain)
+		}
+	}
+	return released
+}
+
+// ForRecipient is the mailbox of the namespace that owns the recipient's
+// domain, or the default one.
+func (n *Namespaces) ForRecipient(address string) *Mailbox {
+	domain := strings.ToLower(address[strings.LastIndex(address, "@")+1:])
+	n.mutex.Lock()
+	namespace := n.domains[domain]
+	n.mutex.Unlock()
+	return n.Mailbox(namespace)
+}
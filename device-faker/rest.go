@@ -1,9 +1,13 @@
 package main
 
 import (
+	"context"
 	"encoding/json"
 	"log"
 	"net/http"
+	"strconv"
+	"strings"
+	"time"
 )
 
 type TunnelRequest struct {
@@ -11,14 +15,16 @@ type TunnelRequest struct {
 	Token  string `json:"token"`
 }
 
+// Rest is the control api. Every endpoint takes an optional namespace
+// query parameter, see Namespaces.
 type Rest struct {
-	address string
-	mailbox *Mailbox
-	tunnels *Tunnels
+	address    string
+	namespaces *Namespaces
+	tunnels    *Tunnels
 }
 
-func NewRest(address string, mailbox *Mailbox, tunnels *Tunnels) *Rest {
-	return &Rest{address: address, mailbox: mailbox, tunnels: tunnels}
+func NewRest(address string, namespaces *Namespaces, tunnels *Tunnels) *Rest {
+	return &Rest{address: address, namespaces: namespaces, tunnels: tunnels}
 }
 
 func (r *Rest) Start() error {
@@ -35,8 +41,32 @@ func (r *Rest) Start() error {
 	return nil
 }
 
-func (r *Rest) messages(w http.ResponseWriter, _ *http.Request) {
-	respond(w, r.mailbox.Messages())
+// messages lists what the device received. since=N skips the first N
+// messages, and wait=<duration> holds the request until there is at least
+// one message after them or the duration passes.
+func (r *Rest) messages(w http.ResponseWriter, request *http.Request) {
+	query := request.URL.Query()
+	since := 0
+	if value := query.Get("since"); value != "" {
+		parsed, err := strconv.Atoi(value)
+		if err != nil || parsed < 0 {
+			http.Error(w, "since must be a non-negative integer", http.StatusBadRequest)
+			return
+		}
+		since = parsed
+	}
+	var wait time.Duration
+	if value := query.Get("wait"); value != "" {
+		parsed, err := time.ParseDuration(value)
+		if err != nil {
+			http.Error(w, err.Error(), http.StatusBadRequest)
+			return
+		}
+		wait = parsed
+	}
+	ctx, cancel := context.WithTimeout(request.Context(), wait)
+	defer cancel()
+	respond(w, r.mailbox(request).Wait(ctx, since))
 }
 
 func (r *Rest) behaviour(w http.ResponseWriter, request *http.Request) {
@@ -45,8 +75,9 @@ func (r *Rest) behaviour(w http.ResponseWriter, request *http.Request) {
 		http.Error(w, err.Error(), http.StatusBadRequest)
 		return
 	}
-	r.mailbox.SetBehaviour(behaviour)
-	respond(w, r.mailbox.Behaviour())
+	mailbox := r.mailbox(request)
+	mailbox.SetBehaviour(behaviour)
+	respond(w, mailbox.Behaviour())
 }
 
 func (r *Rest) tunnel(w http.ResponseWriter, request *http.Request) {
@@ -55,17 +86,28 @@ func (r *Rest) tunnel(w http.ResponseWriter, request *http.Request) {
 		http.Error(w, err.Error(), http.StatusBadRequest)
 		return
 	}
+	tunnel.Domain = strings.ToLower(tunnel.Domain)
 	if err := r.tunnels.Start(tunnel.Domain, tunnel.Token); err != nil {
 		http.Error(w, err.Error(), http.StatusBadGateway)
 		return
 	}
+	r.namespaces.Bind(tunnel.Domain, namespace(request))
 	respond(w, tunnel)
 }
 
-func (r *Rest) reset(w http.ResponseWriter, _ *http.Request) {
-	r.tunnels.StopAll()
-	r.mailbox.Reset()
-	respond(w, r.mailbox.Messages())
+func (r *Rest) reset(w http.ResponseWriter, request *http.Request) {
+	r.tunnels.Stop(r.namespaces.Release(namespace(request))...)
+	mailbox := r.mailbox(request)
+	mailbox.Reset()
+	respond(w, mailbox.Messages())
+}
+
+func (r *Rest) mailbox(request *http.Request) *Mailbox {
+	return r.namespaces.Mailbox(namespace(request))
+}
+
+func namespace(request *http.Request) string {
+	return request.URL.Query().Get("namespace")
 }
 
 func respond(w http.ResponseWriter, body interface{}) {
@@ -11,6 +11,7 @@ import (
 var ErrConnectionDropped = errors.New("connection dropped on purpose")
 
 type Session struct {
+	namespaces *Namespaces
 	mailbox    *Mailbox
 	connection net.Conn
 	recipients []string
@@ -21,6 +22,9 @@ func (s *Session) Mail(_ string, _ *smtp.MailOptions) error {
 }
 
 func (s *Session) Rcpt(to string, _ *smtp.RcptOptions) error {
+	if s.mailbox == nil {
+		s.mailbox = s.namespaces.ForRecipient(to)
+	}
 	if s.mailbox.Behaviour().Rcpt == Reject {
 		return &smtp.SMTPError{
 			Code:         550,
@@ -53,6 +57,7 @@ func (s *Session) Data(reader io.Reader) error {
 }
 
 func (s *Session) Reset() {
+	s.mailbox = nil
 	s.recipients = nil
 }
 
@@ -11,9 +11,9 @@ type SmtpServer struct {
 	server *smtp.Server
 }
 
-func NewSmtpServer(address string, mailbox *Mailbox) *SmtpServer {
+func NewSmtpServer(address string, namespaces *Namespaces) *SmtpServer {
 	server := smtp.NewServer(smtp.BackendFunc(func(c *smtp.Conn) (smtp.Session, error) {
-		return &Session{mailbox: mailbox, connection: c.Conn()}, nil
+		return &Session{namespaces: namespaces, connection: c.Conn()}, nil
 	}))
 	server.Addr = address
 	server.Domain = "device.faker"
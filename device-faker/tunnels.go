@@ -101,10 +101,14 @@ func (t *Tunnels) Start(domain string, token string) error {
 	}
 }
 
-func (t *Tunnels) StopAll() {
+func (t *Tunnels) Stop(domains ...string) {
 	t.mutex.Lock()
 	defer t.mutex.Unlock()
-	for domain, command := range t.running {
+	for _, domain := range domains {
+		command, found := t.running[domain]
+		if !found {
+			continue
+		}
 		_ = command.Process.Kill()
 		_ = command.Wait()
 		delete(t.running, domain)
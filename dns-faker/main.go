@@ -144,21 +144,27 @@ func (s *Store) ServeDNS(w dns.ResponseWriter, req *dns.Msg) {
 }
 
 type changeRequest struct {
-	XMLName xml.Name `xml:"ChangeResourceRecordSetsRequest"`
-	Changes []struct {
-		Action            string `xml:"Action"`
-		ResourceRecordSet struct {
-			Name   string   `xml:"Name"`
-			Type   string   `xml:"Type"`
-			Values []string `xml:"ResourceRecords>ResourceRecord>Value"`
-		} `xml:"ResourceRecordSet"`
-	} `xml:"ChangeBatch>Changes>Change"`
+	XMLName xml.Name       `xml:"ChangeResourceRecordSetsRequest"`
+	Changes []recordChange `xml:"ChangeBatch>Changes>Change"`
+}
+
+type recordChange struct {
+	Action            string `xml:"Action"`
+	ResourceRecordSet struct {
+		Name   string   `xml:"Name"`
+		Type   string   `xml:"Type"`
+		Values []string `xml:"ResourceRecords>ResourceRecord>Value"`
+	} `xml:"ResourceRecordSet"`
 }
 
 const xmlns = "https://route53.amazonaws.com/doc/2013-04-01/"
 
 type API struct {
 	store *Store
+	mu    sync.Mutex
+	// change requests left to reject the way Route53 does when throttling,
+	// by the domain they touch, so parallel tests do not throttle each other
+	throttle map[string]int64
 }
 
 func (a *API) ServeHTTP(w http.ResponseWriter, r *http.Request) {
@@ -179,6 +185,8 @@ func (a *API) ServeHTTP(w http.ResponseWriter, r *http.Request) {
 		a.listZones(w)
 	case path == "/faker/mx":
 		a.mxRecords(w)
+	case path == "/faker/throttle":
+		a.setThrottle(w, r)
 	case path == "/" || strings.Contains(path, "health"):
 		w.WriteHeader(http.StatusOK)
 		_, _ = io.WriteString(w, "ok")
@@ -193,6 +201,42 @@ func (a *API) mxRecords(w http.ResponseWriter) {
 	_ = json.NewEncoder(w).Encode(a.store.AllMX())
 }
 
+func (a *API) setThrottle(w http.ResponseWriter, r *http.Request) {
+	count, err := strconv.ParseInt(r.URL.Query().Get("count"), 10, 64)
+	if err != nil {
+		http.Error(w, err.Error(), http.StatusBadRequest)
+		return
+	}
+	name := recordDomain(r.URL.Query().Get("name"))
+	if name == "" {
+		http.Error(w, "name is required", http.StatusBadRequest)
+		return
+	}
+	a.mu.Lock()
+	a.throttle[name] = count
+	a.mu.Unlock()
+	w.WriteHeader(http.StatusOK)
+}
+
+// throttled takes one rejection from the first throttled domain the
+// changes touch, a record of a domain being its own or a wildcard one.
+func (a *API) throttled(changes []recordChange) bool {
+	a.mu.Lock()
+	defer a.mu.Unlock()
+	for _, c := range changes {
+		name := recordDomain(strings.TrimPrefix(c.ResourceRecordSet.Name, "*."))
+		if a.throttle[name] > 0 {
+			a.throttle[name]--
+			return true
+		}
+	}
+	return false
+}
+
+func recordDomain(name string) string {
+	return strings.ToLower(strings.TrimSuffix(name, "."))
+}
+
 func splitMX(value string) (uint16, string) {
 	fields := strings.Fields(value)
 	if len(fields) != 2 {
@@ -237,6 +281,14 @@ func (a *API) change(w http.ResponseWriter, r *http.Request) {
 		http.Error(w, err.Error(), http.StatusBadRequest)
 		return
 	}
+	if a.throttled(req.Changes) {
+		w.Header().Set("Content-Type", "application/xml")
+		w.WriteHeader(http.StatusBadRequest)
+		_, _ = io.WriteString(w, `<?xml version="1.0" encoding="UTF-8"?><ErrorResponse xmlns="`+xmlns+`">`+
+			`<Error><Type>Sender</Type><Code>Throttling</Code><Message>Rate exceeded</Message></Error>`+
+			`<RequestId>throttled</RequestId></ErrorResponse>`)
+		return
+	}
 	for _, c := range req.Changes {
 		rr := c.ResourceRecordSet
 		switch rr.Type {
@@ -297,7 +349,7 @@ func main() {
 
 	apiAddr := env("DNSSIM_API", ":4566")
 	log.Printf("dns-faker: route53 api on %s, dns on %s", apiAddr, dnsAddr)
-	if err := http.ListenAndServe(apiAddr, &API{store: store}); err != nil {
+	if err := http.ListenAndServe(apiAddr, &API{store: store, throttle: map[string]int64{}}); err != nil {
 		log.Fatal(err)
 	}
 }
@@ -26,21 +26,30 @@ type Behaviour struct {
 type Store struct {
 	mutex     sync.Mutex
 	messages  []Message
+	sent      int
 	behaviour Behaviour
+	// discard accepts and counts messages without keeping them, for load
+	// tests that would otherwise hold every body in memory
+	discard bool
 }
 
-func NewStore() *Store {
-	return &Store{behaviour: Behaviour{Status: 200}}
+func NewStore(discard bool) *Store {
+	return &Store{behaviour: Behaviour{Status: 200}, discard: discard}
 }
 
-func (s *Store) Add(message Message) Behaviour {
+// Add records the message and returns the behaviour it was met with and
+// how many messages have been accepted so far.
+func (s *Store) Add(message Message) (Behaviour, int) {
 	s.mutex.Lock()
 	defer s.mutex.Unlock()
 	if s.behaviour.Status != 200 {
-		return s.behaviour
+		return s.behaviour, s.sent
 	}
-	s.messages = append(s.messages, message)
-	return s.behaviour
+	s.sent++
+	if !s.discard {
+		s.messages = append(s.messages, message)
+	}
+	return s.behaviour, s.sent
 }
 
 func (s *Store) Messages() []Message {
@@ -62,6 +71,7 @@ func (s *Store) Reset() {
 	s.mutex.Lock()
 	defer s.mutex.Unlock()
 	s.messages = nil
+	s.sent = 0
 	s.behaviour = Behaviour{Status: 200}
 }
 
@@ -138,14 +148,14 @@ func (a *API) ses(w http.ResponseWriter, r *http.Request) {
 		}
 	}
 
-	behaviour := a.store.Add(message)
+	behaviour, sent := a.store.Add(message)
 	if behaviour.Status != 200 {
 		a.fail(w, behaviour.Status, behaviour.Code, behaviour.Message)
 		return
 	}
 
 	response := sendRawEmailResponse{}
-	response.Result.MessageId = fmt.Sprintf("faker-%d", len(a.store.Messages()))
+	response.Result.MessageId = fmt.Sprintf("faker-%d", sent)
 	w.Header().Set("Content-Type", "text/xml")
 	_ = xml.NewEncoder(w).Encode(response)
 }
@@ -173,7 +183,8 @@ func env(name string, fallback string) string {
 func main() {
 	address := env("SESSIM_ADDR", ":4579")
 	log.Printf("ses faker listening on %s", address)
-	if err := http.ListenAndServe(address, &API{store: NewStore()}); err != nil {
+	store := NewStore(os.Getenv("SESSIM_DISCARD") != "")
+	if err := http.ListenAndServe(address, &API{store: store}); err != nil {
 		log.Fatal(err)
 	}
 }
@@ -1,9 +1,9 @@
 import json
-import requests
+import client
 
 
-def domain_acquire(hostname, domain, email, password):
-    acquire_data = {
+def domain_acquire_data(domain, email, password):
+    return {
         'domain': domain,
         'email': email,
         'password': password,
@@ -11,17 +11,21 @@ def domain_acquire(hostname, domain, email, password):
         'device_name': 'some-device',
         'device_title': 'Some Device',
     }
-    response = requests.post('https://api.{0}/domain/acquire_v2'.format(hostname),
-                             json=acquire_data,
-                             verify=False)
+
+
+def domain_acquire(hostname, domain, email, password):
+    acquire_data = domain_acquire_data(domain, email, password)
+    response = client.post('https://api.{0}/domain/acquire_v2'.format(hostname),
+                           json=acquire_data,
+                           verify=False)
     acquire_response = json.loads(response.text)
     assert acquire_response['success'], response.text
     assert acquire_response['data']['update_token'], response.text
     return acquire_response['data']['update_token']
 
 
-def domain_update(domain, update_token, ip, platform_version='1'):
-    update_data = {
+def domain_update_data(update_token, ip, platform_version='1'):
+    return {
         'token': update_token,
         'ip': ip,
         'web_protocol': 'https',
@@ -29,5 +33,9 @@ def domain_update(domain, update_token, ip, platform_version='1'):
         'web_local_port': 80,
         'platform_version': platform_version
     }
-    return requests.post('https://api.{0}/domain/update'.format(domain), json=update_data,
-                         verify=False)
+
+
+def domain_update(domain, update_token, ip, platform_version='1'):
+    update_data = domain_update_data(update_token, ip, platform_version)
+    return client.post('https://api.{0}/domain/update'.format(domain), json=update_data,
+                       verify=False)
@@ -0,0 +1,56 @@
+from http import cookiejar
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class NoCookies(cookiejar.DefaultCookiePolicy):
+    # The shared sessions stand in for one-off requests.get/post calls, so
+    # they must not carry a login from one test into the next. Tests that
+    # need a cookie still get it on response.cookies or pass cookies=.
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+class Client:
+    """One keep-alive requests.Session per scheme://host[:port]."""
+
+    def __init__(self, pool_size=10):
+        self.pool_size = pool_size
+        self.sessions = {}
+
+    def session(self, url):
+        key = urlsplit(url)[:2]
+        session = self.sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            session.cookies.set_policy(NoCookies())
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('{0}://'.format(key[0]), adapter)
+            self.sessions[key] = session
+        return session
+
+    def request(self, method, url, **kwargs):
+        return self.session(url).request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+
+default = Client()
+get = default.get
+post = default.post
+delete = default.delete
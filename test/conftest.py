@@ -3,6 +3,9 @@ from os.path import dirname
 from syncloudlib.integration.conftest import *
 from syncloudlib.integration.hosts import add_host_alias
 
+import client
+import worker
+
 DIR = dirname(__file__)
 
 
@@ -14,3 +17,15 @@ def project_dir():
 @pytest.fixture(scope="session", autouse=True)
 def host_aliases(device_host, domain):
     add_host_alias('api', device_host, domain)
+
+
+@pytest.fixture(scope="session")
+def worker_name():
+    # namespace for the shared mailbox and device faker, one per xdist worker
+    return worker.name()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def http_client():
+    yield client.default
+    client.default.close()
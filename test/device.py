@@ -1,35 +1,50 @@
 import time
 
-import requests
+import client
 
 
 class Device:
+    """device-faker control api, scoped to one namespace.
 
-    def __init__(self, host):
+    Tunnels opened here, and mail to their domains, only show up in this
+    namespace, so parallel test workers can share a faker.
+    """
+
+    def __init__(self, host, namespace=''):
         self.url = 'http://{0}:4580/faker'.format(host)
+        self.namespace = namespace
 
     def reset(self):
-        response = requests.post('{0}/reset'.format(self.url), timeout=60)
+        response = client.post('{0}/reset'.format(self.url),
+                               params={'namespace': self.namespace}, timeout=60)
         assert response.status_code == 200, response.text
 
     def tunnel(self, domain_name, update_token):
-        response = requests.post('{0}/tunnel'.format(self.url),
-                                 json={'domain': domain_name, 'token': update_token},
-                                 timeout=60)
+        response = client.post('{0}/tunnel'.format(self.url),
+                               params={'namespace': self.namespace},
+                               json={'domain': domain_name, 'token': update_token},
+                               timeout=60)
         assert response.status_code == 200, response.text
 
     def behaviour(self, rcpt='accept', data='accept'):
-        response = requests.post('{0}/behaviour'.format(self.url),
-                                 json={'rcpt': rcpt, 'data': data}, timeout=30)
+        response = client.post('{0}/behaviour'.format(self.url),
+                               params={'namespace': self.namespace},
+                               json={'rcpt': rcpt, 'data': data}, timeout=30)
         assert response.status_code == 200, response.text
 
-    def messages(self, expected=1, attempts=30):
+    def messages(self, expected=1, timeout=30):
+        # long-poll for whatever arrived after what we already have, so this
+        # returns as soon as the expected message is delivered
         messages = []
-        for _ in range(attempts):
-            response = requests.get('{0}/messages'.format(self.url), timeout=30)
+        deadline = time.monotonic() + timeout
+        while len(messages) < expected:
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                break
+            response = client.get('{0}/messages'.format(self.url),
+                                  params={'namespace': self.namespace, 'since': len(messages),
+                                          'wait': '{0:.3f}s'.format(wait)},
+                                  timeout=wait + 30)
             assert response.status_code == 200, response.text
-            messages = response.json()
-            if len(messages) >= expected:
-                return messages
-            time.sleep(1)
+            messages += response.json()
         return messages
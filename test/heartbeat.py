@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Heartbeat load driver for /domain/update.
+
+Acquires --domains domains for one active user through api.domain_acquire,
+then replays device heartbeats built by api.domain_update_data at --rate
+requests/s for --duration seconds. A --changed fraction of them moves the
+domain to a new IPv4 address, so they go through change detection and the
+DNS update; the rest repeat the last address, like a device whose IP is
+stable.
+
+Meant for the local docker stack, where the api talks to dns-faker instead
+of Route53 (aws endpoint in config/env/integration). Latency is measured
+from each heartbeat's scheduled send time, so a backed-up server shows up
+in the percentiles instead of silently lowering the rate.
+
+Usage:
+  python3 heartbeat.py --domain syncloud.test --email user@syncloud.test
+                       --password pass123456 [--create-user]
+                       [--domains 100] [--rate 50] [--duration 60]
+                       [--changed 0.05] [--max-outstanding 200]
+"""
+
+import argparse
+import asyncio
+import collections
+import random
+import time
+
+import aiohttp
+import requests
+
+import api
+import client
+import smtp
+
+
+def create_user(domain, email, password):
+    smtp.clear()
+    response = client.post('https://www.{0}/api/user/create'.format(domain),
+                           json={'email': email, 'password': password}, verify=False)
+    assert response.status_code == 200, response.text
+    activate_token = smtp.get_token(smtp.emails(predicate=smtp.to(email))[0])
+    response = client.post('https://www.{0}/api/user/activate'.format(domain),
+                           json={'token': activate_token}, verify=False)
+    assert response.status_code == 200, response.text
+    smtp.clear()
+
+
+def random_ip(rng):
+    return '10.{0}.{1}.{2}'.format(rng.randrange(256), rng.randrange(256), rng.randrange(1, 255))
+
+
+class Stats:
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = collections.Counter()
+        self.changed = 0
+
+    def percentile(self, p):
+        ordered = sorted(self.latencies)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def report(self, elapsed):
+        total = len(self.latencies)
+        failed = sum(self.errors.values())
+        print('heartbeats: {0} in {1:.1f}s ({2:.1f}/s), {3} with a changed ip'.format(
+            total, elapsed, total / elapsed if elapsed else 0, self.changed))
+        for p in (50, 95, 99):
+            print('  p{0}: {1:.1f} ms'.format(p, self.percentile(p) * 1000))
+        print('  errors: {0} ({1:.2%})'.format(failed, failed / total if total else 0))
+        for error, count in self.errors.most_common():
+            print('    {0}: {1}'.format(error, count))
+
+
+async def heartbeat(session, url, payload, scheduled, stats):
+    error = None
+    try:
+        async with session.post(url, json=payload) as response:
+            body = await response.json(content_type=None)
+            if response.status != 200:
+                error = 'http {0}'.format(response.status)
+            elif not body.get('success'):
+                error = body.get('message', 'success=false')
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        error = type(e).__name__
+    stats.latencies.append(time.monotonic() - scheduled)
+    if error:
+        stats.errors[error] += 1
+
+
+async def run(args, tokens):
+    rng = random.Random(args.seed)
+    ips = {token: random_ip(rng) for token in tokens}
+    url = 'https://api.{0}/domain/update'.format(args.domain)
+    stats = Stats()
+    outstanding = asyncio.Semaphore(args.max_outstanding)
+    connector = aiohttp.TCPConnector(ssl=False, limit=args.max_outstanding)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+
+    async def send(payload, scheduled):
+        try:
+            await heartbeat(session, url, payload, scheduled, stats)
+        finally:
+            outstanding.release()
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        # Seed every domain with its first address so that "unchanged"
+        # heartbeats really are unchanged.
+        await asyncio.gather(*[
+            heartbeat(session, url, dict(api.domain_update_data(token, ips[token]), ipv4_enabled=True),
+                      time.monotonic(), Stats())
+            for token in tokens
+        ])
+
+        tasks = []
+        start = time.monotonic()
+        count = int(args.rate * args.duration)
+        for i in range(count):
+            scheduled = start + i / args.rate
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            token = tokens[i % len(tokens)]
+            if rng.random() < args.changed:
+                ips[token] = random_ip(rng)
+                stats.changed += 1
+            payload = dict(api.domain_update_data(token, ips[token]), ipv4_enabled=True)
+            await outstanding.acquire()
+            tasks.append(asyncio.ensure_future(send(payload, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - start
+    stats.report(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--domain', default='syncloud.test')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--create-user', action='store_true',
+                        help='register and activate the user through MailHog first')
+    parser.add_argument('--domains', type=int, default=100)
+    parser.add_argument('--prefix', default='heartbeat')
+    parser.add_argument('--rate', type=float, default=50, help='heartbeats per second')
+    parser.add_argument('--duration', type=float, default=60, help='seconds')
+    parser.add_argument('--changed', type=float, default=0.05,
+                        help='fraction of heartbeats with a new ip')
+    parser.add_argument('--max-outstanding', type=int, default=200)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    requests.packages.urllib3.disable_warnings()
+    if args.create_user:
+        create_user(args.domain, args.email, args.password)
+    tokens = [
+        api.domain_acquire(args.domain, '{0}-{1}.{2}'.format(args.prefix, i, args.domain),
+                           args.email, args.password)
+        for i in range(args.domains)
+    ]
+    asyncio.run(run(args, tokens))
+
+
+if __name__ == '__main__':
+    main()
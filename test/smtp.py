@@ -7,31 +7,130 @@ import re
 
 import requests
 
+import client
+import worker
 
-def emails(artifact_dir=None):
-    attempts = 1
-    while attempts < 10:
-        results = try_emails(artifact_dir)
-        if len(results) > 0:
-            return results
-        attempts += 1
-        time.sleep(1)
-    return []
+MAILHOG = 'http://mail:8025'
 
 
-def try_emails(artifact_dir):
-    response = requests.get('http://mail:8025/api/v1/messages')
-    assert response.status_code == 200, response.text
-    if artifact_dir:
-        with open(join(artifact_dir, 'mails-{}.log'.format(datetime.datetime.now().microsecond)), 'w') as f:
-            f.write(str(response.text))
+class Mailbox:
+    """Incremental view of the MailHog inbox.
 
-    return [quopri.decodestring(message['Content']['Body']).decode("utf-8") for message in json.loads(response.text)]
+    Messages are fetched once and remembered by ID; waiting blocks on
+    MailHog's /api/v1/events stream instead of re-downloading the inbox
+    on a timer, and falls back to short polls if the stream is missing.
+
+    A shared mailbox is read by several test workers at once, so clear()
+    only hides what is there now instead of deleting it for everyone.
+    """
+
+    def __init__(self, url=MAILHOG, shared=False):
+        self.url = url
+        self.shared = shared
+        self.messages = {}
+        self.cleared = set()
+
+    def refresh(self, artifact_dir=None):
+        # v2 lists newest first, so stop paging at the first known message
+        new = []
+        start = 0
+        while True:
+            response = client.get('{0}/api/v2/messages'.format(self.url),
+                                  params={'start': start, 'limit': 50})
+            assert response.status_code == 200, response.text
+            page = response.json()
+            items = page['items'] or []
+            fresh = [m for m in items if m['ID'] not in self.messages and m['ID'] not in self.cleared]
+            new.extend(fresh)
+            start += len(items)
+            if len(fresh) < len(items) or start >= page['total'] or not items:
+                break
+        for message in reversed(new):
+            self.add(message)
+        if artifact_dir and new:
+            with open(join(artifact_dir, 'mails-{}.log'.format(datetime.datetime.now().microsecond)), 'w') as f:
+                f.write(json.dumps(new))
+
+    def add(self, message):
+        if message['ID'] not in self.cleared:
+            self.messages.setdefault(message['ID'], message)
+
+    def newest_first(self):
+        return list(reversed(self.messages.values()))
+
+    def matching(self, predicate):
+        return [m for m in self.newest_first() if predicate(m)]
+
+    def wait(self, predicate, timeout=10, artifact_dir=None):
+        """Return the messages matching predicate, waiting up to timeout for one."""
+        deadline = time.monotonic() + timeout
+        try:
+            # subscribe before looking, so nothing lands in between
+            with client.get('{0}/api/v1/events'.format(self.url), stream=True,
+                            timeout=(5, timeout)) as events:
+                self.refresh(artifact_dir)
+                if self.matching(predicate) or events.status_code != 200:
+                    return self.matching(predicate) or self.poll(predicate, deadline, artifact_dir)
+                for line in events.iter_lines(chunk_size=None):
+                    if line.startswith(b'data:'):
+                        message = json.loads(line[5:])
+                        if isinstance(message, dict) and 'ID' in message:
+                            self.add(message)
+                        if self.matching(predicate):
+                            break
+                    if time.monotonic() >= deadline:
+                        break
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            # a read timeout mid-stream surfaces as ConnectionError
+            pass
+        self.refresh(artifact_dir)
+        return self.matching(predicate) or self.poll(predicate, deadline, artifact_dir)
+
+    def poll(self, predicate, deadline, artifact_dir):
+        while time.monotonic() < deadline:
+            time.sleep(0.2)
+            self.refresh(artifact_dir)
+            if self.matching(predicate):
+                break
+        return self.matching(predicate)
+
+    def clear(self):
+        if self.shared:
+            self.refresh()
+            self.cleared.update(self.messages)
+        else:
+            response = client.delete('{0}/api/v1/messages'.format(self.url))
+            assert response.status_code == 200, response.text
+        self.messages.clear()
+
+
+mailbox = Mailbox(shared=worker.parallel())
+
+
+def to(address):
+    # envelope recipients, so Bcc and multi-recipient mail match as well
+    return lambda message: any(address.lower() == r.lower()
+                               for r in message['Raw']['To'])
+
+
+def subject(text):
+    return lambda message: any(text in s for s in message['Content']['Headers'].get('Subject', []))
+
+
+def body(message):
+    return quopri.decodestring(message['Content']['Body']).decode("utf-8")
+
+
+def emails(artifact_dir=None, predicate=lambda message: True, timeout=10):
+    """Bodies of the messages matching predicate, newest first.
+
+    Waits up to timeout for the first one; returns [] if none arrives.
+    """
+    return [body(message) for message in mailbox.wait(predicate, timeout, artifact_dir)]
 
 
 def clear():
-    response = requests.delete('http://mail:8025/api/v1/messages')
-    assert response.status_code == 200, response.text
+    mailbox.clear()
 
 
 def get_token(body):
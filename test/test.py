@@ -18,6 +18,8 @@ from syncloudlib.integration.ssh import run_ssh, run_scp
 
 import smtp
 import api
+import client
+import worker
 from device import Device
 
 DIR = dirname(__file__)
@@ -33,8 +35,8 @@ def server_logs(request, device_host, artifact_dir):
 
 
 def get_domain(update_token, domain):
-    response = requests.get('https://api.{0}/domain/get'.format(domain),
-                            params={'token': update_token}, verify=False)
+    response = client.get('https://api.{0}/domain/get'.format(domain),
+                          params={'token': update_token}, verify=False)
     assert response.status_code == 200
     assert response.text is not None
     response_data = json.loads(response.text)
@@ -42,31 +44,31 @@ def get_domain(update_token, domain):
 
 
 def test_unauthenticated(domain):
-    response = requests.get('https://www.{0}/api/user'.format(domain), allow_redirects=False, verify=False)
+    response = client.get('https://www.{0}/api/user'.format(domain), allow_redirects=False, verify=False)
     assert response.headers['Content-Type'] == 'application/json'
     assert response.status_code == 401, response.text
 
 
 def test_user_create_special_symbols_in_password(domain):
     email = 'symbols_in_password@mail.com'
-    response = requests.post('https://www.{0}/api/user/create'.format(domain),
-                             json={'email': email, 'password': r'pass12& ^%"'},
-                             verify=False)
+    response = client.post('https://www.{0}/api/user/create'.format(domain),
+                           json={'email': email, 'password': r'pass12& ^%"'},
+                           verify=False)
     assert response.status_code == 200, response.text
-    assert len(smtp.emails()) == 1
+    assert len(smtp.emails(predicate=smtp.to(email))) == 1
     smtp.clear()
 
 
 def create_user(domain, email, password, artifact_dir):
     smtp.clear()
-    response = requests.post('https://www.{0}/api/user/create'.format(domain),
-                             json={'email': email, 'password': password}, verify=False)
+    response = client.post('https://www.{0}/api/user/create'.format(domain),
+                           json={'email': email, 'password': password}, verify=False)
     assert response.status_code == 200, response.text
 
-    activate_user(domain, artifact_dir)
-    response = requests.get('https://api.{0}/user/get'.format(domain),
-                            params={'email': email, 'password': password},
-                            verify=False)
+    activate_user(domain, email, artifact_dir)
+    response = client.get('https://api.{0}/user/get'.format(domain),
+                          params={'email': email, 'password': password},
+                          verify=False)
     assert response.status_code == 200, response.text
 
     response_data = json.loads(response.text)
@@ -79,39 +81,40 @@ def create_user(domain, email, password, artifact_dir):
 def test_create_user_api_for_mobile_app(domain, artifact_dir):
     email = 'mobile_create_user@syncloud.test'
     password = 'pass123456'
-    response = requests.post('https://api.{0}/user/create'.format(domain),
-                             data={'email': email, 'password': password}, verify=False)
+    response = client.post('https://api.{0}/user/create'.format(domain),
+                           data={'email': email, 'password': password}, verify=False)
     assert response.status_code == 200, response.text
 
-    activate_user(domain, artifact_dir)
+    activate_user(domain, email, artifact_dir)
 
-    response = requests.get('https://api.{0}/user/get'.format(domain),
-                            params={'email': email, 'password': password},
-                            verify=False)
+    response = client.get('https://api.{0}/user/get'.format(domain),
+                          params={'email': email, 'password': password},
+                          verify=False)
     assert response.status_code == 200, response.text
 
 
 def test_create_user_api_for_mobile_app_v2(domain, artifact_dir):
     email = 'mobile_create_user_v2@syncloud.test'
     password = 'pass123456'
-    response = requests.post('https://api.{0}/user/create_v2'.format(domain),
-                             json={'email': email, 'password': password}, verify=False)
+    response = client.post('https://api.{0}/user/create_v2'.format(domain),
+                           json={'email': email, 'password': password}, verify=False)
     assert response.status_code == 200, response.text
 
-    activate_user(domain, artifact_dir)
+    activate_user(domain, email, artifact_dir)
 
-    response = requests.get('https://api.{0}/user/get'.format(domain),
-                            params={'email': email, 'password': password},
-                            verify=False)
+    response = client.get('https://api.{0}/user/get'.format(domain),
+                          params={'email': email, 'password': password},
+                          verify=False)
     assert response.status_code == 200, response.text
 
 
-def activate_user(domain, artifact_dir):
-    assert len(smtp.emails(artifact_dir)) == 1
-    activate_token = smtp.get_token(smtp.emails()[0])
-    response = requests.post('https://www.{0}/api/user/activate'.format(domain),
-                             json={'token': activate_token},
-                             verify=False)
+def activate_user(domain, email, artifact_dir):
+    emails = smtp.emails(artifact_dir, smtp.to(email))
+    assert len(emails) == 1
+    activate_token = smtp.get_token(emails[0])
+    response = client.post('https://www.{0}/api/user/activate'.format(domain),
+                           json={'token': activate_token},
+                           verify=False)
     assert response.status_code == 200, (response.text, activate_token)
     smtp.clear()
 
@@ -124,8 +127,8 @@ def test_user_create_existing_case_difference(domain, artifact_dir):
     email1 = 'case_test@syncloud.test'
     email2 = 'Case_test@syncloud.test'
     create_user(domain, email1, 'pass123456', artifact_dir)
-    response = requests.post('https://www.{0}/api/user/create'.format(domain),
-                             json={'email': email2, 'password': 'pass123456'}, verify=False)
+    response = client.post('https://www.{0}/api/user/create'.format(domain),
+                           json={'email': email2, 'password': 'pass123456'}, verify=False)
     assert response.status_code == 400, response.text
     assert "already registered" in response.text, response.text
 
@@ -146,17 +149,17 @@ def test_get_user_data(domain, artifact_dir):
         'web_port': 10000
     }
 
-    response = requests.post('https://api.{0}/domain/update'.format(domain),
-                             json=update_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/update'.format(domain),
+                           json=update_data,
+                           verify=False)
     assert response.status_code == 200, response.text
 
     response_data = json.loads(response.text)
     assert response_data['success'], response.text
 
-    response = requests.get('https://api.{0}/user/get'.format(domain),
-                            params={'email': email, 'password': password},
-                            verify=False)
+    response = client.get('https://api.{0}/user/get'.format(domain),
+                          params={'email': email, 'password': password},
+                          verify=False)
 
     response_data = json.loads(response.text)
     user_data = response_data['data']
@@ -191,9 +194,9 @@ def test_get_user_no_domains(domain, artifact_dir):
     password = 'pass123456'
     user_token = create_user(domain, email, password, artifact_dir)
 
-    response = requests.get('https://api.{0}/user/get'.format(domain),
-                            params={'email': email, 'password': password},
-                            verify=False)
+    response = client.get('https://api.{0}/user/get'.format(domain),
+                          params={'email': email, 'password': password},
+                          verify=False)
 
     response_data = json.loads(response.text)
     user_data = response_data['data']
@@ -222,17 +225,17 @@ def test_free_domain_availability(domain, artifact_dir):
         'password': password,
     }
 
-    response = requests.post('https://api.{0}/domain/availability'.format(domain),
-                             json=request,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/availability'.format(domain),
+                           json=request,
+                           verify=False)
     assert response.status_code == 200, response.text
 
     user_domain = 'domain-availability'
     api.domain_acquire(domain, '{}.{}'.format(user_domain, domain), email, password)
 
-    response = requests.post('https://api.{0}/domain/availability'.format(domain),
-                             json=request,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/availability'.format(domain),
+                           json=request,
+                           verify=False)
     assert response.status_code == 200, response.text
 
     email = 'test_domain_availability_other@syncloud.test'
@@ -243,9 +246,9 @@ def test_free_domain_availability(domain, artifact_dir):
         'email': email,
         'password': password,
     }
-    response = requests.post('https://api.{0}/domain/availability'.format(domain),
-                             json=request,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/availability'.format(domain),
+                           json=request,
+                           verify=False)
     assert response.status_code == 400, response.text
 
 
@@ -254,12 +257,13 @@ def test_user_reset_password_sent_mail(domain, artifact_dir):
     password = 'pass123456'
     create_user(domain, email, password, artifact_dir)
 
-    response = requests.post('https://www.{0}/api/user/reset_password'.format(domain),
-                             json={'email': email}, verify=False)
+    response = client.post('https://www.{0}/api/user/reset_password'.format(domain),
+                           json={'email': email}, verify=False)
     assert response.status_code == 200, response.text
 
-    assert len(smtp.emails()) > 0, 'Server should send email with link to reset password'
-    token = smtp.get_token(smtp.emails()[0])
+    emails = smtp.emails(predicate=smtp.to(email))
+    assert len(emails) > 0, 'Server should send email with link to reset password'
+    token = smtp.get_token(emails[0])
     smtp.clear()
     assert token is not None
 
@@ -269,24 +273,24 @@ def test_user_reset_password_set_new(domain, artifact_dir):
     password = 'pass123456'
     create_user(domain, email, password, artifact_dir)
 
-    requests.post('https://www.{0}/api/user/reset_password'.format(domain), json={'email': email},
-                  verify=False)
-    email_body = smtp.emails(artifact_dir)[0]
+    client.post('https://www.{0}/api/user/reset_password'.format(domain), json={'email': email},
+                verify=False)
+    email_body = smtp.emails(artifact_dir, smtp.to(email))[0]
     token = smtp.get_token(email_body)
 
     smtp.clear()
 
     new_password = 'new_password'
-    response = requests.post('https://www.{0}/api/user/set_password'.format(domain),
-                             json={'token': token, 'password': new_password},
-                             verify=False)
+    response = client.post('https://www.{0}/api/user/set_password'.format(domain),
+                           json={'token': token, 'password': new_password},
+                           verify=False)
     assert response.status_code == 200, (response.text, token, email_body)
 
-    assert len(smtp.emails(artifact_dir)) > 0, 'Server should send email when setting new password'
+    assert len(smtp.emails(artifact_dir, smtp.to(email))) > 0, 'Server should send email when setting new password'
 
-    response = requests.get('https://api.{0}/user/get'.format(domain),
-                            params={'email': email, 'password': new_password},
-                            verify=False)
+    response = client.get('https://api.{0}/user/get'.format(domain),
+                          params={'email': email, 'password': new_password},
+                          verify=False)
     assert response.status_code == 200, response.text
     smtp.clear()
 
@@ -296,21 +300,21 @@ def test_user_reset_password_set_with_old_token(domain, artifact_dir):
     password = 'pass123456'
     create_user(domain, email, password, artifact_dir)
 
-    requests.post('https://www.{0}/api/user/reset_password'.format(domain), json={'email': email},
-                  verify=False)
-    token_old = smtp.get_token(smtp.emails()[0])
+    client.post('https://www.{0}/api/user/reset_password'.format(domain), json={'email': email},
+                verify=False)
+    token_old = smtp.get_token(smtp.emails(predicate=smtp.to(email))[0])
 
     smtp.clear()
 
-    requests.post('https://www.{0}/api/user/reset_password'.format(domain), json={'email': email},
-                  verify=False)
-    token = smtp.get_token(smtp.emails()[0])
+    client.post('https://www.{0}/api/user/reset_password'.format(domain), json={'email': email},
+                verify=False)
+    token = smtp.get_token(smtp.emails(predicate=smtp.to(email))[0])
     smtp.clear()
 
     new_password = 'new_password'
-    response = requests.post('https://www.{0}/api/user/set_password'.format(domain),
-                             json={'token': token_old, 'password': new_password},
-                             verify=False)
+    response = client.post('https://www.{0}/api/user/set_password'.format(domain),
+                           json={'token': token_old, 'password': new_password},
+                           verify=False)
     assert response.status_code == 400, response.text
     smtp.clear()
 
@@ -320,21 +324,21 @@ def test_user_reset_password_set_twice(domain, artifact_dir):
     password = 'pass123456'
     create_user(domain, email, password, artifact_dir)
 
-    requests.post('https://www.{0}/api/user/reset_password'.format(domain), json={'email': email},
-                  verify=False)
-    token = smtp.get_token(smtp.emails()[0])
+    client.post('https://www.{0}/api/user/reset_password'.format(domain), json={'email': email},
+                verify=False)
+    token = smtp.get_token(smtp.emails(predicate=smtp.to(email))[0])
     smtp.clear()
 
     new_password = 'new_password'
-    response = requests.post('https://www.{0}/api/user/set_password'.format(domain),
-                             json={'token': token, 'password': new_password},
-                             verify=False)
+    response = client.post('https://www.{0}/api/user/set_password'.format(domain),
+                           json={'token': token, 'password': new_password},
+                           verify=False)
     assert response.status_code == 200, response.text
 
     new_password = 'new_password2'
-    response = requests.post('https://www.{0}/api/user/set_password'.format(domain),
-                             json={'token': token, 'password': new_password},
-                             verify=False)
+    response = client.post('https://www.{0}/api/user/set_password'.format(domain),
+                           json={'token': token, 'password': new_password},
+                           verify=False)
     assert response.status_code == 400, response.text
     smtp.clear()
 
@@ -352,8 +356,8 @@ def test_domain_new(domain, artifact_dir):
         device_title='My Super Board',
         email=email,
         password=password)
-    response = requests.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
+                           verify=False)
 
     assert response.status_code == 200
     domain_data = json.loads(response.text)
@@ -389,8 +393,8 @@ def test_domain_new_v2(domain, artifact_dir):
         device_title='My Super Board',
         email=email,
         password=password)
-    response = requests.post('https://api.{0}/domain/acquire_v2'.format(domain), json=acquire_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/acquire_v2'.format(domain), json=acquire_data,
+                           verify=False)
 
     assert response.status_code == 200
     domain_data = json.loads(response.text)['data']
@@ -425,8 +429,8 @@ def test_domain_lower_case(domain, artifact_dir):
         device_title='My Super Board',
         email=email,
         password=password)
-    response = requests.post('https://api.{0}/domain/acquire_v2'.format(domain), json=acquire_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/acquire_v2'.format(domain), json=acquire_data,
+                           verify=False)
 
     assert response.status_code == 200
     domain_data = json.loads(response.text)['data']
@@ -462,8 +466,8 @@ def test_domain_existing(domain, artifact_dir):
         device_title='My Super Board',
         email=email_1,
         password=password_1)
-    response = requests.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
+                           verify=False)
     domain_data = json.loads(response.text)
     update_token = domain_data['update_token']
 
@@ -477,8 +481,8 @@ def test_domain_existing(domain, artifact_dir):
         device_title='Other Board',
         email=email_2,
         password=password_2)
-    response = requests.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
+                           verify=False)
 
     assert response.status_code == 400
 
@@ -510,8 +514,8 @@ def test_domain_twice(domain, artifact_dir):
         device_title='My Super Board',
         email=email,
         password=password)
-    response = requests.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
+                           verify=False)
     domain_data = json.loads(response.text)
     update_token1 = domain_data['update_token']
 
@@ -522,8 +526,8 @@ def test_domain_twice(domain, artifact_dir):
         device_title='My Super Board 2',
         email=email,
         password=password)
-    response = requests.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
+                           verify=False)
     assert response.status_code == 200
     domain_data = json.loads(response.text)
     update_token2 = domain_data['update_token']
@@ -559,8 +563,8 @@ def test_domain_wrong_mac_address_format(domain, artifact_dir):
         'email': email,
         'password': password
     }
-    response = requests.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/acquire'.format(domain), data=acquire_data,
+                           verify=False)
 
     assert response.status_code == 400
 
@@ -576,11 +580,19 @@ def test_domain_update_date(domain, artifact_dir):
     domain_info = get_domain(update_token, domain)
     last_updated1 = domain_info['last_update']
     time.sleep(1)
-    api.domain_update(domain, update_token, '127.0.0.1')
-    domain_info = get_domain(update_token, domain)
-    last_updated2 = domain_info['last_update']
+    api.domain_update(domain, update_token, '127.0.0.1', '2')
+
+    # an unchanged update is a heartbeat, written with the next batch
+    last_updated2 = last_updated1
+    for _ in range(10):
+        domain_info = get_domain(update_token, domain)
+        last_updated2 = domain_info['last_update']
+        if last_updated2 > last_updated1:
+            break
+        time.sleep(1)
 
     assert last_updated2 > last_updated1
+    assert domain_info['platform_version'] == '2'
 
 
 def test_domain_update_wrong_token(domain):
@@ -666,8 +678,8 @@ def test_domain_update_local_ip_changed(domain, artifact_dir):
         'web_local_port': 80,
     }
 
-    response = requests.post('https://api.{0}/domain/update'.format(domain), json=update_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/update'.format(domain), json=update_data,
+                           verify=False)
     assert response.status_code == 200
 
     update_data = {
@@ -679,8 +691,8 @@ def test_domain_update_local_ip_changed(domain, artifact_dir):
         'web_local_port': 80,
     }
 
-    response = requests.post('https://api.{0}/domain/update'.format(domain), json=update_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/update'.format(domain), json=update_data,
+                           verify=False)
 
     assert response.status_code == 200
 
@@ -718,9 +730,9 @@ def test_domain_update_server_side_client_ip(domain, artifact_dir):
         'web_local_port': 80,
     }
 
-    response = requests.post('https://api.{0}/domain/update'.format(domain),
-                             json=update_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/update'.format(domain),
+                           json=update_data,
+                           verify=False)
     assert response.status_code == 200, response.text
 
     expected_data = {
@@ -760,8 +772,8 @@ def test_domain_update_map_local_address(domain, artifact_dir):
         'web_local_port': 80
     }
 
-    response = requests.post('https://api.{0}/domain/update'.format(domain), json=update_data,
-                             verify=False)
+    response = client.post('https://api.{0}/domain/update'.format(domain), json=update_data,
+                           verify=False)
     assert response.status_code == 200
 
     expected_data = {
@@ -785,7 +797,7 @@ def test_domain_update_map_local_address(domain, artifact_dir):
 
 
 def test_status(domain):
-    response = requests.get('https://api.{0}/status'.format(domain), verify=False)
+    response = client.get('https://api.{0}/status'.format(domain), verify=False)
     assert response.status_code == 200
     assert 'OK' in response.text
 
@@ -799,15 +811,16 @@ def test_user_log(domain, artifact_dir):
     password = 'pass123456'
     token = create_user(domain, email, password, artifact_dir)
 
-    response = requests.post('https://api.{0}/user/log'.format(domain),
-                             data={'token': token,
+    response = client.post('https://api.{0}/user/log'.format(domain),
+                           data={'token': token,
                                    'data': 'test_user_log',
                                    'include_support': False},
-                             verify=False)
+                           verify=False)
     assert response.status_code == 200, response.text
 
-    assert len(smtp.emails()) > 0, 'Server should send email with log'
-    email = smtp.emails()[0]
+    emails = smtp.emails(predicate=smtp.to(email))
+    assert len(emails) > 0, 'Server should send email with log'
+    email = emails[0]
     smtp.clear()
     assert 'test_user_log' in email
 
@@ -817,15 +830,16 @@ def test_user_log_include_support(domain, artifact_dir):
     password = 'pass123456'
     token = create_user(domain, email, password, artifact_dir)
 
-    response = requests.post('https://api.{0}/user/log'.format(domain),
-                             data={'token': token,
+    response = client.post('https://api.{0}/user/log'.format(domain),
+                           data={'token': token,
                                    'data': 'test_user_log_include_support',
                                    'include_support': True},
-                             verify=False)
+                           verify=False)
     assert response.status_code == 200, response.text
 
-    assert len(smtp.emails()) > 0, 'Server should send email with log'
-    email = smtp.emails()[0]
+    emails = smtp.emails(predicate=smtp.to(email))
+    assert len(emails) > 0, 'Server should send email with log'
+    email = emails[0]
     smtp.clear()
     assert 'test_user_log_include_support' in email
 
@@ -838,51 +852,51 @@ def test_certbot_support(domain, artifact_dir):
     user_domain = 'test-certbot-support.{}'.format(domain)
     update_token = api.domain_acquire(domain, user_domain, email, password)
 
-    response = requests.post('https://api.{0}/certbot/present'.format(domain),
-                             json={
+    response = client.post('https://api.{0}/certbot/present'.format(domain),
+                           json={
                                  'token': update_token,
                                  'fqdn': '_certbot.{}'.format(user_domain),
                                  'values': ['value1']
-                             },
-                             verify=False)
+                           },
+                           verify=False)
     assert response.status_code == 200, response.text
 
-    response = requests.post('https://api.{0}/certbot/present'.format(domain),
-                             json={
+    response = client.post('https://api.{0}/certbot/present'.format(domain),
+                           json={
                                  'token': update_token,
                                  'fqdn': '_certbot.{}'.format(user_domain),
                                  'values': ['value1', 'value2']
-                             },
-                             verify=False)
+                           },
+                           verify=False)
     assert response.status_code == 200, response.text
 
-    response = requests.post('https://api.{0}/certbot/cleanup'.format(domain),
-                             json={
+    response = client.post('https://api.{0}/certbot/cleanup'.format(domain),
+                           json={
                                  'token': update_token,
                                  'fqdn': '_certbot.{}'.format(user_domain)
-                             },
-                             verify=False)
+                           },
+                           verify=False)
     assert response.status_code == 200, response.text
 
-    response = requests.post('https://api.{0}/certbot/cleanup'.format(domain),
-                             json={
+    response = client.post('https://api.{0}/certbot/cleanup'.format(domain),
+                           json={
                                  'token': update_token,
                                  'fqdn': '_certbot.{}'.format(user_domain)
-                             },
-                             verify=False)
+                           },
+                           verify=False)
     assert response.status_code == 200, response.text
 
 
 RELAY_ADDRESS = '10.0.0.99'
 FRP_VERSION = '0.70.0'
 BACKEND_BODY = 'relay-backend-ok'
-BACKEND_PORT = 18443
+BACKEND_PORT = 18443 + worker.index()
 BIG_BODY = ('x' * 65536).encode()
 
 
 @pytest.fixture(scope='function')
-def mail_device(device_host):
-    device = Device(device_host)
+def mail_device(device_host, worker_name):
+    device = Device(device_host, worker_name)
     device.reset()
     return device
 
@@ -973,7 +987,7 @@ def relay_start_frpc(frpc_path, work_dir, server_addr, server_name, token, domai
 
 
 def relay_fetch(domain_name):
-    return requests.get('https://{0}/'.format(domain_name), verify=False, timeout=5)
+    return client.get('https://{0}/'.format(domain_name), verify=False, timeout=5)
 
 
 def test_relay_valid_token_tunnels_traffic(domain, device_host, artifact_dir, frpc):
@@ -1033,7 +1047,7 @@ def test_relay_update_points_dns_at_relay(domain, artifact_dir):
     domain_name = 'relaydns.{0}'.format(domain)
     update_token = api.domain_acquire(domain, domain_name, email, password)
 
-    response = requests.post('https://api.{0}/domain/update'.format(domain), json={
+    response = client.post('https://api.{0}/domain/update'.format(domain), json={
         'token': update_token,
         'ipv4_enabled': True,
         'relay': True,
@@ -1074,14 +1088,14 @@ def test_relay_monthly_limit_blocks_traffic(domain, device_host, artifact_dir, f
 
         for _ in range(5):
             try:
-                requests.get('https://{0}/big'.format(domain_name), verify=False, timeout=5)
+                client.get('https://{0}/big'.format(domain_name), verify=False, timeout=5)
             except Exception:
                 pass
 
         blocked = False
         for _ in range(20):
             try:
-                if requests.get('https://{0}/big'.format(domain_name), verify=False, timeout=5).status_code != 200:
+                if client.get('https://{0}/big'.format(domain_name), verify=False, timeout=5).status_code != 200:
                     blocked = True
                     break
             except Exception:
@@ -1128,7 +1142,7 @@ def test_relay_usage_persisted_and_served(domain, device_host, artifact_dir, frp
         used = 0
         for _ in range(20):
             try:
-                requests.get('https://{0}/big'.format(domain_name), verify=False, timeout=5)
+                client.get('https://{0}/big'.format(domain_name), verify=False, timeout=5)
             except Exception:
                 pass
             usage = session.get('https://www.{0}/api/relay/usage'.format(domain), verify=False)
@@ -1148,7 +1162,7 @@ MAIL_INBOUND_PORT = 25
 
 
 def mail_enable_relay(domain, update_token, relay=True):
-    response = requests.post('https://api.{0}/domain/update'.format(domain), json={
+    response = client.post('https://api.{0}/domain/update'.format(domain), json={
         'token': update_token,
         'ipv4_enabled': True,
         'relay': relay,
@@ -1275,7 +1289,7 @@ def test_mail_inbound_device_rejects_recipient(domain, device_host, artifact_dir
         server.quit()
 
     assert code == 550, '{0} {1}'.format(code, message)
-    assert len(mail_device.messages(expected=2, attempts=3)) == 1
+    assert len(mail_device.messages(expected=2, timeout=3)) == 1
 
 
 def test_mail_inbound_device_rejects_message(domain, device_host, artifact_dir, mail_device):
@@ -1296,7 +1310,7 @@ def test_mail_inbound_device_rejects_message(domain, device_host, artifact_dir,
         server.quit()
 
     assert data_code == 554, '{0} {1}'.format(data_code, data_message)
-    assert len(mail_device.messages(expected=2, attempts=3)) == 1
+    assert len(mail_device.messages(expected=2, timeout=3)) == 1
 
 
 def test_mail_inbound_device_dropping_the_connection_defers(domain, device_host, artifact_dir, mail_device):
@@ -1402,11 +1416,27 @@ def test_mail_inbound_monthly_limit_blocks_delivery(domain, device_host, artifac
 
 
 def mx_records(device_host):
-    response = requests.get('http://{0}:4566/faker/mx'.format(device_host), timeout=10)
+    response = client.get('http://{0}:4566/faker/mx'.format(device_host), timeout=10)
     assert response.status_code == 200, response.text
     return response.json()
 
 
+def wait_mx(device_host, domain_name, expected, attempts=30):
+    records = None
+    for _ in range(attempts):
+        records = mx_records(device_host).get('{0}.'.format(domain_name), [])
+        if records == expected:
+            return
+        time.sleep(1)
+    assert records == expected, records
+
+
+def dns_throttle(device_host, domain_name, count):
+    response = client.post('http://{0}:4566/faker/throttle'.format(device_host),
+                           params={'name': domain_name, 'count': count}, timeout=10)
+    assert response.status_code == 200, response.text
+
+
 def test_mail_inbound_update_points_mx_at_the_relay(domain, device_host, artifact_dir):
     email = 'mail_mx@syncloud.test'
     password = 'pass123456'
@@ -1416,10 +1446,23 @@ def test_mail_inbound_update_points_mx_at_the_relay(domain, device_host, artifac
     update_token = api.domain_acquire(domain, domain_name, email, password)
 
     mail_enable_relay(domain, update_token, relay=False)
-    before = mx_records(device_host).get('{0}.'.format(domain_name), [])
-    assert before == ['1 {0}.'.format(domain_name)], before
+    wait_mx(device_host, domain_name, ['1 {0}.'.format(domain_name)])
 
     mail_enable_relay(domain, update_token, relay=True)
+    wait_mx(device_host, domain_name, ['1 {0}.mx.{1}.'.format(user_domain, domain)])
+
+
+def test_dns_queue_retries_throttled_changes(domain, device_host, artifact_dir):
+    email = 'dns_throttle@syncloud.test'
+    password = 'pass123456'
+    user_domain = 'dnsthrottle'
+    domain_name = '{0}.{1}'.format(user_domain, domain)
+    create_user(domain, email, password, artifact_dir)
+    update_token = api.domain_acquire(domain, domain_name, email, password)
+    mail_enable_relay(domain, update_token, relay=False)
+    wait_mx(device_host, domain_name, ['1 {0}.'.format(domain_name)])
 
-    after = mx_records(device_host).get('{0}.'.format(domain_name), [])
-    assert after == ['1 {0}.mx.{1}.'.format(user_domain, domain)], after
+    # more than the aws sdk retries on its own
+    dns_throttle(device_host, domain_name, 6)
+    mail_enable_relay(domain, update_token, relay=True)
+    wait_mx(device_host, domain_name, ['1 {0}.mx.{1}.'.format(user_domain, domain)], attempts=60)
@@ -0,0 +1,15 @@
+import os
+
+
+def name():
+    # set by pytest-xdist in each worker process: gw0, gw1, ...
+    return os.environ.get('PYTEST_XDIST_WORKER', 'master')
+
+
+def index():
+    worker = name()
+    return int(worker[2:]) if worker.startswith('gw') else 0
+
+
+def parallel():
+    return int(os.environ.get('PYTEST_XDIST_WORKER_COUNT', '1')) > 1
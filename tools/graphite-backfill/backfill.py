@@ -3,22 +3,71 @@
 Copy historical redirect metrics from graphite whisper files into VictoriaMetrics.
 
 Runs on the UAT host (where /opt/graphite/storage/whisper and VM share a box).
-For each known whisper path, reads the full history via whisper-fetch.py,
-maps to the new Prometheus name + labels, and posts to VM via
-/api/v1/import/prometheus.
+For each known whisper path, reads the full history straight from the .wsp
+file (mmap, no whisper-fetch.py subprocess), maps to the new Prometheus
+name + labels, and streams it to VM via /api/v1/import/prometheus as a
+gzip-encoded chunked upload, --chunk-size points at a time.
+
+All retention archives are read: every archive contributes the span that no
+finer one covers, so recent data keeps full resolution and the long tail
+comes from the coarse archives, as one time-ordered stream.
+
+--format jsonl sends the same samples to /api/v1/import instead, as one JSON
+line per chunk with "values" and "timestamps" arrays, so the metric name and
+labels go over the wire once per chunk rather than once per sample.
+
+--verify imports nothing. For every series it streams /api/v1/export over
+the whisper time span and compares the point count and an order-independent
+checksum of (timestamp, value) with the whisper side, exiting non-zero on
+any mismatch.
+
+By default only the DB gauges in DB_GAUGE_PATHS are copied. --discover walks
+every .wsp under each ENVS prefix instead and maps it with --rules (first
+match wins, see DEFAULT_RULES). The walk is cached in --manifest together
+with the size and mtime of each file at its last import, so a rerun skips
+both the walk and every file that has not changed since (--rescan forces a
+fresh walk).
+
+Every request VM accepts is checkpointed as the last timestamp imported
+for that series, written to --state every few seconds and at exit. After a
+crash or timeout, --resume fetches only the points after each checkpoint,
+re-sending at most the last few seconds of imports. The state also records
+the clock each run read the file at, since that decides where one archive
+hands over to the next; --verify rebuilds the whisper side from it.
 
 Usage:
   sudo python3 backfill.py [--vm http://127.0.0.1:8428] [--dry-run]
+                           [--chunk-size 50000] [--workers 4]
+                           [--max-inflight 2]
+                           [--discover [--rules rules.json]
+                            [--manifest backfill-manifest.json] [--rescan]]
+                           [--request-points 1000000]
+                           [--state backfill-state.json] [--resume]
+                           [--format prometheus|jsonl] [--verify]
 """
 
 import argparse
+import itertools
 import json
-import subprocess
+import mmap
+import os
+import re
+import struct
 import sys
+import threading
+import time
+import urllib.parse
 import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+try:
+    import numpy as np
+except ImportError:  # render_chunks falls back to render_lines
+    np = None
 
 WHISPER_ROOT = "/opt/graphite/storage/whisper"
-WHISPER_FETCH = "/usr/local/bin/whisper-fetch.py"
 FROM_EPOCH = 0  # full history
 
 ENVS = {
@@ -37,13 +86,122 @@ DB_GAUGE_PATHS = {
     "db/users/online.wsp":      ("redirect_db_users", {"state": "online"}),
 }
 
+# --discover mapping: (regex on the path under the ENVS prefix, metric
+# template, extra label templates). Templates are filled from the named
+# groups; the metric name is then sanitised for Prometheus. A --rules file
+# holds the same triples as a JSON list of {"match", "metric", "labels"}.
+DEFAULT_RULES = [
+    (re.escape(rel), metric, extra)
+    for rel, (metric, extra) in DB_GAUGE_PATHS.items()
+] + [
+    (r"(?P<path>.+)\.wsp", "redirect_{path}", {}),
+]
 
-def fetch_whisper(path):
-    out = subprocess.check_output(
-        [WHISPER_FETCH, "--json", f"--from={FROM_EPOCH}", path],
-        text=True,
-    )
-    return json.loads(out)
+
+# whisper on-disk layout (big-endian):
+#   metadata:      aggregation type, max retention, xff, archive count
+#   archive info:  offset, seconds per point, points   (one per archive)
+#   point:         interval, value
+METADATA = struct.Struct("!2LfL")
+ARCHIVE_INFO = struct.Struct("!3L")
+POINT = struct.Struct("!Ld")
+
+
+class InvalidWhisperFile(Exception):
+    pass
+
+
+class Archive:
+    def __init__(self, offset, seconds_per_point, points):
+        self.offset = offset
+        self.step = seconds_per_point
+        self.points = points
+        self.retention = seconds_per_point * points
+
+
+class WhisperFile:
+    """Read-only mmap view of a .wsp file.
+
+    fetch_merged() reads every archive the way whisper.fetch() reads one,
+    yielding one value (or None) per step and walking the ring buffer in
+    place.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise InvalidWhisperFile(f"{path}: {e}") from e
+        try:
+            self._read_header()
+        except Exception:
+            self.mm.close()
+            raise
+
+    def _read_header(self):
+        if len(self.mm) < METADATA.size:
+            raise InvalidWhisperFile(f"{self.path}: truncated header")
+        _, self.max_retention, _, count = METADATA.unpack_from(self.mm, 0)
+        if count == 0 or len(self.mm) < METADATA.size + count * ARCHIVE_INFO.size:
+            raise InvalidWhisperFile(f"{self.path}: bad archive count {count}")
+        self.archives = []
+        for i in range(count):
+            offset, step, points = ARCHIVE_INFO.unpack_from(
+                self.mm, METADATA.size + i * ARCHIVE_INFO.size)
+            if step == 0 or points == 0 or offset + points * POINT.size > len(self.mm):
+                raise InvalidWhisperFile(f"{self.path}: bad archive {i}")
+            self.archives.append(Archive(offset, step, points))
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fetch_merged(self, from_time, now=None):
+        """Yield (start, step, values) per archive, oldest data first.
+
+        Each archive only covers the time before the first interval of the
+        next finer one, so chaining the segments gives one time-ordered
+        stream without duplicate timestamps, finest resolution winning.
+        """
+        now = int(time.time()) if now is None else now
+        from_time = int(from_time)
+        segments = []
+        bound = None  # first interval already covered by a finer archive
+        for archive in self.archives:
+            step = archive.step
+            start = max(from_time, now - archive.retention)
+            start = start - start % step + step
+            end = now - now % step + step if bound is None else bound
+            count = min(-(-(end - start) // step), archive.points)
+            if count > 0:
+                segments.append((archive, start, count))
+                bound = start if bound is None else min(bound, start)
+        for archive, start, count in reversed(segments):
+            yield start, archive.step, self._walk(archive, start, count)
+
+    def _walk(self, archive, from_interval, count):
+        mm, offset, step = self.mm, archive.offset, archive.step
+        base_interval, _ = POINT.unpack_from(mm, offset)
+        if base_interval == 0:
+            for _ in range(count):
+                yield None
+            return
+        index = (from_interval - base_interval) // step % archive.points
+        expected = from_interval
+        for _ in range(count):
+            interval, value = POINT.unpack_from(mm, offset + index * POINT.size)
+            yield value if interval == expected else None
+            expected += step
+            index += 1
+            if index == archive.points:
+                index = 0
 
 
 def format_labels(labels):
@@ -61,10 +219,154 @@ def render_lines(metric, labels, start, step, values):
         ts_ms += step_ms
 
 
-def post_to_vm(vm_url, body):
+def render_chunks(metric, labels, start, step, values, size):
+    """Yield (points, last ts in ms, text) blocks of at most size points.
+
+    text is the newline-terminated lines, byte-for-byte what joining
+    render_lines() would give; with numpy the block is built in bulk.
+    """
+    if np is not None:
+        head = f"{metric}{{{format_labels(labels)}}} "
+        yield from render_chunks_np(head, start, step, values, size)
+        return
+    lines = render_lines(metric, labels, start, step, values)
+    while True:
+        batch = list(itertools.islice(lines, size))
+        if not batch:
+            return
+        last_ms = int(batch[-1].rsplit(" ", 1)[1])
+        yield len(batch), last_ms, "\n".join(batch) + "\n"
+
+
+def render_chunks_np(prefix, start, step, values, size):
+    # Integral slabs (the usual case for gauges) are formatted as a digit
+    # matrix; anything else goes through repr(), which is what f"{v}"
+    # prints for a float.
+    for kept, ts in kept_slabs_np(start, step, values, size):
+        if (ts >= 0).all() and is_plain_integral(kept):
+            text = format_integral(prefix, kept, ts)
+        else:
+            text = "".join(
+                f"{prefix}{v} {t}\n" for v, t in zip(kept.tolist(), ts.tolist())
+            )
+        yield len(kept), int(ts[-1]), text
+
+
+def kept_slabs_np(start, step, values, size):
+    """Yield (values, timestamps in ms) arrays of the non-null samples.
+
+    Reads size samples per slab: nulls are masked out in one comparison and
+    timestamps come from one arange.
+    """
+    start_ms = start * 1000
+    step_ms = step * 1000
+    offset = 0
+    while True:
+        slab = np.array(list(itertools.islice(values, size)), dtype=object)
+        if not len(slab):
+            return
+        keep = slab != None  # noqa: E711 - elementwise, not an identity test
+        ts = start_ms + step_ms * np.arange(offset, offset + len(slab), dtype=np.int64)
+        offset += len(slab)
+        if keep.any():
+            yield slab[keep].astype(np.float64), ts[keep]
+
+
+def render_json_chunks(metric, labels, start, step, values, size):
+    """Same contract as render_chunks(), in /api/v1/import JSON lines."""
+    head = '{"metric":' + json.dumps({"__name__": metric, **labels}) + ',"values":'
+    if np is not None:
+        slabs = ((kept.tolist(), ts.tolist())
+                 for kept, ts in kept_slabs_np(start, step, values, size))
+    else:
+        slabs = kept_slabs(start, step, values, size)
+    for kept, ts in slabs:
+        text = f'{head}{json.dumps(kept)},"timestamps":{json.dumps(ts)}}}\n'
+        yield len(kept), ts[-1], text
+
+
+def kept_slabs(start, step, values, size):
+    kept, ts = [], []
+    ts_ms = start * 1000
+    step_ms = step * 1000
+    for v in values:
+        if v is not None:
+            kept.append(v)
+            ts.append(ts_ms)
+            if len(kept) == size:
+                yield kept, ts
+                kept, ts = [], []
+        ts_ms += step_ms
+    if kept:
+        yield kept, ts
+
+
+# --format -> (chunk renderer, VM import path)
+FORMATS = {
+    "prometheus": (render_chunks, "/api/v1/import/prometheus"),
+    "jsonl": (render_json_chunks, "/api/v1/import"),
+}
+
+
+def is_plain_integral(values):
+    # repr() prints these as "<int>.0"; 1e16 and up switch to exponent form
+    with np.errstate(invalid="ignore"):
+        return bool((np.abs(values) < 1e16).all() and (values == np.trunc(values)).all())
+
+
+def digit_matrix(n):
+    """Right-aligned ASCII digits of non-negative ints, plus each one's length."""
+    width = len(str(int(n.max())))
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    digits = (n[:, None] // powers % 10 + ord("0")).astype(np.uint8)
+    lengths = np.searchsorted(powers[-2::-1], n, side="right") + 1
+    return digits, lengths
+
+
+def format_integral(prefix, values, ts):
+    # Lay every line out in a fixed-width byte matrix, mark which cells are
+    # real (sign, significant digits), and let boolean indexing squeeze the
+    # padding out row by row.
+    n = len(values)
+    value_digits, value_lengths = digit_matrix(np.abs(values).astype(np.int64))
+    ts_digits, ts_lengths = digit_matrix(ts)
+
+    def const(text):
+        raw = np.frombuffer(text, np.uint8)
+        return np.broadcast_to(raw, (n, len(raw)))
+
+    prefix = prefix.encode("utf-8")
+    cells = np.hstack([
+        const(prefix), const(b"-"), value_digits, const(b".0 "), ts_digits, const(b"\n"),
+    ])
+    real = np.ones(cells.shape, dtype=bool)
+    col = len(prefix)
+    real[:, col] = np.signbit(values)
+    col += 1
+    width = value_digits.shape[1]
+    real[:, col:col + width] = np.arange(width) >= (width - value_lengths)[:, None]
+    col += width + 3
+    width = ts_digits.shape[1]
+    real[:, col:col + width] = np.arange(width) >= (width - ts_lengths)[:, None]
+    return cells[real].tobytes().decode("utf-8")
+
+
+def gzip_body(texts):
+    # One gzip stream per request, sync-flushed per chunk so every HTTP
+    # chunk carries whole lines and only one chunk is ever held in memory.
+    z = zlib.compressobj(wbits=31)
+    for text in texts:
+        yield z.compress(text.encode("utf-8")) + z.flush(zlib.Z_SYNC_FLUSH)
+    yield z.flush()
+
+
+def post_to_vm(vm_url, texts, path="/api/v1/import/prometheus"):
+    # An iterable body without Content-Length makes urllib send it with
+    # Transfer-Encoding: chunked.
     req = urllib.request.Request(
-        f"{vm_url}/api/v1/import/prometheus",
-        data=body.encode("utf-8"),
+        f"{vm_url}{path}",
+        data=gzip_body(texts),
+        headers={"Content-Encoding": "gzip"},
         method="POST",
     )
     with urllib.request.urlopen(req, timeout=60) as resp:
@@ -72,47 +374,397 @@ def post_to_vm(vm_url, body):
             raise RuntimeError(f"VM import failed: {resp.status}")
 
 
+class ChunkFeed:
+    """Cuts render_chunks() output into request bodies of ~limit points."""
+
+    def __init__(self, chunks, limit):
+        self.chunks = chunks
+        self.limit = limit
+        self.pending = next(chunks, None)
+        self.points = 0
+        self.last_ms = None
+
+    def more(self):
+        return self.pending is not None
+
+    def body(self):
+        sent = 0
+        while self.pending is not None and sent < self.limit:
+            n, last_ms, text = self.pending
+            yield text
+            sent += n
+            self.points += n
+            self.last_ms = last_ms
+            self.pending = next(self.chunks, None)
+
+
+class Checkpoints:
+    """Last imported timestamp (seconds) per series, and the runs behind it.
+
+    Each run is [since, now]: the checkpoint it resumed after (None for a
+    full import) and the time it read the file at. The file holds every
+    series, so it is rewritten at most every interval seconds rather than on
+    each import, and once more by flush() at exit.
+    """
+
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last = load_json(path) or {}
+        self.dirty = False
+        self.saved = time.monotonic()
+
+    def get(self, key):
+        with self.lock:
+            return self._entry(key)["ts"]
+
+    def runs(self, key):
+        with self.lock:
+            return [tuple(run) for run in self._entry(key)["runs"]]
+
+    def begin(self, key, since, now):
+        with self.lock:
+            entry = self._entry(key)
+            runs = entry["runs"] if since is not None else []
+            self.last[key] = {"ts": entry["ts"], "runs": runs + [[since, now]]}
+            self.dirty = True
+
+    def set(self, key, ts):
+        with self.lock:
+            self.last[key] = {"ts": ts, "runs": self._entry(key)["runs"]}
+            self.dirty = True
+            if time.monotonic() - self.saved >= self.interval:
+                self._save()
+
+    def flush(self):
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    def _entry(self, key):
+        entry = self.last.get(key)
+        if entry is None or isinstance(entry, dict):
+            return entry or {"ts": None, "runs": []}
+        return {"ts": entry, "runs": []}  # state written before runs were kept
+
+    def _save(self):
+        save_json(self.path, self.last)
+        self.dirty = False
+        self.saved = time.monotonic()
+
+
+def stream_series(args, wsp, metric, labels, inflight, since, checkpoint, now=None):
+    """Render and upload one series, return the number of points sent.
+
+    Points after since (or the whole history) are sent in requests of about
+    --request-points; checkpoint(ts) gets the last timestamp of each one
+    once VM has accepted it.
+    """
+    render, import_path = FORMATS[args.format]
+    segments = wsp.fetch_merged(FROM_EPOCH if since is None else since, now)
+    feed = ChunkFeed(
+        itertools.chain.from_iterable(
+            render(metric, labels, start, step, values, args.chunk_size)
+            for start, step, values in segments
+        ),
+        args.request_points,
+    )
+    while feed.more():
+        if args.dry_run:
+            for _ in feed.body():
+                pass
+            continue
+        with inflight:
+            post_to_vm(args.vm, feed.body(), import_path)
+        checkpoint(feed.last_ms // 1000)
+    return feed.points
+
+
+class Digest:
+    """Count and order-independent checksum of (timestamp ms, value) samples.
+
+    Values are compared at 12 significant digits, which VM keeps exactly.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.checksum = 0
+
+    def add(self, ts_ms, value):
+        self.count += 1
+        sample = f"{ts_ms} {float(value):.12g}".encode("ascii")
+        self.checksum = (self.checksum + zlib.crc32(sample)) & 0xFFFFFFFFFFFFFFFF
+
+    def __eq__(self, other):
+        return (self.count, self.checksum) == (other.count, other.checksum)
+
+    def __str__(self):
+        return f"{self.count} points/{self.checksum:016x}"
+
+
+def whisper_digest(wsp, size, runs=((None, None),)):
+    """Digest what the import runs sent, as (digest, first_ms, last_ms).
+
+    Each run is replayed at its own now, and only up to the checkpoint the
+    next run resumed after, so the archive boundaries match the import's
+    rather than today's.
+    """
+    digest, first_ms, last_ms = Digest(), None, None
+    for (since, now), (until, _) in zip(runs, list(runs[1:]) + [(None, None)]):
+        until_ms = None if until is None else until * 1000
+        for start, step, values in wsp.fetch_merged(
+                FROM_EPOCH if since is None else since, now):
+            for kept, ts in kept_slabs(start, step, values, size):
+                for v, t in zip(kept, ts):
+                    if until_ms is not None and t > until_ms:
+                        break
+                    digest.add(t, v)
+                    first_ms = t if first_ms is None else min(first_ms, t)
+                    last_ms = t if last_ms is None else max(last_ms, t)
+    return digest, first_ms, last_ms
+
+
+def vm_digest(vm_url, metric, labels, first_ms, last_ms):
+    # Bounded to the whisper span: the live scrape writes the same series
+    # after the graphite data ends.
+    query = urllib.parse.urlencode({
+        "match[]": f"{metric}{{{format_labels(labels)}}}",
+        "start": first_ms // 1000,
+        "end": last_ms // 1000,
+    })
+    digest = Digest()
+    with urllib.request.urlopen(f"{vm_url}/api/v1/export?{query}", timeout=60) as resp:
+        for line in resp:
+            if not line.strip():
+                continue
+            series = json.loads(line)
+            for ts, v in zip(series["timestamps"], series["values"]):
+                digest.add(ts, v)
+    return digest
+
+
+def series_labels(env, extra):
+    return {
+        "env": env,
+        "instance": "172.17.0.1:9092",
+        "job": "redirect-www",
+        **extra,
+    }
+
+
+def load_rules(path):
+    if path is None:
+        rules = DEFAULT_RULES
+    else:
+        with open(path) as f:
+            rules = [(r["match"], r["metric"], r.get("labels", {})) for r in json.load(f)]
+    return [(re.compile(match), metric, labels) for match, metric, labels in rules]
+
+
+def map_series(rules, rel):
+    """Return (metric, extra labels) for a whisper path, or None if unmapped."""
+    for pattern, metric, labels in rules:
+        m = pattern.fullmatch(rel)
+        if m:
+            groups = m.groupdict()
+            name = re.sub(r"[^a-zA-Z0-9_:]", "_", metric.format(**groups))
+            return name, {k: v.format(**groups) for k, v in labels.items()}
+    return None
+
+
+def walk_whisper(root, prefixes):
+    for prefix in prefixes:
+        base = os.path.join(root, prefix)
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith(".wsp"):
+                    rel = os.path.relpath(os.path.join(dirpath, name), base)
+                    yield f"{prefix}/{rel}"
+
+
+def load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_json(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def file_state(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def discover_jobs(args, manifest):
+    """Turn the manifest into jobs, skipping files unchanged since import.
+
+    --verify checks every mapped file, changed or not.
+    """
+    rules = load_rules(args.rules)
+    jobs, unchanged, unmapped = [], 0, 0
+    for key in sorted(manifest["files"]):
+        prefix, rel = key.split("/", 1)
+        mapped = map_series(rules, rel)
+        if mapped is None:
+            unmapped += 1
+            continue
+        path = f"{WHISPER_ROOT}/{key}"
+        try:
+            state = file_state(path)
+        except FileNotFoundError:
+            del manifest["files"][key]
+            continue
+        if manifest["files"][key] == state:
+            unchanged += 1
+            if not args.verify:
+                continue
+        metric, extra = mapped
+        jobs.append((key, path, metric, series_labels(ENVS[prefix], extra), state))
+    print(f"discovered {len(manifest['files'])} whisper files: "
+          f"{unchanged} unchanged, {unmapped} unmapped", file=sys.stderr)
+    return jobs
+
+
+def backfill_series(args, inflight, checkpoints, key, path, metric, labels):
+    """Backfill one whisper file, return (points, summary line, ok)."""
+    try:
+        wsp = WhisperFile(path)
+    except InvalidWhisperFile:
+        return 0, f"skip (no whisper): {key}", True
+    except FileNotFoundError:
+        return 0, f"skip (no file): {key}", True
+
+    since = checkpoints.get(key) if args.resume else None
+    now = int(time.time())
+    if not args.dry_run:
+        checkpoints.begin(key, since, now)
+    with wsp:
+        points = stream_series(
+            args, wsp, metric, labels, inflight, since,
+            lambda ts: checkpoints.set(key, ts), now,
+        )
+    after = "" if since is None else f" after {since}"
+    if not points:
+        return 0, f"{key}: 0 non-null points{after}", True
+    return points, f"{key}: {points} points{after} -> {metric}{{{format_labels(labels)}}}", True
+
+
+def verify_series(args, inflight, checkpoints, key, path, metric, labels):
+    """Compare one whisper file with VM, return (points, summary line, ok)."""
+    try:
+        wsp = WhisperFile(path)
+    except InvalidWhisperFile:
+        return 0, f"skip (no whisper): {key}", True
+    except FileNotFoundError:
+        return 0, f"skip (no file): {key}", True
+
+    # a series with no recorded runs is read as of now
+    runs = checkpoints.runs(key) or [(None, None)]
+    with wsp:
+        expected, first_ms, last_ms = whisper_digest(wsp, args.chunk_size, runs)
+    if not expected.count:
+        return 0, f"{key}: 0 non-null points", True
+    with inflight:
+        actual = vm_digest(args.vm, metric, labels, first_ms, last_ms)
+    if actual != expected:
+        return expected.count, f"MISMATCH {key}: whisper {expected}, vm {actual}", False
+    return expected.count, f"{key}: ok, {expected}", True
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--vm", default="http://127.0.0.1:8428")
     ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--chunk-size", type=int, default=50000,
+                    help="max points per gzip chunk of the streamed upload")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="series read and uploaded concurrently")
+    ap.add_argument("--max-inflight", type=int, default=None,
+                    help="cap on concurrent VM imports (default: --workers)")
+    ap.add_argument("--discover", action="store_true",
+                    help="copy every whisper file under the ENVS prefixes")
+    ap.add_argument("--rules", help="JSON path mapping rules for --discover")
+    ap.add_argument("--manifest", default="backfill-manifest.json",
+                    help="walk and import cache for --discover")
+    ap.add_argument("--rescan", action="store_true",
+                    help="walk WHISPER_ROOT even if the manifest exists")
+    ap.add_argument("--request-points", type=int, default=1000000,
+                    help="points per VM request, i.e. checkpoint granularity")
+    ap.add_argument("--state", default="backfill-state.json",
+                    help="per-series checkpoint file")
+    ap.add_argument("--resume", action="store_true",
+                    help="only import points after each series' checkpoint")
+    ap.add_argument("--format", choices=sorted(FORMATS), default="prometheus",
+                    help="VM import format: text lines or JSON columns")
+    ap.add_argument("--verify", action="store_true",
+                    help="compare VM exports with whisper instead of importing")
     args = ap.parse_args()
 
-    total_points = 0
-    for prefix, env in ENVS.items():
-        for rel, (metric, extra) in DB_GAUGE_PATHS.items():
-            path = f"{WHISPER_ROOT}/{prefix}/{rel}"
-            try:
-                data = fetch_whisper(path)
-            except subprocess.CalledProcessError:
-                print(f"skip (no whisper): {prefix}/{rel}", file=sys.stderr)
-                continue
-            except FileNotFoundError:
-                print(f"skip (no file): {prefix}/{rel}", file=sys.stderr)
-                continue
+    manifest = None
+    if args.discover:
+        manifest = load_json(args.manifest)
+        if manifest is None or args.rescan:
+            known = manifest["files"] if manifest else {}
+            manifest = {"files": {
+                key: known.get(key) for key in walk_whisper(WHISPER_ROOT, ENVS)
+            }}
+        jobs = discover_jobs(args, manifest)
+    else:
+        jobs = [
+            (f"{prefix}/{rel}", f"{WHISPER_ROOT}/{prefix}/{rel}", metric,
+             series_labels(env, extra), None)
+            for prefix, env in ENVS.items()
+            for rel, (metric, extra) in DB_GAUGE_PATHS.items()
+        ]
 
-            labels = {
-                "env": env,
-                "instance": "172.17.0.1:9092",
-                "job": "redirect-www",
-                **extra,
-            }
-            lines = list(render_lines(
-                metric, labels, data["start"], data["step"], data["values"],
-            ))
-            if not lines:
-                print(f"{prefix}/{rel}: 0 non-null points", file=sys.stderr)
-                continue
-
-            total_points += len(lines)
-            print(f"{prefix}/{rel}: {len(lines)} points -> {metric}{{{format_labels(labels)}}}", file=sys.stderr)
+    # --workers bounds concurrent whisper reads, --max-inflight bounds the
+    # imports VM sees; workers over the cap wait with their first batch
+    # already rendered.
+    inflight = threading.BoundedSemaphore(args.max_inflight or args.workers)
+    # --verify only reads the state, so its flush() below writes nothing
+    checkpoints = Checkpoints(args.state)
+    if args.verify:
+        run = partial(verify_series, args, inflight, checkpoints)
+    else:
+        run = partial(backfill_series, args, inflight, checkpoints)
 
-            if not args.dry_run:
-                body = "\n".join(lines) + "\n"
-                post_to_vm(args.vm, body)
+    total_points, mismatches = 0, 0
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = pool.map(lambda job: run(*job[:4]), jobs)
+            # map() yields in submission order, so the summary reads the
+            # same as a serial run.
+            try:
+                for (key, _, _, _, state), (points, summary, ok) in zip(jobs, results):
+                    total_points += points
+                    mismatches += not ok
+                    print(summary, file=sys.stderr)
+                    if manifest is not None and not args.dry_run and not args.verify:
+                        manifest["files"][key] = state
+            except BaseException:
+                # stop here; --resume picks up from the checkpoints
+                pool.shutdown(cancel_futures=True)
+                raise
+    finally:
+        checkpoints.flush()
+        if manifest is not None:
+            save_json(args.manifest, manifest)
 
     print(f"\nTotal points: {total_points}", file=sys.stderr)
-    if args.dry_run:
+    if args.verify:
+        print(f"Mismatched series: {mismatches}", file=sys.stderr)
+        if mismatches:
+            sys.exit(1)
+    elif args.dry_run:
         print("(dry-run, nothing written)", file=sys.stderr)
 
 
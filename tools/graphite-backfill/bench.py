@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for backfill.py, no UAT whisper tree needed.
+
+Writes a synthetic .wsp file (one archive, --points slots of --step seconds,
+--nulls of them empty) and pushes it through backfill's fetch -> render ->
+post pipeline against a local stand-in for VM's import endpoints, which
+gunzips and counts what it receives. Each stage is timed as a cumulative
+pass over the same file (fetch, fetch+render, fetch+render+post), in a fresh
+process so the reported peak RSS belongs to that run alone.
+
+Usage:
+  python3 bench.py [--points 1000000] [--step 60] [--nulls 0.1]
+                   [--values int|float] [--format prometheus|jsonl]
+                   [--chunk-size 50000] [--request-points 1000000]
+                   [--profile backfill.prof] [--json]
+"""
+
+import argparse
+import http.server
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import backfill
+
+METRIC = "redirect_db_users"
+LABELS = backfill.series_labels("prod", {"state": "all"})
+
+
+def write_whisper(path, points, step, nulls, values, now, seed=0):
+    """Write a single-archive .wsp whose newest slot is the current interval.
+
+    Slots are laid out oldest first from offset 0 of the ring; a null is a
+    slot with a zero interval, which whisper reads back as None.
+    """
+    rng = random.Random(seed)
+    offset = backfill.METADATA.size + backfill.ARCHIVE_INFO.size
+    base = now - now % step - (points - 1) * step
+    with open(path, "wb") as f:
+        f.write(backfill.METADATA.pack(1, points * step, 0.5, 1))
+        f.write(backfill.ARCHIVE_INFO.pack(offset, step, points))
+        block = bytearray(backfill.POINT.size * 65536)
+        for first in range(0, points, 65536):
+            n = min(65536, points - first)
+            for i in range(n):
+                slot = first + i
+                # slot 0 must be set: a zero base interval means "empty"
+                empty = slot and rng.random() < nulls
+                interval = 0 if empty else base + slot * step
+                value = float(rng.randint(0, 5000)) if values == "int" else rng.random() * 5000
+                backfill.POINT.pack_into(block, i * backfill.POINT.size, interval, value)
+            f.write(block[:n * backfill.POINT.size])
+
+
+class StandInVM(http.server.BaseHTTPRequestHandler):
+    """Accepts imports the way VM does and only counts the bytes."""
+
+    protocol_version = "HTTP/1.1"
+    wire_bytes = 0
+    raw_bytes = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        z = zlib.decompressobj(wbits=31) if self.headers.get("Content-Encoding") == "gzip" else None
+        wire = raw = 0
+        for data in self.read_body():
+            wire += len(data)
+            raw += len(z.decompress(data)) if z else len(data)
+        with self.lock:
+            StandInVM.wire_bytes += wire
+            StandInVM.raw_bytes += raw
+            StandInVM.requests += 1
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding") != "chunked":
+            yield self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            return
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if size == 0:
+                self.rfile.readline()
+                return
+            yield self.rfile.read(size)
+            self.rfile.readline()
+
+
+def run_case(args, path, vm_url, results):
+    """Child process: time each cumulative stage over the same file."""
+    opts = argparse.Namespace(
+        vm=vm_url, dry_run=False, format=args.format,
+        chunk_size=args.chunk_size, request_points=args.request_points,
+    )
+    render = backfill.FORMATS[args.format][0]
+    stages = {}
+    with backfill.WhisperFile(path) as wsp:
+        t = time.perf_counter()
+        for _, _, values in wsp.fetch_merged(backfill.FROM_EPOCH):
+            for _ in values:
+                pass
+        stages["fetch"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        points = 0
+        for start, step, values in wsp.fetch_merged(backfill.FROM_EPOCH):
+            for n, _, _ in render(METRIC, LABELS, start, step, values, args.chunk_size):
+                points += n
+        stages["render"] = time.perf_counter() - t - stages["fetch"]
+
+        profiler = None
+        if args.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        t = time.perf_counter()
+        backfill.stream_series(
+            opts, wsp, METRIC, LABELS, threading.Semaphore(), None, lambda ts: None,
+        )
+        total = time.perf_counter() - t
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        stages["post"] = total - stages["fetch"] - stages["render"]
+
+    results.put({
+        "points": points,
+        "stages": stages,
+        "total": total,
+        "points_per_sec": points / total if total else 0.0,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "numpy": backfill.np is not None,
+    })
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--points", type=int, default=1000000,
+                    help="slots in the synthetic archive")
+    ap.add_argument("--step", type=int, default=60, help="seconds per slot")
+    ap.add_argument("--nulls", type=float, default=0.1,
+                    help="fraction of empty slots")
+    ap.add_argument("--values", choices=["int", "float"], default="int")
+    ap.add_argument("--format", choices=sorted(backfill.FORMATS), default="prometheus")
+    ap.add_argument("--chunk-size", type=int, default=50000)
+    ap.add_argument("--request-points", type=int, default=1000000)
+    ap.add_argument("--profile", help="write a cProfile dump of the full pass here")
+    ap.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = ap.parse_args()
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInVM)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    vm_url = f"http://127.0.0.1:{server.server_port}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.wsp")
+        write_whisper(path, args.points, args.step, args.nulls, args.values, int(time.time()))
+
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        child = ctx.Process(target=run_case, args=(args, path, vm_url, results))
+        child.start()
+        result = results.get()
+        child.join()
+    server.shutdown()
+
+    result.update({
+        "requests": StandInVM.requests,
+        "wire_bytes": StandInVM.wire_bytes,
+        "raw_bytes": StandInVM.raw_bytes,
+        "args": vars(args),
+    })
+    if args.json:
+        json.dump(result, sys.stdout, indent=1)
+        print()
+        return
+
+    print(f"{result['points']} points, {args.format}, numpy={'yes' if result['numpy'] else 'no'}")
+    for stage, seconds in result["stages"].items():
+        print(f"  {stage:<8}{seconds:8.3f}s")
+    print(f"  {'total':<8}{result['total']:8.3f}s  {result['points_per_sec']:,.0f} points/s")
+    print(f"  peak RSS {result['peak_rss_mb']:.1f} MB")
+    print(f"  {result['requests']} requests, {result['wire_bytes']:,} bytes on the wire, "
+          f"{result['raw_bytes']:,} uncompressed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+--verify against a multi-archive whisper file read at a later time than the
+import: run with `python3 -m pytest tools/graphite-backfill`.
+"""
+
+import argparse
+
+import pytest
+
+import backfill
+
+METRIC = "redirect_db_users"
+LABELS = backfill.series_labels("prod", {"state": "all"})
+KEY = "prod/db/users/all.wsp"
+T = 1700000000 - 1700000000 % 600
+ARCHIVES = [(60, 100), (600, 100)]  # finest first, as whisper lays them out
+
+
+def write_whisper(path, now):
+    """Write every slot of every archive, up to the interval holding now.
+
+    Values differ per archive, so a point read from the wrong one changes
+    the checksum as well as the count.
+    """
+    offset = backfill.METADATA.size + len(ARCHIVES) * backfill.ARCHIVE_INFO.size
+    header, body = [], []
+    for i, (step, points) in enumerate(ARCHIVES):
+        header.append(backfill.ARCHIVE_INFO.pack(offset, step, points))
+        base = now - now % step - (points - 1) * step
+        for slot in range(points):
+            ts = base + slot * step
+            body.append(backfill.POINT.pack(ts, ts // step + i * 0.5))
+        offset += points * backfill.POINT.size
+    retention = ARCHIVES[-1][0] * ARCHIVES[-1][1]
+    with open(path, "wb") as f:
+        f.write(backfill.METADATA.pack(1, retention, 0.5, len(ARCHIVES)))
+        f.write(b"".join(header + body))
+
+
+class StandInVM:
+    """Collects what post_to_vm would have sent, failing post number fail_at."""
+
+    def __init__(self, fail_at=None):
+        self.digest = backfill.Digest()
+        self.posts = 0
+        self.fail_at = fail_at
+
+    def post(self, vm_url, texts, path):
+        self.posts += 1
+        if self.posts == self.fail_at:
+            raise RuntimeError("VM import failed: 503")
+        for text in texts:
+            for line in text.splitlines():
+                _, value, ts_ms = line.rsplit(" ", 2)
+                self.digest.add(int(ts_ms), float(value))
+
+
+@pytest.fixture
+def wsp_path(tmp_path):
+    path = tmp_path / "all.wsp"
+    write_whisper(path, T)
+    return str(path)
+
+
+def options(tmp_path, resume=False):
+    return argparse.Namespace(
+        vm="http://vm", dry_run=False, format="prometheus", chunk_size=7,
+        request_points=40, resume=resume, state=str(tmp_path / "state.json"),
+    )
+
+
+def backfill_at(monkeypatch, now, args, vm):
+    monkeypatch.setattr(backfill.time, "time", lambda: now)
+    monkeypatch.setattr(backfill, "post_to_vm", vm.post)
+    checkpoints = backfill.Checkpoints(args.state)
+    try:
+        backfill.backfill_series(
+            args, backfill.threading.Semaphore(), checkpoints, KEY, args.wsp,
+            METRIC, LABELS)
+    finally:
+        checkpoints.flush()
+
+
+def verify_at(monkeypatch, now, args, vm):
+    monkeypatch.setattr(backfill.time, "time", lambda: now)
+    monkeypatch.setattr(
+        backfill, "vm_digest", lambda vm_url, metric, labels, first_ms, last_ms: vm.digest)
+    return backfill.verify_series(
+        args, backfill.threading.Semaphore(), backfill.Checkpoints(args.state),
+        KEY, args.wsp, METRIC, LABELS)
+
+
+def test_verify_later_uses_import_time(tmp_path, monkeypatch, wsp_path):
+    args, vm = options(tmp_path), StandInVM()
+    args.wsp = wsp_path
+    backfill_at(monkeypatch, T, args, vm)
+
+    points, summary, ok = verify_at(monkeypatch, T + 1800, args, vm)
+    assert ok, summary
+    assert points == vm.digest.count
+
+    # read as of the verify time the fine archive hands over later
+    with backfill.WhisperFile(wsp_path) as wsp:
+        today, _, _ = backfill.whisper_digest(wsp, args.chunk_size)
+    assert today != vm.digest
+
+
+def test_verify_after_resume(tmp_path, monkeypatch, wsp_path):
+    args, vm = options(tmp_path), StandInVM(fail_at=3)
+    args.wsp = wsp_path
+    with pytest.raises(RuntimeError):
+        backfill_at(monkeypatch, T, args, vm)
+
+    args.resume, vm.fail_at = True, None
+    backfill_at(monkeypatch, T + 900, args, vm)
+
+    points, summary, ok = verify_at(monkeypatch, T + 1800, args, vm)
+    assert ok, summary
+    assert points == vm.digest.count
+
+
+def test_verify_reports_unexpected_points(tmp_path, monkeypatch, wsp_path):
+    args, vm = options(tmp_path), StandInVM()
+    args.wsp = wsp_path
+    backfill_at(monkeypatch, T, args, vm)
+    vm.digest.add(T * 1000, 1.0)
+
+    _, summary, ok = verify_at(monkeypatch, T + 1800, args, vm)
+    assert not ok
+    assert summary.startswith("MISMATCH")